@@ -0,0 +1,137 @@
+"""
+Vectorized analytics of many texts at once.
+
+The tokens of all the texts are mapped to integer IDs in one shared
+vocabulary. Each chunk of a text is tallied once, and only its distinct
+tokens are looked up. The counts of a text are then summed with
+`numpy.bincount` over token ID arrays, and the rates of every text are
+computed with array operations instead of one Python dict per text.
+"""
+
+from collections import Counter
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+from analytics.tokenizer import Tokenizer
+
+
+class Vocabulary:
+    """
+    Mapping of tokens to consecutive integer IDs, shared by the texts of a
+    batch.
+    """
+
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+        self.tokens: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def encode(self, tokens: Iterable[str]) -> np.ndarray:
+        """
+        Get the IDs of distinct tokens, adding the unknown ones.
+
+        :param tokens: The distinct tokens.
+        :return: The ID of each token, in the same order.
+        """
+        tokens = list(tokens)
+        new = set(tokens).difference(self.ids)
+        self.ids.update(zip(new, range(len(self.tokens), len(self.tokens) + len(new))))
+        self.tokens.extend(new)
+        return np.fromiter(
+            map(self.ids.__getitem__, tokens), dtype=np.int64, count=len(tokens)
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class TokenCounts:
+    """
+    The tokens of a text and their number of occurrences.
+    """
+
+    token_ids: np.ndarray
+    counts: np.ndarray
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+
+def count_tokens(
+    tokenizer: Tokenizer,
+    vocabulary: Vocabulary,
+    text: str,
+    stopword_ids: np.ndarray | None = None,
+    check: Callable[[], None] | None = None,
+) -> TokenCounts:
+    """
+    Count the tokens of a text against a shared vocabulary.
+
+    :param tokenizer: The tokenizer splitting the text.
+    :param vocabulary: The vocabulary, extended with the new tokens.
+    :param text: The text.
+    :param stopword_ids: The IDs of the tokens left out, if any.
+    :param check: A function called before each chunk, which may raise to
+        abort the counting.
+    :return: The IDs of the tokens found in the text, ascending, and their
+        counts.
+    """
+    token_ids, counts = [], []
+    for chunk in tokenizer.chunks(text):
+        if check is not None:
+            check()
+        tally = Counter(tokenizer.split(tokenizer.normalize(chunk)))
+        token_ids.append(vocabulary.encode(tally.keys()))
+        counts.append(np.fromiter(tally.values(), dtype=np.int64, count=len(tally)))
+
+    if not token_ids:
+        return TokenCounts(np.empty(0, np.int64), np.empty(0, np.int64))
+
+    totals = np.bincount(
+        np.concatenate(token_ids),
+        weights=np.concatenate(counts),
+        minlength=len(vocabulary),
+    ).astype(np.int64)
+    if stopword_ids is not None:
+        totals[stopword_ids] = 0
+    found = np.flatnonzero(totals)
+    return TokenCounts(found, totals[found])
+
+
+def calculate_batch(
+    tokenizer: Tokenizer, texts: Sequence[str], check: Callable[[], None] | None = None
+) -> list[dict]:
+    """
+    Calculate the analytics of many texts.
+
+    :param tokenizer: The tokenizer splitting the texts.
+    :param texts: The texts.
+    :param check: A function called before each chunk, which may raise to
+        abort the calculation.
+    :return: The analytics of each text, in order, as computed by
+        `calculate_analytics` for a single text.
+    """
+    vocabulary = Vocabulary()
+    stopword_ids = vocabulary.encode(tokenizer.stopwords)
+    counts = [
+        count_tokens(tokenizer, vocabulary, text, stopword_ids, check) for text in texts
+    ]
+
+    tokens = np.array(vocabulary.tokens, dtype=object)
+    results = []
+    for text_counts in counts:
+        total = text_counts.total
+        rates = text_counts.counts / total if total else text_counts.counts
+        words = tokens[text_counts.token_ids].tolist()
+        results.append(
+            {
+                "word_count": total,
+                "words_rates": dict(zip(words, rates.tolist())),
+                "unique_words": len(text_counts.token_ids),
+                "word_counts": dict(zip(words, text_counts.counts.tolist())),
+            }
+        )
+    return results
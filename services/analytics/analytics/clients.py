@@ -0,0 +1,135 @@
+from httpx import AsyncClient, AsyncHTTPTransport, Limits
+from loguru import logger
+
+from analytics.config import Config
+from analytics.metrics import MeteredTransport
+from analytics.tracing import TracingTransport
+
+
+def create_client(
+    base_url: str,
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+    http2: bool,
+    timeout: float,
+    headers: dict[str, str] | None = None,
+    name: str = "upstream",
+) -> AsyncClient:
+    """
+    Create a pooled HTTP client for an upstream service.
+
+    :param base_url: The base URL of the upstream service.
+    :param max_connections: The maximum number of concurrent connections.
+    :param max_keepalive_connections: The maximum number of idle connections
+        kept open.
+    :param keepalive_expiry: The number of seconds an idle connection is kept.
+    :param http2: Whether to use HTTP/2, requires the http2 extra.
+    :param timeout: The timeout of each request, in seconds.
+    :param headers: The headers sent with every request, if any.
+    :param name: The name of the upstream service, used in metrics and traces.
+    :return: The client, to be closed with `aclose`.
+    """
+    transport = AsyncHTTPTransport(
+        limits=Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        http2=http2,
+    )
+    return AsyncClient(
+        base_url=base_url,
+        transport=TracingTransport(MeteredTransport(transport, name), name),
+        timeout=timeout,
+        headers=headers,
+    )
+
+
+def pool_stats(client: AsyncClient) -> dict[str, int]:
+    """
+    Get the connection pool usage of a client.
+
+    httpx does not expose its pool, so this reads the httpcore pool of the
+    HTTP transport and reports nothing for other transports.
+
+    :param client: The client.
+    :return: The number of open, idle and busy connections and of in-flight
+        and queued requests.
+    """
+    transport = getattr(client, "_transport", None)
+    # Unwrap the tracing and metrics layers
+    while hasattr(transport, "transport"):
+        transport = transport.transport
+    pool = getattr(transport, "_pool", None)
+    if pool is None:
+        return {}
+
+    connections = list(pool.connections)
+    idle = sum(1 for connection in connections if connection.is_idle())
+    requests = list(getattr(pool, "_requests", ()))
+    return {
+        "connections": len(connections),
+        "idle_connections": idle,
+        "busy_connections": len(connections) - idle,
+        "requests": len(requests),
+        "queued_requests": sum(1 for request in requests if request.is_queued()),
+        "max_connections": pool._max_connections,
+        "max_keepalive_connections": pool._max_keepalive_connections,
+    }
+
+
+class UpstreamClients:
+    """
+    The HTTP clients of the upstream services, shared by all requests.
+
+    Clients are created once in the application lifespan, so connections to
+    the upstream services are kept alive and reused across requests.
+    """
+
+    def __init__(self, config: type[Config] = Config) -> None:
+        """
+        Create the clients of all upstream services.
+
+        :param config: The configuration object.
+        """
+        self.storage = create_client(
+            base_url=config.Storage.API_URL,
+            max_connections=config.Storage.MAX_CONNECTIONS,
+            max_keepalive_connections=config.Storage.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.Storage.KEEPALIVE_EXPIRY,
+            http2=config.Storage.HTTP2,
+            timeout=config.Storage.TIMEOUT,
+            name="storage",
+        )
+        self.wordcloud = create_client(
+            base_url=config.WordCloudApi.API_URL,
+            max_connections=config.WordCloudApi.MAX_CONNECTIONS,
+            max_keepalive_connections=config.WordCloudApi.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.WordCloudApi.KEEPALIVE_EXPIRY,
+            http2=config.WordCloudApi.HTTP2,
+            timeout=config.WordCloudApi.TIMEOUT,
+            headers={
+                "Authorization": f"Bearer {config.WordCloudApi.WORDCLOUD_API_KEY}"
+            },
+            name="wordcloud",
+        )
+
+    async def aclose(self) -> None:
+        """
+        Close all clients and their connections.
+        """
+        logger.info("Closing upstream clients.")
+        await self.storage.aclose()
+        await self.wordcloud.aclose()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Get the connection pool usage of all clients.
+
+        :return: The pool usage of each upstream service.
+        """
+        return {
+            "storage": pool_stats(self.storage),
+            "wordcloud": pool_stats(self.wordcloud),
+        }
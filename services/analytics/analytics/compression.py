@@ -0,0 +1,252 @@
+"""
+Compression of the response bodies, negotiated with Accept-Encoding.
+
+Bodies are compressed as they are streamed, chunk by chunk, so a large
+analytics result is never held in memory in both forms. Responses which
+already carry a Content-Encoding are passed through untouched.
+"""
+
+import asyncio
+import zlib
+from collections.abc import Callable
+from typing import Protocol
+
+from loguru import logger
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from analytics.config import Config
+
+
+# Chunks at least this large are compressed in a worker thread, all the
+# compressors release the GIL while doing so
+THREAD_THRESHOLD = 64 * 1024
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int) -> None:
+        import brotli  # lazy import, optional dependency
+
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def _gzip() -> Compressor:
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _brotli() -> Compressor:
+    # Quality 4 compresses better than gzip at a similar speed
+    return _BrotliCompressor(quality=4)
+
+
+def _zstd() -> Compressor:
+    import zstandard  # lazy import, optional dependency
+
+    return zstandard.ZstdCompressor(level=3).compressobj()
+
+
+COMPRESSORS: dict[str, Callable[[], Compressor]] = {
+    "gzip": _gzip,
+    "br": _brotli,
+    "zstd": _zstd,
+}
+
+
+def available_encodings(names: tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Select the content codings which can be produced.
+
+    :param names: The content codings, by order of preference.
+    :return: The known codings whose library is installed, in the same order.
+    """
+    encodings = []
+    for name in names:
+        if name not in COMPRESSORS:
+            logger.warning(f"Unknown content coding {name!r}, ignored.")
+            continue
+        try:
+            COMPRESSORS[name]().flush()
+        except ImportError:
+            logger.warning(f"Content coding {name!r} requires the compression extra.")
+            continue
+        encodings.append(name)
+    return tuple(encodings)
+
+
+def negotiate(accept_encoding: str, encodings: tuple[str, ...]) -> str | None:
+    """
+    Choose the content coding of a response.
+
+    :param accept_encoding: The Accept-Encoding header of the request.
+    :param encodings: The available codings, by order of preference.
+    :return: The accepted coding with the highest weight, ties broken by
+        preference, or None if the body is to be sent unencoded.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, *params = item.strip().lower().split(";")
+        weight = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with the content coding
+    negotiated from the Accept-Encoding request header.
+
+    Only complete (200) responses of compressible media types are compressed,
+    and only if they are at least `minimum_size` bytes long. Partial,
+    bodiless and already encoded responses are passed through.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        encodings: tuple[str, ...] = Config.Compression.ENCODINGS,
+        minimum_size: int = Config.Compression.MINIMUM_SIZE,
+        media_types: tuple[str, ...] = Config.Compression.MEDIA_TYPES,
+    ) -> None:
+        """
+        :param app: The wrapped application.
+        :param encodings: The content codings offered, by order of preference.
+        :param minimum_size: The size under which bodies are sent unencoded.
+        :param media_types: The compressible media types, or prefixes of them
+            such as "text/".
+        """
+        self.app = app
+        self.encodings = available_encodings(encodings)
+        self.minimum_size = minimum_size
+        self.media_types = media_types
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate(accept_encoding, self.encodings)
+        await self.app(scope, receive, _CompressingSend(self, encoding, send))
+
+    def compressible(self, headers: Headers) -> bool:
+        """
+        Check whether a response body may be compressed.
+
+        :param headers: The response headers.
+        """
+        if "content-encoding" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return False
+        media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return bool(media_type) and media_type.startswith(self.media_types)
+
+
+class _CompressingSend:
+    """
+    The send channel of one response, compressing its body if negotiated.
+    """
+
+    def __init__(
+        self, middleware: CompressionMiddleware, encoding: str | None, send: Send
+    ) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Message | None = None
+        self.compressor: Compressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if message["status"] != 200 or not self.middleware.compressible(headers):
+                self.passthrough = True
+                await self.send(message)
+                return
+
+            # The body depends on Accept-Encoding, whether it is encoded or not
+            if "accept-encoding" not in headers.get("vary", "").lower():
+                MutableHeaders(raw=message["headers"]).add_vary_header(
+                    "Accept-Encoding"
+                )
+            content_length = headers.get("content-length")
+            if self.encoding is None or (
+                content_length is not None
+                and int(content_length) < self.middleware.minimum_size
+            ):
+                self.passthrough = True
+                await self.send(message)
+                return
+
+            # Wait for the first chunk, bodies of unknown length may be small
+            self.start = message
+            return
+
+        if message["type"] != "http.response.body":
+            # E.g. a file sent by the server itself, which cannot be encoded
+            self.passthrough = True
+            if self.start is not None:
+                await self.send(self.start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+
+            headers = MutableHeaders(raw=self.start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            del headers["Content-Length"]
+            if (etag := headers.get("etag")) and not etag.startswith("W/"):
+                # The encoded body is another representation of the resource
+                headers["ETag"] = f"W/{etag}"
+            self.compressor = COMPRESSORS[self.encoding]()
+            await self.send(self.start)
+
+        data = await self._compress(body)
+        if not more_body:
+            data += self.compressor.flush()
+        if data or not more_body:
+            await self.send(
+                {"type": "http.response.body", "body": data, "more_body": more_body}
+            )
+
+    async def _compress(self, body: bytes) -> bytes:
+        if len(body) >= THREAD_THRESHOLD:
+            return await asyncio.to_thread(self.compressor.compress, body)
+        return self.compressor.compress(body)
@@ -1,4 +1,4 @@
-from os import getenv
+from os import cpu_count, getenv
 from typing import Literal
 
 from loguru import logger
@@ -20,9 +20,96 @@ class Config:
         API_URL: str = getenv("WORDCLOUD_API_URL", "https://wordcloud.example.com/api")
         WORDCLOUD_API_KEY: str = getenv("WORDCLOUD_API_KEY", "your_api_key_here")
         TIMEOUT: int = int(getenv("WORDCLOUD_TIMEOUT", "10"))
+        MAX_CONNECTIONS = int(getenv("WORDCLOUD_MAX_CONNECTIONS", 20))
+        MAX_KEEPALIVE_CONNECTIONS = int(
+            getenv("WORDCLOUD_MAX_KEEPALIVE_CONNECTIONS", 10)
+        )
+        KEEPALIVE_EXPIRY = float(getenv("WORDCLOUD_KEEPALIVE_EXPIRY", 30))
+        HTTP2 = getenv("WORDCLOUD_HTTP2", "false").lower() == "true"
 
     class Storage:
         API_URL: str = getenv("STORAGE_API_URL", "http://localhost:8001")
+        TIMEOUT = float(getenv("STORAGE_TIMEOUT", 5))
+        MAX_CONNECTIONS = int(getenv("STORAGE_MAX_CONNECTIONS", 100))
+        MAX_KEEPALIVE_CONNECTIONS = int(getenv("STORAGE_MAX_KEEPALIVE_CONNECTIONS", 20))
+        KEEPALIVE_EXPIRY = float(getenv("STORAGE_KEEPALIVE_EXPIRY", 30))
+        HTTP2 = getenv("STORAGE_HTTP2", "false").lower() == "true"
 
     class Filesystem:
         BASE_PATH: str = getenv("FILESYSTEM_BASE_PATH", "./.cache/analytics")
+
+    class Batch:
+        # Files of a batch fetched from storage and sent to the word cloud API
+        # at once
+        CONCURRENCY = int(getenv("BATCH_CONCURRENCY", 8))
+
+    class Executor:
+        # Worker processes analyzing the large texts, 0 analyzes them in a
+        # thread of the service process instead
+        WORKERS = int(getenv("EXECUTOR_WORKERS", cpu_count() or 1))
+        # Texts shorter than this, in characters, are analyzed in the event loop
+        INLINE_MAX_CHARS = int(getenv("EXECUTOR_INLINE_MAX_CHARS", 64 * 1024))
+        # Seconds an analysis may take before it is aborted
+        TIMEOUT = float(getenv("EXECUTOR_TIMEOUT", 300))
+
+    class Jobs:
+        # Run the queued analytics jobs in the service process, otherwise only
+        # `python -m analytics.worker` processes run them
+        RUN_IN_SERVICE = getenv("JOBS_RUN_IN_SERVICE", "true").lower() == "true"
+        # Jobs run at once by each process
+        CONCURRENCY = int(getenv("JOBS_CONCURRENCY", 4))
+        # Seconds between polls of the queue while it is empty
+        POLL_INTERVAL = float(getenv("JOBS_POLL_INTERVAL", 1))
+        # Attempts of a job before it fails for good
+        MAX_ATTEMPTS = int(getenv("JOBS_MAX_ATTEMPTS", 3))
+        # Seconds before the first retry of a job, doubled at each attempt
+        RETRY_DELAY = float(getenv("JOBS_RETRY_DELAY", 5))
+        # Seconds a job is leased to its worker, after which it is claimed
+        # again. Must exceed the time of a job, EXECUTOR_TIMEOUT included
+        LEASE = float(getenv("JOBS_LEASE", 600))
+
+    class Tokenizer:
+        # Unicode normalization form of the analyzed texts, empty keeps them as is
+        NORMALIZATION = getenv("TOKENIZER_NORMALIZATION", "NFKC").upper()
+        CASE_FOLD = getenv("TOKENIZER_CASE_FOLD", "true").lower() == "true"
+        # Count words without their punctuation, otherwise whitespace separated runs
+        STRIP_PUNCTUATION = (
+            getenv("TOKENIZER_STRIP_PUNCTUATION", "true").lower() == "true"
+        )
+        # Words left out of the analytics, comma separated and/or one per line
+        # in STOPWORDS_FILE
+        STOPWORDS = tuple(
+            word.strip()
+            for word in getenv("TOKENIZER_STOPWORDS", "").split(",")
+            if word.strip()
+        )
+        STOPWORDS_FILE = getenv("TOKENIZER_STOPWORDS_FILE", "")
+
+    class Compression:
+        # Content codings offered by order of preference, "br" and "zstd"
+        # require the compression extra and are skipped without it
+        ENCODINGS = tuple(
+            name.strip().lower()
+            for name in getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+            if name.strip()
+        )
+        # Smaller bodies are sent unencoded, compressing them is not worth it
+        MINIMUM_SIZE = int(getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+        # Compressible media types, or prefixes of them
+        MEDIA_TYPES = tuple(
+            media_type.strip().lower()
+            for media_type in getenv(
+                "COMPRESSION_MEDIA_TYPES", "application/json,text/"
+            ).split(",")
+            if media_type.strip()
+        )
+
+    class Tracing:
+        # Span exporter, "none", "jsonl" (spans appended to FILE) or "otlp"
+        # (requires the otlp extra). Trace contexts are propagated in any case
+        EXPORTER = getenv("TRACING_EXPORTER", "none").lower()
+        FILE = getenv("TRACING_FILE", "traces/analytics.jsonl")
+        # OTLP/HTTP traces endpoint, empty uses OTEL_EXPORTER_OTLP_ENDPOINT
+        OTLP_ENDPOINT = getenv("TRACING_OTLP_ENDPOINT", "")
+        # Fraction of the new traces recorded, sampled requests keep their decision
+        SAMPLE_RATIO = float(getenv("TRACING_SAMPLE_RATIO", 1))
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from urllib.parse import unquote
 
 from httpx import AsyncClient
 
@@ -11,6 +12,14 @@ class FileData:
     file_content: bytes
 
 
+def _file_name(content_disposition: str) -> str:
+    # Storage sends RFC 5987 names, e.g. attachment; filename*=utf-8''a%20b.txt
+    if "filename*=" in content_disposition:
+        value = content_disposition.split("filename*=")[-1].split(";")[0]
+        return unquote(value.split("''", 1)[-1])
+    return content_disposition.split("filename=")[-1].strip('"')
+
+
 class StorageConnector:
     def __init__(self, storage_client: AsyncClient):
         self.client = storage_client
@@ -22,21 +31,16 @@ class StorageConnector:
         :param file_id: The ID of the file to download.
         :return: An instance of FileData containing file details.
         """
-        async with self.client as client:
-            response = await client.get(f"/files/{file_id}")
-            response.raise_for_status()
-
-            file_name = (
-                response.headers.get("Content-Disposition")
-                .split("filename=")[-1]
-                .strip('"')
-            )
-            file_size = int(response.headers.get("Content-Length", 0))
-            file_type = response.headers.get("Content-Type", "application/octet-stream")
-
-            return FileData(
-                file_name=file_name,
-                file_size=file_size,
-                file_type=file_type,
-                file_content=response.content,
-            )
+        response = await self.client.get(f"/files/{file_id}")
+        response.raise_for_status()
+
+        # Content-Length is the encoded size when storage sends it compressed
+        file_size = len(response.content)
+        file_type = response.headers.get("Content-Type", "application/octet-stream")
+
+        return FileData(
+            file_name=_file_name(response.headers.get("Content-Disposition", "")),
+            file_size=file_size,
+            file_type=file_type,
+            file_content=response.content,
+        )
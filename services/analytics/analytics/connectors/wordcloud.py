@@ -12,7 +12,6 @@ class WordCloudConnector:
         :param file_id: The ID of the text file to process.
         :return: The generated word cloud image as bytes.
         """
-        async with self.client as client:
-            response = await client.post("/wordcloud", json={"text": text})
-            response.raise_for_status()
-            return response.content
+        response = await self.client.post("/wordcloud", json={"text": text})
+        response.raise_for_status()
+        return response.content
@@ -0,0 +1,369 @@
+"""
+Analytics of many files, merged from the stored word counts.
+
+The raw counts of each file are stored along with its rates, so the counts of
+any set of files are summed by the database, without fetching or tokenizing
+the files again. The counts of all the files are also maintained in the
+corpus tables, updated in the transaction storing the result of each file,
+so the statistics of the whole corpus are read without merging anything.
+
+Files analyzed before their counts were stored get them derived from their
+rates, which are exact ratios of the counts. The corpus tables are built from
+all the completed results when the service first starts with them, and
+`rebuild` derives the missing counts and recomputes them at any time.
+
+Usage::
+
+    python -m analytics.corpus rebuild
+"""
+
+import argparse
+import asyncio
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from loguru import logger
+from sqlalchemy import (
+    BigInteger,
+    Float,
+    Select,
+    cast,
+    delete,
+    func,
+    literal_column,
+    select,
+    text,
+    true,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from analytics.databases.analytics import AnalyticsResult, JobStatus
+from analytics.databases.base import Session, create_tables, engine
+from analytics.databases.corpus import CorpusTotals, CorpusWord
+
+
+# The single corpus of the service, all the analyzed files
+CORPUS = "all"
+
+
+@dataclass(frozen=True, slots=True)
+class WordCounts:
+    """
+    Merged word counts of a set of files.
+    """
+
+    files: int
+    word_count: int
+    unique_words: int
+    # The counts of the most frequent words, most frequent first
+    counts: dict[str, int]
+
+
+def split_counts(analytics: dict) -> tuple[dict, dict[str, int]]:
+    """
+    Separate the raw word counts from the analytics of a file.
+
+    :param analytics: The analytics, as calculated.
+    :return: The analytics to store as the result, and the word counts.
+    """
+    result = dict(analytics)
+    return result, result.pop("word_counts")
+
+
+async def backfill_counts(
+    session: AsyncSession, file_ids: Sequence[int] | None = None
+) -> None:
+    """
+    Derive the word counts of the completed results stored without them.
+
+    :param session: The session, in a transaction.
+    :param file_ids: The IDs of the files, all of them by default.
+    """
+    legacy = select(
+        AnalyticsResult.id,
+        AnalyticsResult.result["words_rates"].label("rates"),
+        cast(AnalyticsResult.result["word_count"].astext, Float).label("total"),
+    ).where(
+        AnalyticsResult.status == JobStatus.COMPLETED,
+        AnalyticsResult.word_counts.is_(None),
+    )
+    if file_ids is not None:
+        legacy = legacy.where(AnalyticsResult.file_id.in_(file_ids))
+    # The fence keeps the rates and total extracted once per row, rather than
+    # the whole result decompressed again for every word
+    legacy = legacy.offset(0).subquery()
+
+    rates = func.jsonb_each_text(legacy.c.rates).table_valued("key", "value")
+    count = cast(func.round(cast(rates.c.value, Float) * legacy.c.total), BigInteger)
+    derived = (
+        select(
+            legacy.c.id,
+            func.coalesce(
+                func.jsonb_object_agg(rates.c.key, count).filter(
+                    rates.c.key.is_not(None)
+                ),
+                func.jsonb_build_object(),
+            ).label("counts"),
+        )
+        .select_from(legacy)
+        .outerjoin(rates, true())
+        .group_by(legacy.c.id)
+        .subquery()
+    )
+    await session.execute(
+        update(AnalyticsResult)
+        .where(AnalyticsResult.id == derived.c.id)
+        .values(word_counts=derived.c.counts)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def add_to_corpus(
+    session: AsyncSession, result_ids: Sequence[int] | Select
+) -> None:
+    """
+    Add the counts of newly completed results to the corpus.
+
+    Each result must be added once, in the transaction completing it. Until
+    the corpus is built nothing is added, building it adds all the results.
+
+    :param session: The session, in a transaction.
+    :param result_ids: The IDs of the analytics results, or a query of them.
+    """
+    # Waits for a build in progress, and holds off the next one until this
+    # transaction ends, so each result is added exactly once
+    await _lock_corpus(session, "ROW EXCLUSIVE")
+    if not await _is_built(session):
+        return
+
+    entries = func.jsonb_each_text(AnalyticsResult.word_counts).table_valued(
+        "key", "value"
+    )
+    files, word_count = (
+        await session.execute(
+            select(
+                func.count(AnalyticsResult.id.distinct()),
+                func.coalesce(func.sum(cast(entries.c.value, BigInteger)), 0),
+            )
+            .select_from(AnalyticsResult)
+            .outerjoin(entries, true())
+            .where(
+                AnalyticsResult.id.in_(result_ids),
+                AnalyticsResult.word_counts.is_not(None),
+            )
+        )
+    ).one()
+    if not files:
+        return
+
+    counts = (
+        select(entries.c.key, func.sum(cast(entries.c.value, BigInteger)), func.count())
+        .select_from(AnalyticsResult)
+        .join(entries, true())
+        .where(AnalyticsResult.id.in_(result_ids))
+        .group_by(entries.c.key)
+        # Rows are locked in the same order by every transaction, so
+        # concurrent ones wait for each other instead of deadlocking
+        .order_by(entries.c.key)
+    )
+    merge = insert(CorpusWord).from_select(["word", "count", "files"], counts)
+    merge = merge.on_conflict_do_update(
+        index_elements=[CorpusWord.word],
+        set_={
+            "count": CorpusWord.count + merge.excluded.count,
+            "files": CorpusWord.files + merge.excluded.files,
+            "updated_at": func.now(),
+        },
+    ).returning(
+        # Whether the word was inserted rather than updated
+        literal_column("xmax = 0")
+    )
+    new_words = sum(inserted for (inserted,) in await session.execute(merge))
+
+    await session.execute(
+        update(CorpusTotals)
+        .where(CorpusTotals.name == CORPUS)
+        .values(
+            files=CorpusTotals.files + files,
+            word_count=CorpusTotals.word_count + word_count,
+            unique_words=CorpusTotals.unique_words + new_words,
+            updated_at=func.now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def merge_counts(
+    file_ids: Sequence[int], limit: int | None = None
+) -> tuple[list[int], WordCounts]:
+    """
+    Merge the word counts of a set of files.
+
+    :param file_ids: The IDs of the files.
+    :param limit: The number of most frequent words returned, all of them by
+        default.
+    :return: The IDs of the files with a completed result, and their merged
+        counts.
+    """
+    async with Session.begin() as session:
+        await backfill_counts(session, file_ids)
+        found = list(
+            await session.scalars(
+                select(AnalyticsResult.file_id).where(
+                    AnalyticsResult.file_id.in_(file_ids),
+                    AnalyticsResult.status == JobStatus.COMPLETED,
+                )
+            )
+        )
+
+        entries = func.jsonb_each_text(AnalyticsResult.word_counts).table_valued(
+            "key", "value"
+        )
+        count = func.sum(cast(entries.c.value, BigInteger))
+        query = (
+            select(
+                entries.c.key,
+                count,
+                # Totals over all the words, before the limit
+                func.sum(count).over(),
+                func.count().over(),
+            )
+            .select_from(AnalyticsResult)
+            .join(entries, true())
+            .where(
+                AnalyticsResult.file_id.in_(file_ids),
+                AnalyticsResult.status == JobStatus.COMPLETED,
+            )
+            .group_by(entries.c.key)
+            .order_by(count.desc(), entries.c.key)
+            .limit(limit)
+        )
+        rows = (await session.execute(query)).all()
+
+    word_count, unique_words = (int(rows[0][2]), rows[0][3]) if rows else (0, 0)
+    return found, WordCounts(
+        files=len(found),
+        word_count=word_count,
+        unique_words=unique_words,
+        counts={word: int(count) for word, count, _, _ in rows},
+    )
+
+
+async def corpus_counts(limit: int | None = None) -> WordCounts:
+    """
+    Get the word counts of all the analyzed files, from the corpus tables.
+
+    :param limit: The number of most frequent words returned, all of them by
+        default.
+    :return: The counts of the corpus.
+    """
+    async with Session() as session:
+        totals = await session.scalar(
+            select(CorpusTotals).where(CorpusTotals.name == CORPUS)
+        )
+        rows = await session.execute(
+            select(CorpusWord.word, CorpusWord.count)
+            .order_by(CorpusWord.count.desc(), CorpusWord.word)
+            .limit(limit)
+        )
+        counts = dict(rows.tuples().all())
+
+    if totals is None:
+        return WordCounts(files=0, word_count=0, unique_words=0, counts={})
+    return WordCounts(
+        files=totals.files,
+        word_count=totals.word_count,
+        unique_words=totals.unique_words,
+        counts=counts,
+    )
+
+
+async def _lock_corpus(session: AsyncSession, mode: str) -> None:
+    await session.execute(
+        text(
+            f"LOCK TABLE {CorpusWord.__table__.fullname}, "
+            f"{CorpusTotals.__table__.fullname} IN {mode} MODE"
+        )
+    )
+
+
+async def _is_built(session: AsyncSession) -> bool:
+    # The totals row of the corpus is only inserted by its build
+    totals = await session.scalar(
+        select(CorpusTotals.id).where(CorpusTotals.name == CORPUS)
+    )
+    return totals is not None
+
+
+async def _build(session: AsyncSession) -> None:
+    # With the corpus locked, and the word counts derived
+    await session.execute(delete(CorpusWord))
+    await session.execute(delete(CorpusTotals))
+    await session.execute(
+        insert(CorpusTotals).values(name=CORPUS, files=0, word_count=0, unique_words=0)
+    )
+    await add_to_corpus(
+        session,
+        select(AnalyticsResult.id).where(AnalyticsResult.status == JobStatus.COMPLETED),
+    )
+
+
+async def ensure_built() -> bool:
+    """
+    Build the corpus tables from all the completed results, unless they are
+    built already, e.g. on the first start after upgrading.
+
+    :return: Whether the corpus was built.
+    """
+    async with Session() as session:
+        if await _is_built(session):
+            return False
+
+    async with Session.begin() as session:
+        # The counts are derived before locking the corpus, the jobs adding
+        # to it may hold the rows being derived
+        await backfill_counts(session)
+        await _lock_corpus(session, "EXCLUSIVE")
+        if await _is_built(session):
+            # Built meanwhile, e.g. by another instance
+            return False
+        await _build(session)
+    return True
+
+
+async def rebuild() -> None:
+    """
+    Derive the missing word counts and recompute the corpus tables.
+
+    Results completed meanwhile wait for the rebuild, then add their counts.
+    """
+    async with Session.begin() as session:
+        await backfill_counts(session)
+        await _lock_corpus(session, "EXCLUSIVE")
+        await _build(session)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the corpus analytics.")
+    parser.add_argument(
+        "command",
+        choices=["rebuild"],
+        help="rebuild: derive the missing word counts and recompute the corpus",
+    )
+    parser.parse_args()
+
+    async def run() -> None:
+        await create_tables()
+        try:
+            await rebuild()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+    logger.info("Corpus analytics rebuilt.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,77 @@
-from sqlalchemy import ForeignKey
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, Index, func, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import TABLE_ARGS, Base
 
 
+class JobStatus:
+    """
+    The states of an analytics job.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class AnalyticsResult(Base):
     """
     Model for storing file metadata.
+
+    Each row is also the analytics job of its file, claimed by the workers
+    while it is pending, or running past its lease.
     """
 
     __tablename__ = "analytics_results"
-    __table_args__ = (TABLE_ARGS,)
+    __table_args__ = (
+        # One job, and result, per file
+        Index("uq_analytics_results_file_id", "file_id", unique=True),
+        # The queue, only the unfinished jobs
+        Index(
+            "ix_analytics_results_queue",
+            "available_at",
+            postgresql_where=text("status IN ('pending', 'running')"),
+        ),
+        TABLE_ARGS,
+    )
 
     file_id: Mapped[int] = (
         mapped_column(  # TODO: Use ForeignKey to link to a file table
-            nullable=False,
-            index=True,
-            doc="ID of the file associated with the analytics result",
+            nullable=False, doc="ID of the file associated with the analytics result"
         )
     )
-    result: Mapped[dict] = mapped_column(
-        JSONB, nullable=False, doc="The analytics result data in JSON format"
+    result: Mapped[dict | None] = mapped_column(
+        JSONB,
+        nullable=True,
+        doc="The analytics result data in JSON format, once completed",
+    )
+    word_counts: Mapped[dict | None] = mapped_column(
+        JSONB,
+        nullable=True,
+        doc="Occurrences of each word, which merge into the counts of many files",
     )
     wordcloud_path: Mapped[str] = mapped_column(
         nullable=True, doc="Path to the generated image, if applicable"
     )
     status: Mapped[str] = mapped_column(
         nullable=False,
+        server_default=JobStatus.PENDING,
         doc="Status of the analytics result (e.g., 'pending', 'completed')",
     )
+    attempts: Mapped[int] = mapped_column(
+        nullable=False,
+        server_default="0",
+        doc="Number of times the job was claimed by a worker",
+    )
+    error: Mapped[str | None] = mapped_column(
+        nullable=True, doc="Error of the last failed attempt, if any"
+    )
+    available_at: Mapped[datetime] = mapped_column(
+        nullable=False,
+        server_default=func.now(),
+        doc="Time from which the job may be claimed, the lease expiry while running",
+    )
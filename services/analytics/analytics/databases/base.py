@@ -1,10 +1,14 @@
 from datetime import datetime
 
-from sqlalchemy import func
+from sqlalchemy import Connection, func, inspect, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.schema import CreateColumn
 
 from analytics.config import Config
+from analytics.metrics import MeteredPool, instrument_engine
+from analytics.tracing import trace_engine
 
 
 engine = create_async_engine(
@@ -13,7 +17,10 @@ engine = create_async_engine(
     pool_pre_ping=Config.Database.POOL_PRE_PING,
     pool_size=Config.Database.POOL_SIZE,
     max_overflow=Config.Database.MAX_OVERFLOW,
+    poolclass=MeteredPool,
 )
+instrument_engine(engine)
+trace_engine(engine)
 Session = async_sessionmaker(engine, expire_on_commit=False)
 TABLE_ARGS = {"extend_existing": True, "schema": Config.Database.SCHEMA}
 
@@ -34,8 +41,64 @@ class Base(DeclarativeBase, AsyncAttrs):
     )
 
 
+def _add_missing_columns(connection: Connection) -> None:
+    # create_all skips existing tables, so columns added later are added here.
+    # Such columns must be nullable or have a server default.
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name, schema=table.schema):
+            continue
+
+        columns = {
+            column["name"]: column
+            for column in inspector.get_columns(table.name, schema=table.schema)
+        }
+        for column in table.columns:
+            if column.name not in columns:
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                        f"{CreateColumn(column).compile(dialect=connection.dialect)}"
+                    )
+                )
+            elif column.nullable and not columns[column.name]["nullable"]:
+                # Columns made optional later
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {preparer.format_table(table)} ALTER COLUMN "
+                        f"{preparer.format_column(column)} DROP NOT NULL"
+                    )
+                )
+
+
+def _create_missing_indexes(connection: Connection) -> None:
+    # create_all skips existing tables, so indexes added later are created here
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {
+            index["name"]
+            for index in inspector.get_indexes(table.name, schema=table.schema)
+        }
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(connection)
+            except IntegrityError as e:
+                # Rows written before a unique index existed collide, they are
+                # never deleted implicitly
+                raise RuntimeError(
+                    f"Cannot create the unique index {index.name}, {table.fullname} "
+                    f"has duplicate rows. Remove them first, see "
+                    f"`python -m analytics.migrations --help`."
+                ) from e
+
+
 async def create_tables() -> None:
     async with engine.begin() as conn:
         # await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
         await conn.commit()
@@ -0,0 +1,43 @@
+from sqlalchemy import BigInteger
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import TABLE_ARGS, Base
+
+
+class CorpusWord(Base):
+    """
+    Model for the occurrences of a word in all the analyzed files, updated
+    as each file is analyzed.
+    """
+
+    __tablename__ = "corpus_words"
+    __table_args__ = (TABLE_ARGS,)
+
+    word: Mapped[str] = mapped_column(nullable=False, unique=True, doc="The word")
+    count: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, doc="Occurrences of the word in all the files"
+    )
+    files: Mapped[int] = mapped_column(
+        nullable=False, doc="Number of files the word occurs in"
+    )
+
+
+class CorpusTotals(Base):
+    """
+    Model for the totals of all the analyzed files, updated as each file is
+    analyzed.
+    """
+
+    __tablename__ = "corpus_totals"
+    __table_args__ = (TABLE_ARGS,)
+
+    name: Mapped[str] = mapped_column(
+        nullable=False, unique=True, doc="Name of the corpus"
+    )
+    files: Mapped[int] = mapped_column(nullable=False, doc="Number of files")
+    word_count: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, doc="Number of words in all the files"
+    )
+    unique_words: Mapped[int] = mapped_column(
+        nullable=False, doc="Number of distinct words in all the files"
+    )
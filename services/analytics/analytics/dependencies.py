@@ -1,9 +1,10 @@
 from typing import TYPE_CHECKING, Annotated
 
-from fastapi import Depends
-from httpx import AsyncClient
+from fastapi import Depends, Request
 
+from analytics.clients import UpstreamClients
 from analytics.config import Config
+from analytics.executor import AnalyticsExecutor
 from analytics.services.analytics import AnalyticsService
 
 
@@ -15,24 +16,42 @@ if TYPE_CHECKING:
 ConfigDep = Annotated[Config, Depends(Config)]
 
 
-def get_wordcloud_connector(config: ConfigDep) -> 'WordCloudConnector':
+def get_upstream_clients(request: Request) -> UpstreamClients:
+    """
+    Dependency to get the UpstreamClients created in the application lifespan.
+
+    :param request: The current request.
+    :return: The shared instance of UpstreamClients.
+    """
+    return request.app.state.upstream_clients
+
+
+UpstreamClientsDep = Annotated[UpstreamClients, Depends(get_upstream_clients)]
+
+
+def get_executor(request: Request) -> AnalyticsExecutor:
+    """
+    Dependency to get the AnalyticsExecutor created in the application lifespan.
+
+    :param request: The current request.
+    :return: The shared instance of AnalyticsExecutor.
+    """
+    return request.app.state.executor
+
+
+ExecutorDep = Annotated[AnalyticsExecutor, Depends(get_executor)]
+
+
+def get_wordcloud_connector(clients: UpstreamClientsDep) -> 'WordCloudConnector':
     """
     Dependency to get the WordCloudConnector instance.
 
-    :param config: The configuration object.
+    :param clients: The pooled clients of the upstream services.
     :return: An instance of WordCloudConnector.
     """
     from analytics.connectors.wordcloud import WordCloudConnector
 
-    return WordCloudConnector(
-        wordcloud_client=AsyncClient(
-            base_url=config.WordCloudApi.API_URL,
-            timeout=config.WordCloudApi.TIMEOUT,
-            headers={
-                "Authorization": f"Bearer {config.WordCloudApi.WORDCLOUD_API_KEY}"
-            },
-        )
-    )
+    return WordCloudConnector(wordcloud_client=clients.wordcloud)
 
 
 WordCloudConnectorDep = Annotated[
@@ -57,16 +76,16 @@ FilesystemStorageDriverDep = Annotated[
 ]
 
 
-def get_storage_connector(config: ConfigDep) -> 'StorageConnector':
+def get_storage_connector(clients: UpstreamClientsDep) -> 'StorageConnector':
     """
     Dependency to get the StorageConnector instance.
 
-    :param config: The configuration object.
+    :param clients: The pooled clients of the upstream services.
     :return: An instance of StorageConnector.
     """
     from analytics.connectors.storage import StorageConnector
 
-    return StorageConnector(AsyncClient(base_url=config.Storage.API_URL))
+    return StorageConnector(clients.storage)
 
 
 StorageConnectorDep = Annotated['StorageConnector', Depends(get_storage_connector)]
@@ -76,11 +95,15 @@ def get_analytics_service(
     wordcloud_connector: WordCloudConnectorDep,
     filesystem_storage_driver: FilesystemStorageDriverDep,
     storage_connector: StorageConnectorDep,
+    executor: ExecutorDep,
+    config: ConfigDep,
 ) -> 'AnalyticsService':
     """
     Dependency to get the AnalyticsService instance.
 
     :param wordcloud_connector: The WordCloudConnector instance.
+    :param executor: The AnalyticsExecutor instance.
+    :param config: The configuration object.
     :return: An instance of AnalyticsService.
     """
     from analytics.services.analytics import AnalyticsService
@@ -89,6 +112,8 @@ def get_analytics_service(
         wordcloud_connector=wordcloud_connector,
         filesystem_storage_driver=filesystem_storage_driver,
         storage_connector=storage_connector,
+        executor=executor,
+        batch_concurrency=config.Batch.CONCURRENCY,
     )
 
 
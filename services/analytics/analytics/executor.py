@@ -0,0 +1,250 @@
+"""
+Execution of the CPU bound analytics off the event loop.
+
+Tokenizing and counting a large text holds the GIL for seconds, which would
+freeze every other request of the service, so large texts are analyzed in a
+pool of worker processes. Small ones are analyzed inline, where the round
+trip to a worker would cost more than the work itself.
+
+Texts are not pickled to the workers: they are written once to a shared
+memory block, which the worker decodes in place. The first byte of the block
+is a cancellation flag, checked by the worker between chunks along with the
+job deadline, so abandoned jobs stop instead of occupying a worker.
+"""
+
+import asyncio
+import multiprocessing
+import signal
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any
+
+from loguru import logger
+
+from analytics.batch import calculate_batch
+from analytics.config import Config
+from analytics.tokenizer import Tokenizer
+
+
+# The cancellation flag precedes the texts in the shared memory block
+HEADER_SIZE = 1
+
+Job = Callable[[Tokenizer, Sequence[str], Callable[[], None] | None], object]
+
+
+class JobCancelled(Exception):
+    """
+    Raised in a worker when its job is cancelled or past its deadline.
+    """
+
+
+def calculate_analytics(
+    tokenizer: Tokenizer, text: str, check: Callable[[], None] | None = None
+) -> dict:
+    """
+    Calculate the analytics of a text.
+
+    :param tokenizer: The tokenizer splitting the text.
+    :param text: The text.
+    :param check: A function called before each chunk, which may raise to
+        abort the calculation.
+    :return: The number of words, their rates and counts and the number of
+        unique words.
+    """
+    counts = tokenizer.count(text, check)
+    word_count = counts.total()
+    words_rates = {word: count / word_count for word, count in counts.items()}
+    return {
+        "word_count": word_count,
+        "words_rates": words_rates,
+        "unique_words": len(words_rates),
+        "word_counts": dict(counts),
+    }
+
+
+def _calculate_one(
+    tokenizer: Tokenizer, texts: Sequence[str], check: Callable[[], None] | None = None
+) -> dict:
+    return calculate_analytics(tokenizer, texts[0], check)
+
+
+# The tokenizer of the worker process, set once when it starts
+_tokenizer: Tokenizer | None = None
+
+
+def _init_worker(tokenizer: Tokenizer) -> None:
+    global _tokenizer
+    _tokenizer = tokenizer
+    # Interrupts are handled by the service, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run(job: Job, name: str, lengths: list[int], deadline: float) -> object:
+    # Runs in a worker, with the texts in the shared memory block `name`. The
+    # block is owned and unlinked by the parent, so the resource tracker of
+    # the worker must not track it as well
+    block = SharedMemory(name=name, track=False)
+    try:
+        texts = []
+        offset = HEADER_SIZE
+        for length in lengths:
+            with block.buf[offset : offset + length] as view:
+                texts.append(str(view, "utf-8"))
+            offset += length
+
+        def check() -> None:
+            if block.buf[0] or time.monotonic() > deadline:
+                raise JobCancelled()
+
+        return job(_tokenizer, texts, check)
+    finally:
+        block.close()
+
+
+class AnalyticsExecutor:
+    """
+    Runs the analytics calculation inline or in a pool of worker processes,
+    depending on the size of the texts.
+    """
+
+    def __init__(
+        self,
+        tokenizer: Tokenizer,
+        workers: int = Config.Executor.WORKERS,
+        inline_max_chars: int = Config.Executor.INLINE_MAX_CHARS,
+        timeout: float = Config.Executor.TIMEOUT,
+    ) -> None:
+        """
+        Initialize the executor.
+
+        :param tokenizer: The tokenizer splitting the texts, also sent to the
+            workers.
+        :param workers: The number of worker processes, 0 analyzes large
+            texts in a thread instead.
+        :param inline_max_chars: The size, in characters, under which texts
+            are analyzed in the event loop.
+        :param timeout: The maximum duration of a job run outside the event
+            loop, in seconds.
+        """
+        self.tokenizer = tokenizer
+        self.workers = workers
+        self.inline_max_chars = inline_max_chars
+        self.timeout = timeout
+        self.pool = self._create_pool() if workers > 0 else None
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # Forking a process running an event loop and its threads is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.tokenizer,),
+        )
+
+    async def calculate(self, text: str) -> dict:
+        """
+        Calculate the analytics of a text.
+
+        :param text: The text.
+        :return: The analytics of the text.
+        :raises TimeoutError: If the calculation took longer than the timeout.
+        """
+        return await self._execute(_calculate_one, [text])
+
+    async def calculate_batch(self, texts: Sequence[str]) -> list[dict]:
+        """
+        Calculate the analytics of many texts, in a single job.
+
+        :param texts: The texts.
+        :return: The analytics of each text, in order.
+        :raises TimeoutError: If the calculation took longer than the timeout.
+        """
+        return await self._execute(calculate_batch, texts)
+
+    async def _execute(self, job: Job, texts: Sequence[str]) -> Any:
+        if sum(map(len, texts)) < self.inline_max_chars:
+            return job(self.tokenizer, texts)
+
+        try:
+            if self.pool is None:
+                return await self._execute_in_thread(job, texts)
+            return await self._execute_in_pool(job, texts)
+        except JobCancelled:
+            # The job saw its deadline before the timeout fired here
+            raise TimeoutError() from None
+
+    async def _execute_in_thread(self, job: Job, texts: Sequence[str]) -> Any:
+        deadline = time.monotonic() + self.timeout
+        cancelled = threading.Event()
+
+        def check() -> None:
+            if cancelled.is_set() or time.monotonic() > deadline:
+                raise JobCancelled()
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(job, self.tokenizer, texts, check), self.timeout
+            )
+        finally:
+            cancelled.set()
+
+    async def _execute_in_pool(self, job: Job, texts: Sequence[str]) -> Any:
+        encoded = await asyncio.to_thread(lambda: [text.encode() for text in texts])
+        lengths = [len(data) for data in encoded]
+        block = SharedMemory(create=True, size=HEADER_SIZE + sum(lengths))
+        try:
+            offset = HEADER_SIZE
+            for data in encoded:
+                block.buf[offset : offset + len(data)] = data
+                offset += len(data)
+            del encoded
+
+            deadline = time.monotonic() + self.timeout
+            try:
+                future = self.pool.submit(_run, job, block.name, lengths, deadline)
+            except BrokenProcessPool:
+                # A worker died, e.g. killed for its memory, so start afresh
+                logger.warning("Analytics worker pool is broken, restarting it.")
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._create_pool()
+                future = self.pool.submit(_run, job, block.name, lengths, deadline)
+
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            finally:
+                if not future.done():
+                    # Timed out or cancelled while running, stop at the next chunk
+                    block.buf[0] = 1
+                    future.cancel()
+        finally:
+            block.close()
+            block.unlink()
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes, cancelling the pending jobs.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def create_executor(
+    tokenizer: Tokenizer, config: type[Config] = Config
+) -> AnalyticsExecutor:
+    """
+    Create the analytics executor from the configuration.
+
+    :param tokenizer: The tokenizer splitting the texts.
+    :param config: The configuration object.
+    :return: The executor, with its worker processes started on demand.
+    """
+    return AnalyticsExecutor(
+        tokenizer,
+        workers=config.Executor.WORKERS,
+        inline_max_chars=config.Executor.INLINE_MAX_CHARS,
+        timeout=config.Executor.TIMEOUT,
+    )
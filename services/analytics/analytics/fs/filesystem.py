@@ -1,7 +1,11 @@
+import os
 from pathlib import Path
+from uuid import uuid4
 
 import aiofiles
 
+from analytics.tracing import tracer
+
 
 class FilesystemStorageDriver:
     def __init__(self, base_path: str) -> None:
@@ -13,10 +17,21 @@ class FilesystemStorageDriver:
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
 
-    async def upload(self, file_path: str, data: bytes) -> None:
+    async def upload(
+        self, file_path: str, data: bytes, overwrite: bool = False
+    ) -> None:
+        """
+        Store a file, written to a temporary file first and then moved in
+        place, so a file in storage is never partially written.
+
+        :param file_path: The path of the file, relative to the base path.
+        :param data: The content of the file.
+        :param overwrite: Whether to replace an existing file.
+        :raises FileExistsError: If the file exists and `overwrite` is False.
+        """
         full_path = self.base_path / file_path
 
-        if full_path.exists():
+        if not overwrite and full_path.exists():
             raise FileExistsError(f"File {file_path} already exists in storage.")
 
         if not full_path.is_relative_to(self.base_path):
@@ -24,16 +39,26 @@ class FilesystemStorageDriver:
 
         full_path.parent.mkdir(parents=True, exist_ok=True)
 
-        async with aiofiles.open(str(full_path), "wb") as f:
-            await f.write(data)
+        with tracer.start_as_current_span(
+            "filesystem.upload", attributes={"storage.bytes": len(data)}
+        ):
+            temp_path = full_path.with_name(f".{full_path.name}.{uuid4().hex}.tmp")
+            try:
+                async with aiofiles.open(str(temp_path), "wb") as f:
+                    await f.write(data)
+                os.replace(temp_path, full_path)
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
 
     async def download(self, file_path: str) -> bytes:
         full_path = self.base_path / file_path
         if not full_path.exists():
             raise FileNotFoundError(f"File {file_path} not found in storage.")
 
-        async with aiofiles.open(self.base_path / file_path, "rb") as f:
-            return await f.read()
+        with tracer.start_as_current_span("filesystem.download"):
+            async with aiofiles.open(self.base_path / file_path, "rb") as f:
+                return await f.read()
 
     async def exists(self, file_path: str) -> bool:
         full_path = self.base_path / file_path
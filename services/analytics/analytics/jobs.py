@@ -0,0 +1,195 @@
+"""
+The queue of the analytics jobs, kept in the analytics results table.
+
+The job of a file is its analytics result row, moving from pending to running
+to completed or failed. Workers claim the pending jobs with
+`FOR UPDATE SKIP LOCKED`, so any number of them, in any number of processes,
+share the queue without ever claiming a job twice. A claimed job is leased to
+its worker, and claimed again once the lease expires, e.g. if the worker died.
+"""
+
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import Update, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from analytics.corpus import add_to_corpus, split_counts
+from analytics.databases.analytics import AnalyticsResult, JobStatus
+from analytics.databases.base import Session
+
+
+@dataclass(frozen=True, slots=True)
+class Job:
+    """
+    A job claimed by a worker.
+    """
+
+    id: int
+    file_id: int
+    # The attempt of this claim, which fences off the updates of older ones
+    attempts: int
+
+
+async def enqueue(file_id: int) -> AnalyticsResult:
+    """
+    Queue the analysis of a file, unless it is queued or analyzed already.
+
+    A failed job is queued again, with its attempts reset.
+
+    :param file_id: The ID of the file.
+    :return: The job of the file.
+    """
+    statement = (
+        insert(AnalyticsResult)
+        .values(file_id=file_id, status=JobStatus.PENDING)
+        .on_conflict_do_update(
+            index_elements=[AnalyticsResult.file_id],
+            set_={
+                "status": JobStatus.PENDING,
+                "attempts": 0,
+                "error": None,
+                "available_at": func.now(),
+                "updated_at": func.now(),
+            },
+            where=AnalyticsResult.status == JobStatus.FAILED,
+        )
+        .returning(AnalyticsResult)
+    )
+    async with Session.begin() as session:
+        job = await session.scalar(statement)
+        if job is None:
+            # Neither inserted nor requeued, the existing job stands
+            job = await session.scalar(
+                select(AnalyticsResult).where(AnalyticsResult.file_id == file_id)
+            )
+        return job
+
+
+async def get(job_id: int) -> AnalyticsResult | None:
+    """
+    Get a job by its ID.
+
+    :param job_id: The ID of the job.
+    :return: The job, or None if not found.
+    """
+    async with Session() as session:
+        return await session.get(AnalyticsResult, job_id)
+
+
+async def claim(lease: float) -> Job | None:
+    """
+    Claim the next available job.
+
+    :param lease: The number of seconds the job is leased to the caller.
+    :return: The job, or None if no job is available.
+    """
+    available = (
+        select(AnalyticsResult.id)
+        .where(
+            AnalyticsResult.status.in_((JobStatus.PENDING, JobStatus.RUNNING)),
+            AnalyticsResult.available_at <= func.now(),
+        )
+        .order_by(AnalyticsResult.available_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    statement = (
+        update(AnalyticsResult)
+        .where(AnalyticsResult.id == available)
+        .values(
+            status=JobStatus.RUNNING,
+            attempts=AnalyticsResult.attempts + 1,
+            available_at=func.now() + timedelta(seconds=lease),
+        )
+        .returning(
+            AnalyticsResult.id, AnalyticsResult.file_id, AnalyticsResult.attempts
+        )
+        .execution_options(synchronize_session=False)
+    )
+    async with Session.begin() as session:
+        row = (await session.execute(statement)).one_or_none()
+    return Job(*row) if row is not None else None
+
+
+def _leased(job: Job) -> Update:
+    # Only while the job is still leased to this attempt
+    return (
+        update(AnalyticsResult)
+        .where(
+            AnalyticsResult.id == job.id,
+            AnalyticsResult.status == JobStatus.RUNNING,
+            AnalyticsResult.attempts == job.attempts,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _update(job: Job, **values) -> bool:
+    async with Session.begin() as session:
+        result = await session.execute(_leased(job).values(**values))
+    return result.rowcount > 0
+
+
+async def complete(job: Job, analytics: dict, wordcloud_path: str | None) -> bool:
+    """
+    Store the result of a job, and add its word counts to the corpus.
+
+    :param job: The job.
+    :param analytics: The analytics of the file, word counts included.
+    :param wordcloud_path: The path of the word cloud image, if any.
+    :return: False if the lease of the job was lost, the result is dropped.
+    """
+    result, word_counts = split_counts(analytics)
+    statement = (
+        _leased(job)
+        .values(
+            status=JobStatus.COMPLETED,
+            result=result,
+            word_counts=word_counts,
+            wordcloud_path=wordcloud_path,
+            error=None,
+        )
+        .returning(AnalyticsResult.id)
+    )
+    async with Session.begin() as session:
+        completed = (await session.execute(statement)).scalar_one_or_none()
+        if completed is not None:
+            await add_to_corpus(session, [completed])
+    return completed is not None
+
+
+async def fail(job: Job, error: str, retry_in: float | None = None) -> bool:
+    """
+    Record the failure of a job.
+
+    :param job: The job.
+    :param error: The reason of the failure.
+    :param retry_in: The number of seconds after which the job is retried,
+        or None if it failed for good.
+    :return: False if the lease of the job was lost.
+    """
+    if retry_in is None:
+        return await _update(job, status=JobStatus.FAILED, error=error)
+    return await _update(
+        job,
+        status=JobStatus.PENDING,
+        error=error,
+        available_at=func.now() + timedelta(seconds=retry_in),
+    )
+
+
+async def release(job: Job) -> bool:
+    """
+    Give a job back to the queue, without counting the attempt.
+
+    :param job: The job, interrupted e.g. by a shutdown.
+    :return: False if the lease of the job was lost.
+    """
+    return await _update(
+        job,
+        status=JobStatus.PENDING,
+        attempts=AnalyticsResult.attempts - 1,
+        available_at=func.now(),
+    )
@@ -4,8 +4,19 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 
+from analytics.clients import UpstreamClients
+from analytics.compression import CompressionMiddleware
+from analytics.config import Config
+from analytics.corpus import ensure_built
 from analytics.databases.base import create_tables
+from analytics.executor import create_executor
+from analytics.metrics import MetricsMiddleware
+from analytics.metrics import router as metrics_router
 from analytics.routers.analytics import router as files_router
+from analytics.routers.stats import router as stats_router
+from analytics.tokenizer import create_tokenizer
+from analytics.tracing import TracingMiddleware, setup_tracing
+from analytics.worker import create_worker
 
 
 @asynccontextmanager
@@ -16,10 +27,26 @@ async def lifespan(app: FastAPI):
     """
 
     logger.info("Starting application lifespan setup.")
+    tracer_provider = setup_tracing()
     await create_tables()
     logger.info("Database tables created successfully.")
+    if await ensure_built():
+        logger.info("Corpus analytics built from the stored results.")
+    app.state.upstream_clients = UpstreamClients()
+    app.state.executor = create_executor(create_tokenizer())
+    job_worker = None
+    if Config.Jobs.RUN_IN_SERVICE:
+        job_worker = create_worker(app.state.upstream_clients, app.state.executor)
+        job_worker.start()
     yield
 
+    if job_worker is not None:
+        await job_worker.stop()
+    app.state.executor.shutdown()
+    await app.state.upstream_clients.aclose()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()
+
 
 app = FastAPI(
     title="Analytics Service",
@@ -35,8 +62,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(files_router)
+app.include_router(stats_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+"""
+One-off migrations of the stored analytics, run by hand before upgrading.
+
+The service creates the missing tables, columns and indexes when it starts,
+but never deletes data to do so. A unique index that cannot be created
+because of the rows written before it stops the service, until the duplicate
+rows are removed with the matching command below.
+
+Usage::
+
+    python -m analytics.migrations dedupe-results
+"""
+
+import argparse
+import asyncio
+
+from loguru import logger
+from sqlalchemy import delete, exists, inspect
+from sqlalchemy.orm import aliased
+
+from analytics.databases.analytics import AnalyticsResult
+from analytics.databases.base import Session, create_tables, engine
+
+
+async def dedupe_results() -> int:
+    """
+    Delete all but the newest analytics result of each file.
+
+    Versions before the job queue stored a result per analysis, so a file
+    analyzed several times has several.
+
+    :return: The number of results deleted.
+    """
+    table = AnalyticsResult.__table__
+    async with engine.connect() as conn:
+        has_table = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).has_table(
+                table.name, schema=table.schema
+            )
+        )
+    if not has_table:
+        return 0
+
+    newer = aliased(AnalyticsResult)
+    async with Session.begin() as session:
+        result = await session.execute(
+            delete(AnalyticsResult)
+            .where(
+                exists().where(
+                    newer.file_id == AnalyticsResult.file_id,
+                    newer.id > AnalyticsResult.id,
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
+    return result.rowcount
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Migrate the stored analytics.")
+    parser.add_argument(
+        "command",
+        choices=["dedupe-results"],
+        help=(
+            "dedupe-results: keep only the newest analytics result of each file, "
+            "then create the missing tables and indexes"
+        ),
+    )
+    parser.parse_args()
+
+    async def run() -> int:
+        try:
+            deleted = await dedupe_results()
+            await create_tables()
+        finally:
+            await engine.dispose()
+        return deleted
+
+    deleted = asyncio.run(run())
+    logger.info(f"Deleted {deleted} duplicate analytics results.")
+
+
+if __name__ == "__main__":
+    main()
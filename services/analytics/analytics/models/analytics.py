@@ -1,3 +1,6 @@
+from datetime import datetime
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -13,3 +16,65 @@ class Analytics(BaseModel):
     wordcloud_path: str | None = Field(
         None, description="Path to the generated word cloud image, if applicable"
     )
+
+
+class BatchAnalyticsRequest(BaseModel):
+    ids: list[int] = Field(
+        ..., min_length=1, max_length=1000, description="IDs of the files to analyze"
+    )
+
+
+class BatchAnalyticsResult(BaseModel):
+    file_id: int = Field(..., description="ID of the analyzed file")
+    analytics: Analytics | None = Field(
+        None, description="Analytics results, if the file was analyzed"
+    )
+    error: str | None = Field(
+        None, description="Why the file could not be analyzed, if it failed"
+    )
+
+
+class AnalyticsJob(BaseModel):
+    id: int = Field(..., description="ID of the job")
+    file_id: int = Field(..., description="ID of the analyzed file")
+    status: Literal["pending", "running", "completed", "failed"] = Field(
+        ..., description="State of the job"
+    )
+    attempts: int = Field(..., description="Number of times the job was started")
+    error: str | None = Field(
+        None, description="Error of the last failed attempt, if any"
+    )
+    created_at: datetime = Field(..., description="Time the job was created")
+    updated_at: datetime = Field(..., description="Time the job last changed")
+    analytics: Analytics | None = Field(
+        None, description="Analytics results, once the job is completed"
+    )
+
+
+class AggregateAnalyticsRequest(BaseModel):
+    ids: list[int] = Field(
+        ..., min_length=1, max_length=10000, description="IDs of the files to aggregate"
+    )
+    limit: int | None = Field(
+        None,
+        ge=1,
+        description="Number of most frequent words returned, all of them if unset",
+    )
+
+
+class AggregateAnalytics(BaseModel):
+    files: int = Field(..., description="Number of files aggregated")
+    missing_ids: list[int] = Field(
+        default_factory=list,
+        description="IDs of the requested files which are not analyzed yet",
+    )
+    word_count: int = Field(..., description="Total number of words in the files")
+    unique_words: int = Field(
+        ..., description="Total number of unique words in the files"
+    )
+    words_counts: dict[str, int] = Field(
+        ..., description="Occurrences of each word, most frequent first"
+    )
+    words_rates: dict[str, float] = Field(
+        ..., description="Frequency of each word in the files, most frequent first"
+    )
@@ -1,38 +1,125 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Response, UploadFile
+from fastapi import APIRouter, Depends, Header, Query, Response, UploadFile
 from fastapi.responses import FileResponse
 
+from analytics.databases.analytics import JobStatus
 from analytics.dependencies import AnalyticsServiceDep
-from analytics.models.analytics import Analytics
+from analytics.models.analytics import (
+    AggregateAnalytics,
+    AggregateAnalyticsRequest,
+    Analytics,
+    AnalyticsJob,
+    BatchAnalyticsRequest,
+    BatchAnalyticsResult,
+)
+from analytics.services.analytics import RETRY_AFTER
 
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 
-@router.post("/{file_id}")
+@router.post(
+    "/batch",
+    responses={
+        200: {"description": "Results of the analyzed files, errors of the others"}
+    },
+)
+async def analyze_files(
+    request: BatchAnalyticsRequest, analytics_service: AnalyticsServiceDep
+) -> list[BatchAnalyticsResult]:
+    """
+    Analyze many files in one request.
+
+    At most 1000 files can be analyzed per request.
+
+    :param request: The IDs of the files to analyze.
+    :param analytics_service: The AnalyticsService instance.
+    :return: The results or the error of each file, in the order of the IDs.
+    """
+    return await analytics_service.analyze_files(request.ids)
+
+
+@router.post("/aggregate")
+async def aggregate_files(
+    request: AggregateAnalyticsRequest, analytics_service: AnalyticsServiceDep
+) -> AggregateAnalytics:
+    """
+    Aggregate the analytics of many files, from their stored word counts.
+
+    :param request: The IDs of the files, and the number of words returned.
+    :param analytics_service: The AnalyticsService instance.
+    :return: The analytics of the analyzed files as a whole.
+    """
+    return await analytics_service.aggregate_files(request.ids, request.limit)
+
+
+@router.get("/aggregate")
+async def get_corpus(
+    analytics_service: AnalyticsServiceDep,
+    limit: Annotated[int | None, Query(ge=1)] = 1000,
+) -> AggregateAnalytics:
+    """
+    Get the analytics of all the analyzed files.
+
+    :param analytics_service: The AnalyticsService instance.
+    :param limit: The number of most frequent words returned.
+    :return: The analytics of all the files as a whole.
+    """
+    return await analytics_service.get_corpus(limit)
+
+
+@router.post(
+    "/{file_id}",
+    responses={202: {"model": AnalyticsJob, "description": "The analysis is queued"}},
+)
 async def analyze_file(
     file_id: int, analytics_service: AnalyticsServiceDep
 ) -> Analytics:
     """
     Analyze a file by its ID and return analytics results.
 
+    Files are analyzed by the job workers: until the results are available,
+    a 202 response describes the job to poll, at its Location.
+
     :param file_id: The ID of the file to analyze.
     :param analytics_service: The AnalyticsService instance.
-    :return: An Analytics object containing the results.
+    :return: An Analytics object containing the results, or the job.
     """
     return await analytics_service.analyze_file(file_id)
 
 
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: int, analytics_service: AnalyticsServiceDep, response: Response
+) -> AnalyticsJob:
+    """
+    Get the status of an analytics job.
+
+    :param job_id: The ID of the job.
+    :param analytics_service: The AnalyticsService instance.
+    :param response: The response, advising when to poll again.
+    :return: The job, with the analytics results once completed.
+    """
+    job = await analytics_service.get_job(job_id)
+    if job.status in (JobStatus.PENDING, JobStatus.RUNNING):
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+    response.headers["Cache-Control"] = "no-cache"
+    return job
+
+
 @router.get("/{file_path:path}", response_class=FileResponse)
 async def download_wordcloud(
-    file_path: str, analytics_service: AnalyticsServiceDep
+    file_path: str,
+    analytics_service: AnalyticsServiceDep,
+    if_none_match: Annotated[str | None, Header()] = None,
 ) -> Response:
     """
     Download the word cloud image for a specific file.
 
     :param path: The path to the word cloud image.
     :param analytics_service: The AnalyticsService instance.
+    :param if_none_match: The ETags the client already has, if any.
     :return: A Response object containing the word cloud image.
     """
-    return await analytics_service.download_wordcloud(file_path)
+    return await analytics_service.download_wordcloud(file_path, if_none_match)
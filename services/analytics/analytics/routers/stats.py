@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+
+from analytics.dependencies import UpstreamClientsDep
+
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+
+@router.get("/pools")
+async def get_pool_stats(clients: UpstreamClientsDep) -> dict[str, dict[str, int]]:
+    """
+    Get the connection pool usage of the upstream clients.
+
+    :param clients: The pooled clients of the upstream services.
+    """
+    return clients.stats()
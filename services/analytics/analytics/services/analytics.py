@@ -1,15 +1,29 @@
+import asyncio
 from typing import TYPE_CHECKING
 
 from fastapi import HTTPException, Response, UploadFile, status
 from fastapi.background import P
-from fastapi.responses import Response
-from httpx import ConnectError
+from fastapi.responses import JSONResponse, Response
+from httpx import ConnectError, HTTPStatusError
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
 
-from analytics.databases.analytics import AnalyticsResult
+from analytics import jobs
+from analytics.config import Config
+from analytics.corpus import (
+    WordCounts,
+    add_to_corpus,
+    corpus_counts,
+    merge_counts,
+    split_counts,
+)
+from analytics.databases.analytics import AnalyticsResult, JobStatus
 from analytics.databases.base import Session
+from analytics.executor import AnalyticsExecutor
 from analytics.models import analytics as analytics_models
+from analytics.tokenizer import Tokenizer
+from analytics.tracing import tracer
 
 
 if TYPE_CHECKING:
@@ -18,6 +32,25 @@ if TYPE_CHECKING:
     from analytics.fs.filesystem import FilesystemStorageDriver
 
 
+# Word clouds are never regenerated once stored, so caches may keep them
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Seconds clients are advised to wait before polling an unfinished job
+RETRY_AFTER = 1
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Check an If-None-Match header against the ETag of a resource.
+
+    :param if_none_match: The value of the If-None-Match header.
+    :param etag: The strong ETag of the resource.
+    :return: True if the client already has the resource.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
 class AnalyticsService:
     """
     Service for handling analytics-related operations.
@@ -28,15 +61,23 @@ class AnalyticsService:
         wordcloud_connector: 'WordCloudConnector',
         filesystem_storage_driver: 'FilesystemStorageDriver',
         storage_connector: 'StorageConnector',
+        executor: AnalyticsExecutor | None = None,
+        batch_concurrency: int = Config.Batch.CONCURRENCY,
     ) -> None:
         """
         Initialize the AnalyticsService with a WordCloudConnector.
 
         :param wordcloud_connector: An instance of WordCloudConnector.
+        :param executor: The executor calculating the analytics, one with the
+            default tokenizer and no worker processes if not given.
+        :param batch_concurrency: The maximum number of files of a batch
+            fetched, or sent to the word cloud service, at once.
         """
         self.wordcloud_connector = wordcloud_connector
         self.filesystem_storage_driver = filesystem_storage_driver
         self.storage_connector = storage_connector
+        self.executor = executor or AnalyticsExecutor(Tokenizer(), workers=0)
+        self.batch_concurrency = batch_concurrency
 
     async def _fetch_file_content(self, file_id: int) -> str | None:
         """
@@ -54,96 +95,375 @@ class AnalyticsService:
 
         return None
 
-    def _calculate_analytics(self, file_content: str) -> dict:
+    async def _calculate_analytics(self, *file_contents: str) -> list[dict]:
         """
-        Calculate analytics from the file content.
+        Calculate analytics from the file contents.
+
+        Words are counted as whole tokens in a single pass over the content.
+        Large contents are analyzed in a worker process, so the event loop
+        keeps serving other requests meanwhile.
 
+        :param file_contents: The contents of the files.
+        :return: A dictionary containing analytics results, for each file.
+        :raises HTTPException: If the analysis did not complete in time.
+        """
+        try:
+            if len(file_contents) == 1:
+                return [await self.executor.calculate(file_contents[0])]
+            return await self.executor.calculate_batch(file_contents)
+        except TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Analysis did not complete in time.",
+            )
+
+    async def _generate_wordcloud(self, file_id: int, file_content: str) -> str | None:
+        """
+        Generate and store the word cloud image of a file.
+
+        An image left by an earlier attempt, e.g. of a retried job, is reused.
+        Images are written atomically, so an existing one is complete.
+
+        :param file_id: The ID of the file.
         :param file_content: The content of the file.
-        :return: A dictionary containing analytics results.
+        :return: The path of the image, or None if the word cloud service is
+            unreachable.
         """
-        # Example analytics calculation
-        word_count = len(file_content.split())
-        words_rates = {
-            word: file_content.count(word) / word_count
-            for word in set(file_content.split())
-        }
-        unique_words = len(words_rates)
+        wordcloud_path = f"{file_id}/wordcloud.png"
+        if await self.filesystem_storage_driver.exists(wordcloud_path):
+            return wordcloud_path
 
-        return {
-            "word_count": word_count,
-            "words_rates": words_rates,
-            "unique_words": unique_words,
-        }
+        try:
+            wordcloud_image = await self.wordcloud_connector.generate_wordcloud(
+                file_content
+            )
+        except ConnectError:
+            return None
+
+        # Save the word cloud image to the filesystem, replacing the image of
+        # a concurrent generation, e.g. by a batch and a job at once
+        await self.filesystem_storage_driver.upload(
+            wordcloud_path, wordcloud_image, overwrite=True
+        )
+        return wordcloud_path
 
-    async def analyze_file(self, file_id: int) -> analytics_models.Analytics:
+    @staticmethod
+    def _to_model(
+        analytics: dict, wordcloud_path: str | None
+    ) -> analytics_models.Analytics:
+        return analytics_models.Analytics(
+            word_count=analytics.get("word_count", 0),
+            words_rates=analytics.get("words_rates", {}),
+            unique_words=analytics.get("unique_words", 0),
+            wordcloud_path=wordcloud_path,
+        )
+
+    async def run_analysis(self, file_id: int) -> tuple[dict, str | None]:
         """
-        Analyze the uploaded file and return the result.
+        Fetch and analyze a file, and generate its word cloud.
 
         :param file_id: The ID of the file to analyze.
-        :return: An Analytics object containing the results.
+        :return: The analytics of the file and the path of its word cloud
+            image, if generated.
+        :raises HTTPException: If the file is not found or not a text, or if
+            the analysis did not complete in time.
+        """
+        # Fetch the file content from the storage connector
+        try:
+            file_content = await self._fetch_file_content(file_id)
+        except HTTPStatusError as exc:
+            if exc.response.status_code != status.HTTP_404_NOT_FOUND:
+                raise
+            file_content = None
+
+        if not file_content:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="File not found or unsupported file type.",
+            )
+
+        # Generate word cloud
+        wordcloud_path = await self._generate_wordcloud(file_id, file_content)
+
+        # Calculate analytics
+        with tracer.start_as_current_span(
+            "analytics.calculate", attributes={"text.length": len(file_content)}
+        ):
+            [analytics] = await self._calculate_analytics(file_content)
+
+        return analytics, wordcloud_path
+
+    def _to_job_model(
+        self, analytics_result: AnalyticsResult
+    ) -> analytics_models.AnalyticsJob:
+        analytics = None
+        if analytics_result.status == JobStatus.COMPLETED:
+            analytics = self._to_model(
+                analytics_result.result, analytics_result.wordcloud_path
+            )
+        return analytics_models.AnalyticsJob(
+            id=analytics_result.id,
+            file_id=analytics_result.file_id,
+            status=analytics_result.status,
+            attempts=analytics_result.attempts,
+            error=analytics_result.error,
+            created_at=analytics_result.created_at,
+            updated_at=analytics_result.updated_at,
+            analytics=analytics,
+        )
+
+    async def analyze_file(self, file_id: int) -> analytics_models.Analytics | Response:
+        """
+        Queue the analysis of a file, or return its result if analyzed.
+
+        The file is analyzed by a job worker, whose progress is polled with
+        `get_job`. A failed analysis is queued again.
+
+        :param file_id: The ID of the file to analyze.
+        :return: An Analytics object containing the results, or a 202
+            response describing the job of the file.
+        """
+        analytics_result = await jobs.enqueue(file_id)
+        if analytics_result.status == JobStatus.COMPLETED:
+            return self._to_model(
+                analytics_result.result, analytics_result.wordcloud_path
+            )
+
+        job = self._to_job_model(analytics_result)
+        return JSONResponse(
+            content=job.model_dump(mode="json"),
+            status_code=status.HTTP_202_ACCEPTED,
+            headers={
+                "Location": f"/analytics/jobs/{job.id}",
+                "Retry-After": str(RETRY_AFTER),
+            },
+        )
+
+    async def get_job(self, job_id: int) -> analytics_models.AnalyticsJob:
+        """
+        Get the status of an analytics job.
+
+        :param job_id: The ID of the job.
+        :return: The job, with the analytics results once completed.
+        """
+        analytics_result = await jobs.get(job_id)
+        if analytics_result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Analytics job not found."
+            )
+        return self._to_job_model(analytics_result)
+
+    async def analyze_files(
+        self, file_ids: list[int]
+    ) -> list[analytics_models.BatchAnalyticsResult]:
+        """
+        Analyze many files at once.
+
+        Completed results are looked up with a single query. The other files
+        are fetched and their word clouds generated concurrently, then they
+        are analyzed together by the vectorized engine, and their results are
+        upserted with a single statement, completing their jobs if queued,
+        and added to the corpus.
+
+        :param file_ids: The IDs of the files to analyze.
+        :return: The results, or the reason a file could not be analyzed, in
+            the order of `file_ids`.
         """
+        unique_ids = list(dict.fromkeys(file_ids))
         async with Session() as session:
-            query = select(AnalyticsResult).where(AnalyticsResult.file_id == file_id)
-            result = await session.execute(query)
-            analytics_result = result.scalar_one_or_none()
+            stored = {
+                result.file_id: result
+                for result in await session.scalars(
+                    select(AnalyticsResult).where(
+                        AnalyticsResult.file_id.in_(unique_ids),
+                        AnalyticsResult.status == JobStatus.COMPLETED,
+                    )
+                )
+            }
+        results = {
+            file_id: analytics_models.BatchAnalyticsResult(
+                file_id=file_id,
+                analytics=self._to_model(result.result, result.wordcloud_path),
+            )
+            for file_id, result in stored.items()
+        }
 
-            analytics: dict | None = None
-            wordcloud_path: str | None = None
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
 
-            if analytics_result is None:
-                # Fetch the file content from the storage connector
-                file_content = await self._fetch_file_content(file_id)
+        async def fetch(file_id: int) -> str | None:
+            async with semaphore:
+                return await self._fetch_file_content(file_id)
+
+        missing_ids = [file_id for file_id in unique_ids if file_id not in stored]
+        contents = await asyncio.gather(
+            *(fetch(file_id) for file_id in missing_ids), return_exceptions=True
+        )
 
-                if not file_content:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="File not found or unsupported file type.",
+        texts: dict[int, str] = {}
+        for file_id, content in zip(missing_ids, contents):
+            if isinstance(content, str) and content:
+                texts[file_id] = content
+                continue
+
+            error = "File not found or unsupported file type."
+            if isinstance(content, BaseException):
+                if not isinstance(content, Exception):
+                    raise content
+                if not (
+                    isinstance(content, HTTPStatusError)
+                    and content.response.status_code == status.HTTP_404_NOT_FOUND
+                ):
+                    logger.opt(exception=content).warning(
+                        f"Could not fetch file {file_id} for analysis"
                     )
+                    error = "File could not be fetched from storage."
+            results[file_id] = analytics_models.BatchAnalyticsResult(
+                file_id=file_id, error=error
+            )
+
+        if texts:
+
+            async def generate(file_id: int, file_content: str) -> str | None:
+                async with semaphore:
+                    return await self._generate_wordcloud(file_id, file_content)
 
-                # Generate word cloud
-                try:
-                    wordcloud_image = await self.wordcloud_connector.generate_wordcloud(
-                        file_content
+            generated = await asyncio.gather(
+                *(generate(file_id, content) for file_id, content in texts.items()),
+                return_exceptions=True,
+            )
+            wordcloud_paths: list[str | None] = []
+            for file_id, wordcloud_path in zip(list(texts), generated):
+                if isinstance(wordcloud_path, BaseException):
+                    if not isinstance(wordcloud_path, Exception):
+                        raise wordcloud_path
+                    # The file is left out, the others are still analyzed
+                    logger.opt(exception=wordcloud_path).warning(
+                        f"Could not generate the word cloud of file {file_id}"
                     )
-                except ConnectError as e:
-                    pass
-                else:
-                    # Save the word cloud image to the filesystem
-                    wordcloud_path = f"{file_id}/wordcloud.png"
-                    await self.filesystem_storage_driver.upload(
-                        wordcloud_path, wordcloud_image
+                    del texts[file_id]
+                    results[file_id] = analytics_models.BatchAnalyticsResult(
+                        file_id=file_id, error="Word cloud could not be generated."
                     )
+                    continue
+                wordcloud_paths.append(wordcloud_path)
 
-                # Calculate analytics
-                analytics = self._calculate_analytics(file_content)
+        if texts:
+            with tracer.start_as_current_span(
+                "analytics.calculate_batch",
+                attributes={
+                    "batch.files": len(texts),
+                    "text.length": sum(map(len, texts.values())),
+                },
+            ):
+                analytics = await self._calculate_analytics(*texts.values())
 
-                session.begin()
-                # Create a new analytics result entry
-                analytics_result = AnalyticsResult(
-                    file_id=file_id,
-                    result=analytics,
-                    wordcloud_path=wordcloud_path,
-                    status="completed",
+            rows = []
+            for file_id, file_analytics, wordcloud_path in zip(
+                texts, analytics, wordcloud_paths
+            ):
+                result, word_counts = split_counts(file_analytics)
+                rows.append(
+                    {
+                        "file_id": file_id,
+                        "result": result,
+                        "word_counts": word_counts,
+                        "wordcloud_path": wordcloud_path,
+                        "status": JobStatus.COMPLETED,
+                    }
                 )
-                session.add(analytics_result)
-                await session.commit()
-            else:
-                analytics = analytics_result.result
-                wordcloud_path = analytics_result.wordcloud_path
-
-            return analytics_models.Analytics(
-                word_count=analytics.get("word_count", 0),
-                words_rates=analytics.get("words_rates", {}),
-                unique_words=analytics.get("unique_words", 0),
-                wordcloud_path=wordcloud_path,
-            )
+            statement = insert(AnalyticsResult).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=[AnalyticsResult.file_id],
+                set_={
+                    "result": statement.excluded.result,
+                    "word_counts": statement.excluded.word_counts,
+                    "wordcloud_path": statement.excluded.wordcloud_path,
+                    "status": statement.excluded.status,
+                    "error": None,
+                    "updated_at": func.now(),
+                },
+                # Completed meanwhile, e.g. by a job, and already in the corpus
+                where=AnalyticsResult.status != JobStatus.COMPLETED,
+            ).returning(AnalyticsResult.id)
+            async with Session.begin() as session:
+                completed = (await session.scalars(statement)).all()
+                await add_to_corpus(session, completed)
+
+            for row in rows:
+                results[row["file_id"]] = analytics_models.BatchAnalyticsResult(
+                    file_id=row["file_id"],
+                    analytics=self._to_model(row["result"], row["wordcloud_path"]),
+                )
+
+        return [results[file_id] for file_id in file_ids]
 
-    async def download_wordcloud(self, file_path: str) -> Response:
+    @staticmethod
+    def _to_aggregate_model(
+        counts: WordCounts, missing_ids: list[int] | None = None
+    ) -> analytics_models.AggregateAnalytics:
+        return analytics_models.AggregateAnalytics(
+            files=counts.files,
+            missing_ids=missing_ids or [],
+            word_count=counts.word_count,
+            unique_words=counts.unique_words,
+            words_counts=counts.counts,
+            words_rates={
+                word: count / counts.word_count for word, count in counts.counts.items()
+            },
+        )
+
+    async def aggregate_files(
+        self, file_ids: list[int], limit: int | None = None
+    ) -> analytics_models.AggregateAnalytics:
+        """
+        Aggregate the analytics of many files.
+
+        The stored word counts of the files are summed by the database, the
+        files are neither fetched nor analyzed again.
+
+        :param file_ids: The IDs of the files.
+        :param limit: The number of most frequent words returned, all of them
+            by default.
+        :return: The analytics of the files as a whole, and the IDs of those
+            not analyzed yet.
+        """
+        unique_ids = list(dict.fromkeys(file_ids))
+        with tracer.start_as_current_span(
+            "analytics.aggregate", attributes={"aggregate.files": len(unique_ids)}
+        ):
+            found, counts = await merge_counts(unique_ids, limit)
+        found = set(found)
+        missing_ids = [file_id for file_id in unique_ids if file_id not in found]
+        return self._to_aggregate_model(counts, missing_ids)
+
+    async def get_corpus(
+        self, limit: int | None = None
+    ) -> analytics_models.AggregateAnalytics:
+        """
+        Get the analytics of all the analyzed files.
+
+        They are maintained as each file is analyzed, so reading them does
+        not depend on the number of files.
+
+        :param limit: The number of most frequent words returned, all of them
+            by default.
+        :return: The analytics of all the files as a whole.
+        """
+        return self._to_aggregate_model(await corpus_counts(limit))
+
+    async def download_wordcloud(
+        self, file_path: str, if_none_match: str | None = None
+    ) -> Response:
         """
         Download the word cloud image.
 
+        The image of an analytics result is written once, so its ETag is
+        derived from the result and a matching If-None-Match is answered
+        without reading the image.
+
         :param file_path: The path to the word cloud image.
-        :return: A FileResponse containing the word cloud image.
+        :param if_none_match: The value of the If-None-Match header, if any.
+        :return: A FileResponse containing the word cloud image, or a 304.
         """
         logger.info(f"Downloading word cloud image from {file_path}")
         async with Session() as session:
@@ -158,14 +478,26 @@ class AnalyticsService:
                     detail="Word cloud image not found.",
                 )
 
+            headers = {
+                "ETag": f'"wordcloud-{analytics_result.id}"',
+                "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            }
+            if if_none_match is not None and etag_matches(
+                if_none_match, headers["ETag"]
+            ):
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+                )
+
             if not await self.filesystem_storage_driver.exists(file_path):
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Word cloud image not found.",
                 )
 
+            headers["Content-Disposition"] = "attachment; filename=wordcloud.png"
             return Response(
                 content=await self.filesystem_storage_driver.download(file_path),
                 media_type="image/png",
-                headers={"Content-Disposition": "attachment; filename=wordcloud.png"},
+                headers=headers,
             )
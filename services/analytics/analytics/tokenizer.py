@@ -0,0 +1,230 @@
+"""
+Tokenization and counting of the words of a text, in a single pass.
+
+The text is processed in chunks cut at whitespace, each one normalized, split
+into tokens and tallied into a Counter by C code, so the time is linear in
+the size of the text and the memory is bounded by the chunk size and the
+vocabulary, never by the number of tokens.
+
+Usage::
+
+    python -m analytics.tokenizer [--sizes 1K 1M 100M 1G]
+"""
+
+import argparse
+import random
+import re
+import time
+import unicodedata
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from typing import Literal
+
+from analytics.config import Config
+
+
+# Characters processed at once, large enough for the per chunk overhead to
+# vanish and small enough for the normalized copies to stay cheap
+CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r"\s")
+# Runs of letters and digits, with inner apostrophes and hyphens kept, as in
+# "don't" or "well-known"
+_WORD = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+
+Normalization = Literal["NFC", "NFD", "NFKC", "NFKD"]
+
+
+class Tokenizer:
+    """
+    Splits texts into tokens and counts whole tokens.
+
+    Subclasses may override `split` to change what a token is, the chunking,
+    normalization and stopwords are applied around it.
+    """
+
+    def __init__(
+        self,
+        normalization: Normalization | None = "NFKC",
+        case_fold: bool = True,
+        strip_punctuation: bool = True,
+        stopwords: Iterable[str] = (),
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        """
+        Initialize the tokenizer.
+
+        :param normalization: The Unicode normalization form applied to the
+            text, or None to keep it as is.
+        :param case_fold: Whether to fold the case of the text, so "The" and
+            "the" are the same token.
+        :param strip_punctuation: Whether tokens are words without their
+            surrounding punctuation, otherwise any run of non whitespace.
+        :param stopwords: The tokens left out of the counts. They are
+            normalized like the text.
+        :param chunk_size: The approximate number of characters processed at
+            once.
+        """
+        self.normalization = normalization
+        self.case_fold = case_fold
+        self.strip_punctuation = strip_punctuation
+        self.chunk_size = chunk_size
+        self.stopwords = frozenset(
+            token for word in stopwords for token in self.split(self.normalize(word))
+        )
+
+    def normalize(self, text: str) -> str:
+        """
+        Normalize a text before it is split.
+
+        :param text: The text.
+        :return: The normalized and case folded text.
+        """
+        if self.normalization is not None:
+            text = unicodedata.normalize(self.normalization, text)
+        if self.case_fold:
+            text = text.casefold()
+        return text
+
+    def split(self, text: str) -> list[str]:
+        """
+        Split a normalized text into tokens.
+
+        :param text: The normalized text.
+        :return: The tokens, stopwords included.
+        """
+        if self.strip_punctuation:
+            return _WORD.findall(text)
+        return text.split()
+
+    def chunks(self, text: str) -> Iterator[str]:
+        """
+        Cut a text into chunks at whitespace, so no token spans two chunks.
+
+        :param text: The text.
+        :return: An iterator over the chunks.
+        """
+        start = 0
+        while start < len(text):
+            end = start + self.chunk_size
+            if end < len(text):
+                match = _WHITESPACE.search(text, end)
+                end = match.start() if match else len(text)
+            yield text[start:end]
+            start = end
+
+    def tokenize(self, text: str) -> Iterator[str]:
+        """
+        Tokenize a text.
+
+        :param text: The text.
+        :return: An iterator over the tokens, stopwords excluded.
+        """
+        for chunk in self.chunks(text):
+            for token in self.split(self.normalize(chunk)):
+                if token not in self.stopwords:
+                    yield token
+
+    def count(self, text: str, check: Callable[[], None] | None = None) -> Counter[str]:
+        """
+        Count the occurrences of every token of a text.
+
+        :param text: The text.
+        :param check: A function called before each chunk, which may raise to
+            abort the counting.
+        :return: The number of occurrences of each token, stopwords excluded.
+        """
+        counts: Counter[str] = Counter()
+        for chunk in self.chunks(text):
+            if check is not None:
+                check()
+            counts.update(self.split(self.normalize(chunk)))
+        # Cheaper than filtering every token, there are far fewer stopwords
+        for stopword in self.stopwords:
+            counts.pop(stopword, None)
+        return counts
+
+
+def create_tokenizer(config: type[Config] = Config) -> Tokenizer:
+    """
+    Create the tokenizer from the configuration.
+
+    :param config: The configuration object.
+    :return: The tokenizer.
+    """
+    stopwords = list(config.Tokenizer.STOPWORDS)
+    if config.Tokenizer.STOPWORDS_FILE:
+        with open(config.Tokenizer.STOPWORDS_FILE, encoding="utf-8") as file:
+            stopwords.extend(line.strip() for line in file if line.strip())
+
+    return Tokenizer(
+        normalization=config.Tokenizer.NORMALIZATION or None,
+        case_fold=config.Tokenizer.CASE_FOLD,
+        strip_punctuation=config.Tokenizer.STRIP_PUNCTUATION,
+        stopwords=stopwords,
+    )
+
+
+def _parse_size(size: str) -> int:
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    if size[-1].upper() in units:
+        return int(float(size[:-1]) * units[size[-1].upper()])
+    return int(size)
+
+
+def _sample_text(size: int, vocabulary: int = 50_000) -> str:
+    # Zipf distributed words, with capitalized, punctuated and non ASCII ones
+    rng = random.Random(0)
+    words = [f"w{i}" for i in range(vocabulary)]
+    for i in range(0, vocabulary, 7):
+        words[i] = words[i].capitalize() + rng.choice(",.;:!?")
+    for i in range(3, vocabulary, 11):
+        words[i] += rng.choice(["é", "ß", "ﬁ", "ö"])
+    weights = [1 / rank for rank in range(1, vocabulary + 1)]
+
+    # A few MB of random text, repeated up to the requested size
+    sample = " ".join(rng.choices(words, weights, k=min(size, 4 << 20) // 6 + 1))
+    text = (sample + "\n") * (size // (len(sample) + 1) + 1)
+    return text[:size]
+
+
+def benchmark(sizes: Iterable[int], tokenizer: Tokenizer | None = None) -> None:
+    """
+    Print the time taken to count the tokens of texts of increasing sizes.
+
+    The time per MB stays flat when the counting is linear.
+
+    :param sizes: The sizes of the texts, in characters.
+    :param tokenizer: The tokenizer, the configured one by default.
+    """
+    tokenizer = tokenizer or create_tokenizer()
+    print(f"{'size':>12} {'tokens':>12} {'unique':>9} {'seconds':>9} {'s/MB':>9}")
+    for size in sizes:
+        text = _sample_text(size)
+        start = time.perf_counter()
+        counts = tokenizer.count(text)
+        elapsed = time.perf_counter() - start
+        per_mb = elapsed / (size / 1024**2)
+        print(
+            f"{size:>12} {counts.total():>12} {len(counts):>9}"
+            f" {elapsed:>9.3f} {per_mb:>9.4f}"
+        )
+        del text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the tokenizer on texts of increasing sizes."
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=["1K", "1M", "10M", "100M", "1G"],
+        help="text sizes, with an optional K, M or G suffix",
+    )
+    args = parser.parse_args()
+    benchmark([_parse_size(size) for size in args.sizes])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Distributed tracing of the service with OpenTelemetry.
+
+The W3C ``traceparent`` header of incoming requests is continued by a pure
+ASGI middleware and propagated to the storage and word cloud services by an
+httpx transport wrapper. Database queries and the analysis itself are
+recorded as child spans. Spans are exported to a JSON lines file, readable
+offline with the report of the gateway, or to an OTLP collector.
+"""
+
+import json
+from collections.abc import Sequence
+from pathlib import Path
+from threading import Lock
+
+import httpx
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from analytics.config import Config
+
+
+SERVICE_NAME = "analytics"
+
+tracer = trace.get_tracer(SERVICE_NAME)
+
+
+class JsonFileSpanExporter(SpanExporter):
+    """
+    Exporter appending spans to a file, one JSON object per line.
+
+    Each batch is written with a single call on a file opened for appending,
+    so several processes may share the file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: The path of the file.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+
+    @staticmethod
+    def _to_dict(span: ReadableSpan) -> dict:
+        parent = span.parent
+        return {
+            "service": span.resource.attributes.get("service.name"),
+            "trace_id": f"{span.context.trace_id:032x}",
+            "span_id": f"{span.context.span_id:016x}",
+            "parent_id": f"{parent.span_id:016x}" if parent else None,
+            "name": span.name,
+            "kind": span.kind.name,
+            "start": span.start_time,
+            "end": span.end_time,
+            "status": span.status.status_code.name,
+            "attributes": dict(span.attributes or {}),
+        }
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(
+            json.dumps(self._to_dict(span), default=str) + "\n" for span in spans
+        )
+        try:
+            with self._lock, self.path.open("a", encoding="utf-8") as file:
+                file.write(lines)
+        except OSError:
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+
+def setup_tracing(config: type[Config] = Config) -> TracerProvider | None:
+    """
+    Install the tracer provider of the service from the configuration.
+
+    :param config: The configuration object.
+    :return: The provider, to be shut down on exit, or None if tracing is
+        disabled.
+    :raises ValueError: If the exporter is unknown.
+    """
+    match config.Tracing.EXPORTER:
+        case "none" | "":
+            return None
+        case "jsonl":
+            exporter = JsonFileSpanExporter(config.Tracing.FILE)
+        case "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,  # lazy import, optional dependency
+            )
+
+            exporter = OTLPSpanExporter(endpoint=config.Tracing.OTLP_ENDPOINT or None)
+        case _:
+            raise ValueError(f"Unsupported tracing exporter: {config.Tracing.EXPORTER}")
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(config.Tracing.SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware wrapping each HTTP request in a server span.
+
+    The span continues the trace of the ``traceparent`` request header, if
+    any, and lasts until the response is completely sent.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name in (b"traceparent", b"tracestate")
+        }
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with tracer.start_as_current_span(
+            method,
+            context=propagate.extract(carrier),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"]},
+        ) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path_format", None)
+                if route is not None:
+                    span.update_name(f"{method} {route}")
+                    span.set_attribute("http.route", route)
+                span.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapping each request to an upstream service in a client span,
+    and propagating the trace to it with the ``traceparent`` header.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, upstream: str) -> None:
+        """
+        :param transport: The wrapped transport, sending the requests.
+        :param upstream: The name of the upstream service.
+        """
+        self.transport = transport
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with tracer.start_as_current_span(
+            f"{request.method} {self.upstream}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "http.request.method": request.method,
+                "url.full": str(request.url),
+                "peer.service": self.upstream,
+            },
+        ) as span:
+            propagate.inject(request.headers)
+            response = await self.transport.handle_async_request(request)
+            span.set_attribute("http.response.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.set_status(Status(StatusCode.ERROR))
+            return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def trace_engine(engine: AsyncEngine) -> None:
+    """
+    Record the queries of a database engine as client spans.
+
+    :param engine: The database engine.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(
+        connection, cursor, statement, parameters, context, executemany
+    ) -> None:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+        context._span = tracer.start_span(
+            operation or "query",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": engine.dialect.name,
+                "db.operation.name": operation,
+                "db.query.text": statement,
+            },
+        )
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(
+        connection, cursor, statement, parameters, context, executemany
+    ) -> None:
+        span = getattr(context, "_span", None)
+        if span is not None:
+            span.end()
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(exception_context) -> None:
+        span = getattr(exception_context.execution_context, "_span", None)
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
@@ -0,0 +1,225 @@
+"""
+Workers running the analytics jobs queued in the database.
+
+The service runs workers itself, and more can be started in separate
+processes, on any host reaching the database and the upstream services, to
+scale the throughput. Each worker claims a job, analyzes its file and stores
+the result, and retries failed jobs with an exponential backoff.
+
+Usage::
+
+    python -m analytics.worker [--concurrency 4]
+"""
+
+import argparse
+import asyncio
+import signal
+
+from fastapi import HTTPException
+from loguru import logger
+
+from analytics import jobs
+from analytics.clients import UpstreamClients
+from analytics.config import Config
+from analytics.executor import AnalyticsExecutor, create_executor
+from analytics.services.analytics import AnalyticsService
+from analytics.tokenizer import create_tokenizer
+from analytics.tracing import setup_tracing, tracer
+
+
+class JobWorker:
+    """
+    Runs analytics jobs from the queue, a number of them at once.
+    """
+
+    def __init__(
+        self,
+        analytics_service: AnalyticsService,
+        concurrency: int = Config.Jobs.CONCURRENCY,
+        poll_interval: float = Config.Jobs.POLL_INTERVAL,
+        max_attempts: int = Config.Jobs.MAX_ATTEMPTS,
+        retry_delay: float = Config.Jobs.RETRY_DELAY,
+        lease: float = Config.Jobs.LEASE,
+    ) -> None:
+        """
+        Initialize the worker.
+
+        :param analytics_service: The service analyzing the files.
+        :param concurrency: The number of jobs run at once.
+        :param poll_interval: The number of seconds between polls of the
+            queue while it is empty.
+        :param max_attempts: The number of attempts of a job before it fails
+            for good.
+        :param retry_delay: The number of seconds before the first retry of a
+            job, doubled at each attempt.
+        :param lease: The number of seconds a job is leased to the worker.
+        """
+        self.analytics_service = analytics_service
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        """
+        Start running jobs, in the background.
+        """
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"analytics-job-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        """
+        Stop running jobs. The interrupted jobs are given back to the queue.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job = await jobs.claim(self.lease)
+                if job is None:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # E.g. the database is unreachable, a claimed job is claimed
+                # again once its lease expires
+                logger.exception("Analytics job worker failed, resuming.")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _process(self, job: jobs.Job) -> None:
+        with tracer.start_as_current_span(
+            "analytics.job",
+            attributes={
+                "job.id": job.id,
+                "job.attempt": job.attempts,
+                "file.id": job.file_id,
+            },
+        ):
+            if job.attempts > self.max_attempts:
+                # Its workers died or lost their lease every time
+                await jobs.fail(job, "The analysis was interrupted too many times.")
+                return
+
+            try:
+                analytics, wordcloud_path = await self.analytics_service.run_analysis(
+                    job.file_id
+                )
+            except asyncio.CancelledError:
+                await jobs.release(job)
+                raise
+            except HTTPException as exc:
+                if exc.status_code < 500:
+                    # The file cannot be analyzed, retrying would not help
+                    await jobs.fail(job, exc.detail)
+                    return
+                await self._retry(job, exc.detail)
+                return
+            except Exception as exc:
+                logger.opt(exception=exc).warning(
+                    f"Analytics job {job.id} of file {job.file_id} failed"
+                )
+                await self._retry(job, f"Analysis failed: {type(exc).__name__}.")
+                return
+
+            if not await jobs.complete(job, analytics, wordcloud_path):
+                logger.warning(f"Analytics job {job.id} lost its lease, result dropped")
+
+    async def _retry(self, job: jobs.Job, error: str) -> None:
+        if job.attempts >= self.max_attempts:
+            await jobs.fail(job, error)
+            return
+        await jobs.fail(job, error, retry_in=self.retry_delay * 2 ** (job.attempts - 1))
+
+
+def create_worker(
+    clients: UpstreamClients,
+    executor: AnalyticsExecutor,
+    config: type[Config] = Config,
+    concurrency: int | None = None,
+) -> JobWorker:
+    """
+    Create a job worker from the configuration.
+
+    :param clients: The pooled clients of the upstream services.
+    :param executor: The executor calculating the analytics.
+    :param config: The configuration object.
+    :param concurrency: The number of jobs run at once, the configured one
+        by default.
+    :return: The worker, to be started.
+    """
+    from analytics.connectors.storage import StorageConnector
+    from analytics.connectors.wordcloud import WordCloudConnector
+    from analytics.fs.filesystem import FilesystemStorageDriver
+
+    analytics_service = AnalyticsService(
+        wordcloud_connector=WordCloudConnector(wordcloud_client=clients.wordcloud),
+        filesystem_storage_driver=FilesystemStorageDriver(
+            base_path=config.Filesystem.BASE_PATH
+        ),
+        storage_connector=StorageConnector(clients.storage),
+        executor=executor,
+    )
+    return JobWorker(
+        analytics_service,
+        concurrency=concurrency or config.Jobs.CONCURRENCY,
+        poll_interval=config.Jobs.POLL_INTERVAL,
+        max_attempts=config.Jobs.MAX_ATTEMPTS,
+        retry_delay=config.Jobs.RETRY_DELAY,
+        lease=config.Jobs.LEASE,
+    )
+
+
+async def serve(concurrency: int | None = None) -> None:
+    """
+    Run jobs until the process is interrupted or terminated.
+
+    :param concurrency: The number of jobs run at once, the configured one
+        by default.
+    """
+    tracer_provider = setup_tracing()
+    clients = UpstreamClients()
+    executor = create_executor(create_tokenizer())
+    worker = create_worker(clients, executor, concurrency=concurrency)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    worker.start()
+    logger.info(f"Analytics job worker started, running {worker.concurrency} jobs.")
+    try:
+        await stopping.wait()
+    finally:
+        logger.info("Stopping the analytics job worker.")
+        await worker.stop()
+        executor.shutdown()
+        await clients.aclose()
+        if tracer_provider is not None:
+            tracer_provider.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the queued analytics jobs.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="number of jobs run at once (default: JOBS_CONCURRENCY)",
+    )
+    args = parser.parse_args()
+    asyncio.run(serve(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
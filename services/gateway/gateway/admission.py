@@ -0,0 +1,450 @@
+"""
+Admission control of the incoming requests.
+
+Requests are first charged to a token bucket of their client, then to the
+concurrency limit of their route, if any. A route at its limit lets a bounded
+number of requests wait for a slot, and sheds the others. Rejected requests
+get a 429 with a Retry-After header instead of queueing without bound.
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from math import ceil
+from time import monotonic
+
+from loguru import logger
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from gateway.config import Config
+
+
+class Rejected(Exception):
+    """
+    Raised when a request is not admitted.
+    """
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage of the token buckets of the clients.
+    """
+
+    @abstractmethod
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take a token from a bucket.
+
+        :param key: The key of the bucket.
+        :param rate: The number of tokens added per second.
+        :param burst: The capacity of the bucket.
+        :return: 0 if a token was taken, otherwise the number of seconds
+            until one is available.
+        """
+
+    async def aclose(self) -> None:
+        """
+        Release the resources of the backend.
+        """
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets kept in memory, private to each gateway instance.
+    """
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        """
+        :param max_keys: The maximum number of buckets kept, the least recently
+            used ones are dropped first.
+        """
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        now = monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets kept in Redis, shared by all gateway instances.
+
+    Each bucket is a hash updated atomically by a script, using the Redis
+    clock so that instances do not need synchronized clocks.
+    """
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+        return tostring(wait)
+    """
+
+    def __init__(
+        self, url: str, prefix: str = "gateway:ratelimit:", timeout: float = 0.25
+    ) -> None:
+        """
+        :param url: The URL of the Redis server.
+        :param prefix: The prefix of the bucket keys.
+        :param timeout: The maximum number of seconds to wait for Redis.
+        """
+        from redis.asyncio import Redis  # lazy import, optional dependency
+        from redis.exceptions import RedisError
+
+        self.prefix = prefix
+        self._redis = Redis.from_url(
+            url, socket_timeout=timeout, socket_connect_timeout=timeout
+        )
+        self._script = self._redis.register_script(self.SCRIPT)
+        self._errors = (RedisError, OSError)
+        self._failing = False
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        # Rate limiting fails open, an unavailable Redis must not take the
+        # whole gateway down with it
+        try:
+            wait = await self._script(keys=[self.prefix + key], args=[rate, burst])
+        except self._errors as e:
+            if not self._failing:
+                self._failing = True
+                logger.opt(exception=e).warning(
+                    "Redis rate limiting unavailable, admitting all requests"
+                )
+            return 0.0
+
+        if self._failing:
+            self._failing = False
+            logger.info("Redis rate limiting available again")
+        return float(wait)
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of requests of a route handled at once.
+
+    Requests beyond the limit wait for a slot in a queue of bounded size, and
+    for a bounded time. Requests finding the queue full are shed at once.
+    """
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float) -> None:
+        """
+        :param limit: The maximum number of requests handled at once.
+        :param queue_size: The maximum number of requests waiting for a slot.
+        :param queue_timeout: The maximum number of seconds a request waits.
+        """
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self.timed_out = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold a slot while handling a request.
+
+        :raises Rejected: If the queue is full or no slot frees up in time.
+        """
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self.shed += 1
+                raise Rejected("queue_full", self.queue_timeout)
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except TimeoutError:
+                self.timed_out += 1
+                raise Rejected("queue_timeout", self.queue_timeout)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "queue_size": self.queue_size,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class RouteLimit:
+    method: str
+    path_prefix: str
+    limiter: ConcurrencyLimiter
+
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and path.startswith(self.path_prefix)
+
+
+def parse_route_limits(value: str, queue_timeout: float) -> list[RouteLimit]:
+    """
+    Parse the route concurrency limits from the configuration.
+
+    :param value: Comma separated limits, each as "METHOD /path/prefix=LIMIT:QUEUE",
+        e.g. "POST /analytics/=16:64".
+    :param queue_timeout: The maximum number of seconds a request waits.
+    :return: The route limits, in configuration order.
+    :raises ValueError: If a limit is malformed.
+    """
+    limits = []
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        route, _, sizes = item.partition("=")
+        method, _, path_prefix = route.strip().partition(" ")
+        limit, _, queue_size = sizes.partition(":")
+        if not path_prefix or not limit:
+            raise ValueError(f"Invalid route limit: {item}")
+
+        limits.append(
+            RouteLimit(
+                method=method.upper(),
+                path_prefix=path_prefix.strip(),
+                limiter=ConcurrencyLimiter(
+                    int(limit), int(queue_size or 0), queue_timeout
+                ),
+            )
+        )
+    return limits
+
+
+class AdmissionController:
+    """
+    Decides which requests are handled, shared by all requests of the
+    application.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        rate: float,
+        burst: int,
+        route_limits: list[RouteLimit],
+        exempt_paths: tuple[str, ...] = (),
+        client_header: str | None = None,
+        trusted_proxies: int = 1,
+    ) -> None:
+        """
+        :param backend: The storage of the client token buckets.
+        :param rate: The number of requests per second allowed to each client,
+            0 disables rate limiting.
+        :param burst: The number of requests a client may send at once.
+        :param route_limits: The concurrency limits of the routes.
+        :param exempt_paths: The path prefixes never limited.
+        :param client_header: The request header identifying the client, e.g.
+            X-Forwarded-For behind a proxy. The peer address is used if None.
+        :param trusted_proxies: The number of proxies in front of the gateway
+            appending to the client header.
+        """
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.route_limits = route_limits
+        self.exempt_paths = exempt_paths
+        self.client_header = client_header.lower().encode() if client_header else None
+        self.trusted_proxies = max(trusted_proxies, 1)
+        self.admitted = 0
+        self.rate_limited = 0
+
+    def client(self, scope: Scope) -> str:
+        """
+        Identify the client of a request.
+
+        Only the addresses appended by the trusted proxies are used, counted
+        from the right of the client header. The ones before are sent by the
+        client, which could otherwise pick a fresh bucket for every request.
+
+        :param scope: The ASGI scope of the request.
+        :return: The client identifier.
+        """
+        if self.client_header is not None:
+            addresses = [
+                address.strip()
+                for name, value in scope["headers"]
+                if name == self.client_header
+                for address in value.decode("latin-1").split(",")
+            ]
+            addresses = [address for address in addresses if address]
+            if addresses:
+                # Appended by the outermost trusted proxy, unless the request
+                # went through fewer proxies
+                return addresses[-min(self.trusted_proxies, len(addresses))]
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    @asynccontextmanager
+    async def admit(self, scope: Scope) -> AsyncIterator[None]:
+        """
+        Admit a request for the time it is handled.
+
+        :param scope: The ASGI scope of the request.
+        :raises Rejected: If the request is not admitted.
+        """
+        path = scope["path"]
+        if path.startswith(self.exempt_paths):
+            yield
+            return
+
+        if self.rate > 0:
+            wait = await self.backend.acquire(self.client(scope), self.rate, self.burst)
+            if wait > 0:
+                self.rate_limited += 1
+                raise Rejected("rate_limited", wait)
+
+        route_limit = next(
+            (
+                limit
+                for limit in self.route_limits
+                if limit.matches(scope["method"], path)
+            ),
+            None,
+        )
+        if route_limit is None:
+            self.admitted += 1
+            yield
+            return
+
+        async with route_limit.limiter.slot():
+            self.admitted += 1
+            yield
+
+    async def aclose(self) -> None:
+        await self.backend.aclose()
+
+    def stats(self) -> dict[str, int | dict[str, dict[str, int]]]:
+        """
+        Get the admission counters.
+
+        :return: The number of admitted and rate limited requests, and the
+            usage of each route limit.
+        """
+        return {
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "routes": {
+                f"{limit.method} {limit.path_prefix}": limit.limiter.stats()
+                for limit in self.route_limits
+            },
+        }
+
+
+def create_admission_controller(config: type[Config] = Config) -> AdmissionController:
+    """
+    Create the admission controller from the configuration.
+
+    :param config: The configuration object.
+    :return: The admission controller.
+    """
+    if config.Admission.BACKEND == "redis":
+        backend = RedisRateLimitBackend(
+            config.Admission.REDIS_URL, timeout=config.Admission.REDIS_TIMEOUT
+        )
+    else:
+        backend = MemoryRateLimitBackend()
+
+    return AdmissionController(
+        backend=backend,
+        rate=config.Admission.RATE,
+        burst=config.Admission.BURST,
+        route_limits=parse_route_limits(
+            config.Admission.ROUTE_LIMITS, config.Admission.QUEUE_TIMEOUT
+        ),
+        exempt_paths=config.Admission.EXEMPT_PATHS,
+        client_header=config.Admission.CLIENT_HEADER or None,
+        trusted_proxies=config.Admission.TRUSTED_PROXIES,
+    )
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting HTTP requests through the AdmissionController
+    of the application, found in `app.state.admission`.
+
+    A request holds its route slot until its response is completely sent, so
+    streamed responses count against the limit for their whole duration.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = None
+        if scope["type"] == "http":
+            controller = getattr(scope["app"].state, "admission", None)
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            async with controller.admit(scope):
+                await self.app(scope, receive, send)
+        except Rejected as rejected:
+            logger.debug(f"Rejected {scope['method']} {scope['path']}: {rejected}")
+            await self._reject(send, rejected)
+
+    @staticmethod
+    async def _reject(send: Send, rejected: Rejected) -> None:
+        body = b"Too Many Requests. Please try again later."
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(ceil(rejected.retry_after), 1)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
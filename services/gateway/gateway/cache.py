@@ -0,0 +1,343 @@
+import asyncio
+import hashlib
+import json
+import os
+import struct
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import uuid4
+
+from fastapi import Response
+from loguru import logger
+
+from gateway.config import Config
+
+
+def analytics_cache_key(file_id: int) -> str:
+    return f"analytics/{file_id}"
+
+
+def wordcloud_cache_key(file_path: str) -> str:
+    return f"wordcloud/{file_path}"
+
+
+@dataclass(frozen=True, slots=True)
+class CachedResponse:
+    """
+    A complete upstream response, safe to share between requests.
+    """
+
+    status_code: int
+    headers: tuple[tuple[str, str], ...]
+    body: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+    def header(self, name: str) -> str | None:
+        """
+        Get the value of a header.
+
+        :param name: The case-insensitive name of the header.
+        :return: The first value of the header, or None if it is missing.
+        """
+        name = name.lower()
+        return next((v for k, v in self.headers if k.lower() == name), None)
+
+    def to_response(self) -> Response:
+        response = Response(content=self.body, status_code=self.status_code)
+        response.raw_headers = [
+            (key.lower().encode("latin-1"), value.encode("latin-1"))
+            for key, value in self.headers
+            if key.lower() != "content-length"
+        ] + [(b"content-length", str(len(self.body)).encode())]
+        return response
+
+    def dump(self, key: str) -> bytes:
+        header = json.dumps(
+            {"key": key, "status_code": self.status_code, "headers": self.headers}
+        ).encode()
+        return struct.pack(">I", len(header)) + header + self.body
+
+    @classmethod
+    def load(cls, data: bytes) -> tuple[str, 'CachedResponse']:
+        (header_size,) = struct.unpack_from(">I", data)
+        header = json.loads(data[4 : 4 + header_size])
+        return header["key"], cls(
+            status_code=header["status_code"],
+            headers=tuple((k, v) for k, v in header["headers"]),
+            body=data[4 + header_size :],
+        )
+
+
+class DiskTier:
+    """
+    Second cache tier keeping responses in files, bounded by their total size.
+
+    Each response is stored in a file named after the hash of its key, written
+    to a temporary file first and renamed, so readers never see a partial one.
+    The index is rebuilt from the directory on start, so the tier survives
+    restarts.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        """
+        Initialize the disk tier.
+
+        :param path: The directory holding the cached responses.
+        :param max_bytes: The maximum total size of the cached files.
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    def _file(self, key: str) -> Path:
+        return self.path / hashlib.sha256(key.encode()).hexdigest()
+
+    def _load_index(self) -> None:
+        entries = []
+        for file in self.path.iterdir():
+            if not file.is_file():
+                continue
+            try:
+                key, _ = CachedResponse.load(file.read_bytes())
+            except (OSError, ValueError, KeyError, struct.error):
+                logger.warning(f"Removing unreadable cache file {file}")
+                file.unlink(missing_ok=True)
+                continue
+            stat = file.stat()
+            entries.append((stat.st_mtime, key, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.size += size
+        logger.info(f"Loaded {len(self._index)} cached responses from {self.path}")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def keys(self) -> list[str]:
+        return list(self._index)
+
+    async def get(self, key: str) -> CachedResponse | None:
+        if key not in self._index:
+            return None
+
+        try:
+            data = await asyncio.to_thread(self._file(key).read_bytes)
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+
+        self._index.move_to_end(key)
+        return CachedResponse.load(data)[1]
+
+    async def put(self, key: str, response: CachedResponse) -> None:
+        data = response.dump(key)
+        if len(data) > self.max_bytes:
+            return
+
+        file = self._file(key)
+        temp_file = self.path / f".{uuid4().hex}.tmp"
+
+        def write() -> None:
+            temp_file.write_bytes(data)
+            os.replace(temp_file, file)
+
+        await asyncio.to_thread(write)
+        self._forget(key)
+        self._index[key] = len(data)
+        self.size += len(data)
+
+        while self.size > self.max_bytes:
+            await self.delete(next(iter(self._index)))
+
+    def _forget(self, key: str) -> None:
+        if (size := self._index.pop(key, None)) is not None:
+            self.size -= size
+
+    async def delete(self, key: str) -> None:
+        if key in self._index:
+            self._forget(key)
+            await asyncio.to_thread(self._file(key).unlink, missing_ok=True)
+
+
+class ResponseCache:
+    """
+    Cache of complete upstream responses, keyed by resource.
+
+    Responses are kept in a memory LRU bounded by their total size, and in an
+    optional disk tier written through on every store. A memory miss falls
+    back to the disk tier, whose hits are promoted back to memory.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_entry_bytes: int,
+        disk: DiskTier | None = None,
+        encoding: str | None = None,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        :param max_bytes: The maximum total size of the responses kept in
+            memory, 0 disables the memory tier.
+        :param max_entry_bytes: The maximum size of a single response, larger
+            ones are not cached.
+        :param disk: The disk tier, if any.
+        :param encoding: The content coding responses are requested with before
+            being cached, or None to cache them unencoded.
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.disk = disk
+        self.encoding = encoding
+        self.size = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+
+    def _remove(self, key: str) -> None:
+        if (response := self._entries.pop(key, None)) is not None:
+            self.size -= response.size
+
+    def _store(self, key: str, response: CachedResponse) -> None:
+        if response.size > self.max_bytes:
+            return
+
+        self._remove(key)
+        self._entries[key] = response
+        self.size += response.size
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    async def get(self, key: str) -> CachedResponse | None:
+        """
+        Get a cached response.
+
+        :param key: The key of the resource.
+        :return: The cached response, or None on a miss.
+        """
+        if (response := self._entries.get(key)) is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return response
+
+        if self.disk is not None and (response := await self.disk.get(key)):
+            self._store(key, response)
+            self.disk_hits += 1
+            return response
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, response: CachedResponse) -> None:
+        """
+        Cache a response, if it is successful and small enough.
+
+        :param key: The key of the resource.
+        :param response: The complete upstream response.
+        """
+        if response.status_code != 200 or response.size > self.max_entry_bytes:
+            return
+
+        self._store(key, response)
+        if self.disk is not None:
+            await self.disk.put(key, response)
+
+    async def invalidate(self, key: str) -> int:
+        """
+        Remove a response from the cache.
+
+        :param key: The key of the resource.
+        :return: The number of removed responses, 0 or 1.
+        """
+        return await self.invalidate_prefix(key, exact=True)
+
+    async def invalidate_prefix(self, prefix: str, exact: bool = False) -> int:
+        """
+        Remove all responses whose key starts with a prefix.
+
+        :param prefix: The key prefix, an empty prefix clears the cache.
+        :param exact: Only remove the response whose key equals the prefix.
+        :return: The number of removed responses.
+        """
+
+        def matches(key: str) -> bool:
+            return key == prefix if exact else key.startswith(prefix)
+
+        keys = {key for key in self._entries if matches(key)}
+        if self.disk is not None:
+            keys |= {key for key in self.disk.keys() if matches(key)}
+
+        for key in keys:
+            self._remove(key)
+            if self.disk is not None:
+                await self.disk.delete(key)
+        return len(keys)
+
+    async def invalidate_file(self, file_id: int) -> int:
+        """
+        Remove the analytics results and word cloud images of a file.
+
+        :param file_id: The ID of the analyzed file.
+        :return: The number of removed responses.
+        """
+        # Word cloud images are stored under the ID of their file
+        return await self.invalidate(
+            analytics_cache_key(file_id)
+        ) + await self.invalidate_prefix(wordcloud_cache_key(f"{file_id}/"))
+
+    def stats(self) -> dict[str, int | float]:
+        """
+        Get the cache usage counters.
+
+        :return: The size, hits, misses and hit ratio of the cache.
+        """
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        stats = {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_size": self.max_bytes,
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+        if self.disk is not None:
+            stats |= {
+                "disk_entries": len(self.disk),
+                "disk_size": self.disk.size,
+                "disk_max_size": self.disk.max_bytes,
+            }
+        return stats
+
+
+def create_response_cache(config: type[Config] = Config) -> ResponseCache:
+    """
+    Create the response cache from the configuration.
+
+    :param config: The configuration object.
+    :return: The cache, with a disk tier if a directory is configured.
+    """
+    disk = None
+    if config.Cache.DISK_DIR:
+        disk = DiskTier(config.Cache.DISK_DIR, config.Cache.DISK_MAX_BYTES)
+    return ResponseCache(
+        max_bytes=config.Cache.MAX_BYTES,
+        max_entry_bytes=config.Cache.MAX_ENTRY_BYTES,
+        disk=disk,
+        encoding=config.Cache.ENCODING or None,
+    )
@@ -9,3 +9,125 @@ class Config:
     ANALYTICS_SERVICE_URL: str = getenv(
         "ANALYTICS_SERVICE_URL", "http://localhost:8002"
     )
+
+    class Storage:
+        MAX_CONNECTIONS = int(getenv("STORAGE_MAX_CONNECTIONS", 100))
+        MAX_KEEPALIVE_CONNECTIONS = int(getenv("STORAGE_MAX_KEEPALIVE_CONNECTIONS", 20))
+        KEEPALIVE_EXPIRY = float(getenv("STORAGE_KEEPALIVE_EXPIRY", 30))
+        HTTP2 = getenv("STORAGE_HTTP2", "false").lower() == "true"
+        TIMEOUT = float(getenv("STORAGE_TIMEOUT", 5))
+        BREAKER_FAILURES = int(getenv("STORAGE_BREAKER_FAILURES", 5))
+        BREAKER_RECOVERY_TIME = float(getenv("STORAGE_BREAKER_RECOVERY_TIME", 10))
+        RETRIES = int(getenv("STORAGE_RETRIES", 2))
+        RETRY_BACKOFF = float(getenv("STORAGE_RETRY_BACKOFF", 0.05))
+        RETRY_BACKOFF_MAX = float(getenv("STORAGE_RETRY_BACKOFF_MAX", 1))
+        RETRY_BUDGET_RATIO = float(getenv("STORAGE_RETRY_BUDGET_RATIO", 0.2))
+        RETRY_BUDGET_MIN_PER_SECOND = float(
+            getenv("STORAGE_RETRY_BUDGET_MIN_PER_SECOND", 5)
+        )
+        # Latency quantile after which reads are hedged, 0 disables hedging
+        HEDGE_QUANTILE = float(getenv("STORAGE_HEDGE_QUANTILE", 0))
+        HEDGE_MIN_DELAY = float(getenv("STORAGE_HEDGE_MIN_DELAY", 0.01))
+
+    class Analytics:
+        MAX_CONNECTIONS = int(getenv("ANALYTICS_MAX_CONNECTIONS", 100))
+        MAX_KEEPALIVE_CONNECTIONS = int(
+            getenv("ANALYTICS_MAX_KEEPALIVE_CONNECTIONS", 20)
+        )
+        KEEPALIVE_EXPIRY = float(getenv("ANALYTICS_KEEPALIVE_EXPIRY", 30))
+        HTTP2 = getenv("ANALYTICS_HTTP2", "false").lower() == "true"
+        TIMEOUT = float(getenv("ANALYTICS_TIMEOUT", 5))
+        BREAKER_FAILURES = int(getenv("ANALYTICS_BREAKER_FAILURES", 5))
+        BREAKER_RECOVERY_TIME = float(getenv("ANALYTICS_BREAKER_RECOVERY_TIME", 10))
+        RETRIES = int(getenv("ANALYTICS_RETRIES", 2))
+        RETRY_BACKOFF = float(getenv("ANALYTICS_RETRY_BACKOFF", 0.05))
+        RETRY_BACKOFF_MAX = float(getenv("ANALYTICS_RETRY_BACKOFF_MAX", 1))
+        RETRY_BUDGET_RATIO = float(getenv("ANALYTICS_RETRY_BUDGET_RATIO", 0.2))
+        RETRY_BUDGET_MIN_PER_SECOND = float(
+            getenv("ANALYTICS_RETRY_BUDGET_MIN_PER_SECOND", 5)
+        )
+        # Latency quantile after which reads are hedged, 0 disables hedging
+        HEDGE_QUANTILE = float(getenv("ANALYTICS_HEDGE_QUANTILE", 0))
+        HEDGE_MIN_DELAY = float(getenv("ANALYTICS_HEDGE_MIN_DELAY", 0.01))
+
+    class Cache:
+        # Total size of the responses kept in memory, 0 disables the memory tier
+        MAX_BYTES = int(getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        # Larger responses are streamed through without being cached
+        MAX_ENTRY_BYTES = int(getenv("CACHE_MAX_ENTRY_BYTES", 4 * 1024 * 1024))
+        # Directory of the on-disk tier, empty disables it
+        DISK_DIR = getenv("CACHE_DISK_DIR", "")
+        DISK_MAX_BYTES = int(getenv("CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024))
+        # Content coding responses are cached with, relayed as is to the clients
+        # accepting it and decoded for the others. Empty caches them unencoded
+        ENCODING = getenv("CACHE_ENCODING", "gzip").lower()
+        # Bearer token required by the invalidation endpoints, which are
+        # disabled while it is empty
+        ADMIN_TOKEN = getenv("CACHE_ADMIN_TOKEN", "")
+
+    class SingleFlight:
+        # Operations whose concurrent identical calls share one upstream call,
+        # any of "analyze" and "wordcloud", empty disables coalescing
+        SCOPE = frozenset(
+            name.strip()
+            for name in getenv("SINGLEFLIGHT_SCOPE", "analyze,wordcloud").split(",")
+            if name.strip()
+        )
+        # Seconds a request waits for a shared call, 0 waits indefinitely
+        TIMEOUT = float(getenv("SINGLEFLIGHT_TIMEOUT", 30))
+
+    class Admission:
+        ENABLED = getenv("ADMISSION_ENABLED", "true").lower() == "true"
+        # Requests per second allowed to each client, 0 disables rate limiting
+        RATE = float(getenv("ADMISSION_RATE", 50))
+        BURST = int(getenv("ADMISSION_BURST", 100))
+        # Concurrency limits, comma separated "METHOD /path/prefix=LIMIT:QUEUE"
+        ROUTE_LIMITS = getenv("ADMISSION_ROUTE_LIMITS", "POST /analytics/=16:64")
+        # Seconds a request waits in a route queue before being shed
+        QUEUE_TIMEOUT = float(getenv("ADMISSION_QUEUE_TIMEOUT", 10))
+        EXEMPT_PATHS = tuple(
+            path.strip()
+            for path in getenv(
+                "ADMISSION_EXEMPT_PATHS", "/stats,/metrics,/docs,/openapi.json"
+            ).split(",")
+            if path.strip()
+        )
+        # Header identifying the client behind a proxy, e.g. X-Forwarded-For
+        CLIENT_HEADER = getenv("ADMISSION_CLIENT_HEADER", "")
+        # Proxies in front of the gateway appending to the client header, the
+        # address appended by the outermost one identifies the client
+        TRUSTED_PROXIES = int(getenv("ADMISSION_TRUSTED_PROXIES", 1))
+        # Token bucket storage, "memory" or "redis" (requires the redis extra)
+        BACKEND = getenv("ADMISSION_BACKEND", "memory").lower()
+        REDIS_URL = getenv("ADMISSION_REDIS_URL", "redis://localhost:6379/0")
+        # Seconds to wait for Redis before admitting the request anyway
+        REDIS_TIMEOUT = float(getenv("ADMISSION_REDIS_TIMEOUT", 0.25))
+
+    class Compression:
+        # Content codings offered by order of preference, "br" and "zstd"
+        # require the compression extra and are skipped without it
+        ENCODINGS = tuple(
+            name.strip().lower()
+            for name in getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+            if name.strip()
+        )
+        # Smaller bodies are sent unencoded, compressing them is not worth it
+        MINIMUM_SIZE = int(getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+        # Compressible media types, or prefixes of them
+        MEDIA_TYPES = tuple(
+            media_type.strip().lower()
+            for media_type in getenv(
+                "COMPRESSION_MEDIA_TYPES", "application/json,text/"
+            ).split(",")
+            if media_type.strip()
+        )
+
+    class Tracing:
+        # Span exporter, "none", "jsonl" (spans appended to FILE) or "otlp"
+        # (requires the otlp extra). Trace contexts are propagated in any case
+        EXPORTER = getenv("TRACING_EXPORTER", "none").lower()
+        FILE = getenv("TRACING_FILE", "traces/gateway.jsonl")
+        # OTLP/HTTP traces endpoint, empty uses OTEL_EXPORTER_OTLP_ENDPOINT
+        OTLP_ENDPOINT = getenv("TRACING_OTLP_ENDPOINT", "")
+        # Fraction of the new traces recorded, sampled requests keep their decision
+        SAMPLE_RATIO = float(getenv("TRACING_SAMPLE_RATIO", 1))
@@ -1,22 +1,116 @@
+import secrets
 from typing import Annotated
 
-from fastapi import Depends, File
-from httpx import AsyncClient
+from fastapi import Depends, Header, HTTPException, Request, status
 
+from gateway.admission import AdmissionController
+from gateway.cache import ResponseCache
+from gateway.clients import UpstreamClients
 from gateway.config import Config
 from gateway.services.router import RouterService
+from gateway.singleflight import SingleFlight
 
 
-def get_router_service(config: Config = Depends(Config)) -> RouterService:
+def get_upstream_clients(request: Request) -> UpstreamClients:
+    """
+    Dependency to get the UpstreamClients created in the application lifespan.
+
+    :param request: The current request.
+    :return: The shared instance of UpstreamClients.
+    """
+    return request.app.state.upstream_clients
+
+
+UpstreamClientsDep = Annotated[UpstreamClients, Depends(get_upstream_clients)]
+
+
+def get_response_cache(request: Request) -> ResponseCache:
+    """
+    Dependency to get the ResponseCache created in the application lifespan.
+
+    :param request: The current request.
+    :return: The shared instance of ResponseCache.
+    """
+    return request.app.state.response_cache
+
+
+ResponseCacheDep = Annotated[ResponseCache, Depends(get_response_cache)]
+
+
+def get_single_flight(request: Request) -> SingleFlight:
+    """
+    Dependency to get the SingleFlight created in the application lifespan.
+
+    :param request: The current request.
+    :return: The shared instance of SingleFlight.
+    """
+    return request.app.state.single_flight
+
+
+SingleFlightDep = Annotated[SingleFlight, Depends(get_single_flight)]
+
+
+def get_admission_controller(request: Request) -> AdmissionController | None:
+    """
+    Dependency to get the AdmissionController created in the application
+    lifespan.
+
+    :param request: The current request.
+    :return: The shared instance of AdmissionController, or None if admission
+        control is disabled.
+    """
+    return request.app.state.admission
+
+
+AdmissionControllerDep = Annotated[
+    AdmissionController | None, Depends(get_admission_controller)
+]
+
+
+def verify_admin_token(authorization: Annotated[str | None, Header()] = None) -> None:
+    """
+    Dependency guarding the cache administration endpoints.
+
+    The endpoints are disabled unless an admin token is configured.
+
+    :param authorization: The value of the Authorization header, if any.
+    :raises HTTPException: If no admin token is configured, or the request
+        does not carry it as a Bearer token.
+    """
+    token = Config.Cache.ADMIN_TOKEN
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cache administration is disabled.",
+        )
+    if not secrets.compare_digest(
+        (authorization or "").encode(), f"Bearer {token}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin token.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def get_router_service(
+    clients: UpstreamClientsDep,
+    response_cache: ResponseCacheDep,
+    single_flight: SingleFlightDep,
+) -> RouterService:
     """
     Dependency to get the RouterService instance.
 
-    :param config: The configuration object.
+    :param clients: The pooled clients of the upstream services.
+    :param response_cache: The cache of analytics responses.
+    :param single_flight: The group of coalesced upstream calls.
     :return: An instance of RouterService.
     """
     return RouterService(
-        storage_client=AsyncClient(base_url=config.STORAGE_SERVICE_URL),
-        analytics_client=AsyncClient(base_url=config.ANALYTICS_SERVICE_URL),
+        storage_client=clients.storage,
+        analytics_client=clients.analytics,
+        response_cache=response_cache,
+        single_flight=single_flight,
     )
 
 
@@ -1,5 +1,9 @@
+from math import ceil
+
 from fastapi import HTTPException, Request, Response
 
+from gateway.resilience import CircuitOpenError
+
 
 async def connection_error_handler(request: Request, exc: Exception) -> Response:
     """
@@ -14,3 +18,21 @@ async def connection_error_handler(request: Request, exc: Exception) -> Response
         status_code=503,
         media_type="text/plain",
     )
+
+
+async def circuit_open_handler(request: Request, exc: CircuitOpenError) -> Response:
+    """
+    Handle requests to an upstream with an open circuit by returning a 503
+    Service Unavailable response, telling when to try again.
+
+    :param request: The request that caused the error.
+    :param exc: The exception raised.
+    :return: A response with an error message, status code 503 and a
+        Retry-After header.
+    """
+    return Response(
+        content="Service Unavailable. Please try again later.",
+        status_code=503,
+        media_type="text/plain",
+        headers={"Retry-After": str(max(ceil(exc.retry_after), 1))},
+    )
@@ -5,9 +5,21 @@ from fastapi.middleware.cors import CORSMiddleware
 from httpx import ConnectError, ConnectTimeout
 from loguru import logger
 
-from gateway.exception_handler import connection_error_handler
-from gateway.routers.files import router as files_router
+from gateway.admission import AdmissionMiddleware, create_admission_controller
+from gateway.cache import create_response_cache
+from gateway.clients import UpstreamClients
+from gateway.compression import CompressionMiddleware
+from gateway.config import Config
+from gateway.exception_handler import circuit_open_handler, connection_error_handler
+from gateway.metrics import MetricsMiddleware
+from gateway.metrics import router as metrics_router
+from gateway.resilience import CircuitOpenError
 from gateway.routers.analytics import router as analytics_router
+from gateway.routers.cache import router as cache_router
+from gateway.routers.files import router as files_router
+from gateway.routers.stats import router as stats_router
+from gateway.singleflight import create_single_flight
+from gateway.tracing import TracingMiddleware, setup_tracing
 
 
 @asynccontextmanager
@@ -18,8 +30,21 @@ async def lifespan(app: FastAPI):
     """
 
     logger.info("Starting application lifespan setup.")
+    tracer_provider = setup_tracing()
+    app.state.upstream_clients = UpstreamClients()
+    app.state.response_cache = create_response_cache()
+    app.state.single_flight = create_single_flight()
+    app.state.admission = None
+    if Config.Admission.ENABLED:
+        app.state.admission = create_admission_controller()
     yield
 
+    await app.state.upstream_clients.aclose()
+    if app.state.admission is not None:
+        await app.state.admission.aclose()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()
+
 
 app = FastAPI(
     title="Gateway Service",
@@ -28,6 +53,8 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Added first to run inside CORS, so rejections carry the CORS headers
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -35,13 +62,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+# Added after CORS, so the traces of rejected requests are recorded too
+app.add_middleware(TracingMiddleware)
+# Added last to be outermost, so rejected requests are measured too
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(files_router)
 app.include_router(analytics_router)
+app.include_router(stats_router)
+app.include_router(cache_router)
+app.include_router(metrics_router)
 
 # if some services are not available, handle connection errors gracefully
 app.add_exception_handler(ConnectError, connection_error_handler)
 app.add_exception_handler(ConnectTimeout, connection_error_handler)
+app.add_exception_handler(CircuitOpenError, circuit_open_handler)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,149 @@
+"""
+Prometheus metrics of the service, exported at /metrics.
+
+Metrics are recorded by a pure ASGI middleware and an httpx transport
+wrapper, and only updated in memory, so they cost a few microseconds per
+request.
+"""
+
+from time import perf_counter
+
+import httpx
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# Byte sizes from 64 B to 1 GiB, by powers of 4
+SIZE_BUCKETS = tuple(float(4**i) for i in range(3, 16))
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, until its response is completely sent.",
+    ["method", "route", "status"],
+)
+REQUEST_SIZE = Histogram(
+    "http_request_size_bytes",
+    "Size of the request bodies.",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Size of the response bodies.",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS,
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Time until the response headers of an upstream service are received.",
+    ["upstream", "method", "status"],
+)
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """
+    Export the metrics in the Prometheus text format.
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the duration and body sizes of HTTP requests.
+
+    Requests are labelled with their route template, e.g. /files/{file_id},
+    so the number of series does not grow with the number of files.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._cache: dict[tuple[str, str, int], tuple[Histogram, ...]] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        request_size = 0
+        response_size = 0
+        content_length = None
+        status = 500
+
+        async def receive_wrapper() -> Message:
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_size, content_length, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-length":
+                        content_length = int(value)
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path_format", None) or "unmatched"
+            duration, request_sizes, response_sizes = self._series(
+                scope["method"], route, status
+            )
+            duration.observe(perf_counter() - started)
+            request_sizes.observe(request_size)
+            # Files sent by the server itself never go through send
+            response_sizes.observe(response_size or content_length or 0)
+
+    def _series(
+        self, method: str, route: str, status: int
+    ) -> tuple[Histogram, Histogram, Histogram]:
+        # Looking labelled series up is slower than observing them, so they
+        # are looked up once per method, route and status
+        key = (method, route, status)
+        series = self._cache.get(key)
+        if series is None:
+            series = self._cache[key] = (
+                REQUEST_DURATION.labels(method, route, str(status)),
+                REQUEST_SIZE.labels(method, route),
+                RESPONSE_SIZE.labels(method, route),
+            )
+        return series
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """
+    Transport recording the duration of the requests to an upstream service.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, upstream: str) -> None:
+        """
+        :param transport: The wrapped transport, sending the requests.
+        :param upstream: The name of the upstream service.
+        """
+        self.transport = transport
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = perf_counter()
+        status = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            UPSTREAM_DURATION.labels(self.upstream, request.method, status).observe(
+                perf_counter() - started
+            )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
@@ -0,0 +1,364 @@
+"""
+Resilience of the calls to the upstream services.
+
+Each upstream client sends its requests through a ResilientTransport, which
+wraps the pooled transport with a circuit breaker, retries limited by a retry
+budget and, optionally, hedged requests.
+"""
+
+import asyncio
+import random
+from collections import deque
+from dataclasses import dataclass
+from itertools import count
+from time import monotonic
+
+import httpx
+
+
+# Methods whose requests may safely be sent more than once
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# Statuses of a transient upstream failure, worth retrying
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class CircuitOpenError(httpx.ConnectError):
+    """
+    Raised instead of sending a request to an upstream whose circuit is open.
+    """
+
+    def __init__(self, message: str, retry_after: float, **kwargs) -> None:
+        super().__init__(message, **kwargs)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True, slots=True)
+class ResiliencePolicy:
+    #: Consecutive failures opening the circuit
+    failure_threshold: int = 5
+    #: Seconds the circuit stays open before a probe request is let through
+    recovery_time: float = 10.0
+    #: Retries of a failed idempotent request
+    retries: int = 2
+    #: Base and maximum delay between retries, in seconds
+    backoff: float = 0.05
+    backoff_max: float = 1.0
+    #: Retries and hedges earned by each request
+    budget_ratio: float = 0.2
+    #: Retries and hedges allowed per second regardless of the traffic
+    budget_min_per_second: float = 5.0
+    #: Latency quantile after which a hedged request is sent, 0 disables it
+    hedge_quantile: float = 0.0
+    #: Minimum delay before a hedged request, in seconds
+    hedge_min_delay: float = 0.01
+
+    @classmethod
+    def from_config(cls, config: type) -> 'ResiliencePolicy':
+        """
+        Read the policy of an upstream from its configuration class.
+
+        :param config: The configuration class of the upstream, e.g.
+            `Config.Storage`.
+        :return: The policy.
+        """
+        return cls(
+            failure_threshold=config.BREAKER_FAILURES,
+            recovery_time=config.BREAKER_RECOVERY_TIME,
+            retries=config.RETRIES,
+            backoff=config.RETRY_BACKOFF,
+            backoff_max=config.RETRY_BACKOFF_MAX,
+            budget_ratio=config.RETRY_BUDGET_RATIO,
+            budget_min_per_second=config.RETRY_BUDGET_MIN_PER_SECOND,
+            hedge_quantile=config.HEDGE_QUANTILE,
+            hedge_min_delay=config.HEDGE_MIN_DELAY,
+        )
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after consecutive failures.
+
+    The circuit opens after `failure_threshold` consecutive failures and
+    rejects calls for `recovery_time` seconds. It then lets a single probe
+    call through, closing again if it succeeds and reopening if it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_time: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_after(self) -> float:
+        """
+        Get the number of seconds until the circuit lets a probe through.
+        """
+        return max(self._opened_at + self.recovery_time - monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may be made, and count it as rejected otherwise.
+
+        :return: True if the call may be made.
+        """
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+        return True
+
+    def record(self, success: bool | None) -> None:
+        """
+        Record the outcome of an allowed call.
+
+        :param success: Whether the upstream handled the call, or None if the
+            call failed for a reason unrelated to the upstream.
+        """
+        self._probing = False
+        if success is None:
+            return
+
+        if success:
+            self.failures = 0
+            self.state = self.CLOSED
+            return
+
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self.failures >= self.failure_threshold
+        ):
+            self.state = self.OPEN
+            self.trips += 1
+            self._opened_at = monotonic()
+
+
+class RetryBudget:
+    """
+    Limits retries to a fraction of the requests.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, so an
+    upstream that fails every request receives at most `1 + ratio` times the
+    client traffic. Tokens also accrue at `min_per_second` so that retries
+    remain possible under low traffic, and the balance is capped at ten
+    seconds of that rate plus the deposits of a hundred requests.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float) -> None:
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = max(min_per_second * 10 + ratio * 100, 1.0)
+        self.exhausted = 0
+        self._tokens = self.capacity
+        self._updated = monotonic()
+
+    def _refill(self, tokens: float = 0.0) -> None:
+        now = monotonic()
+        self._tokens = min(
+            self._tokens + (now - self._updated) * self.min_per_second + tokens,
+            self.capacity,
+        )
+        self._updated = now
+
+    def deposit(self) -> None:
+        self._refill(self.ratio)
+
+    def withdraw(self) -> bool:
+        """
+        Take a token for a retry.
+
+        :return: True if the retry is allowed.
+        """
+        self._refill()
+        if self._tokens < 1:
+            self.exhausted += 1
+            return False
+        self._tokens -= 1
+        return True
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class LatencyWindow:
+    """
+    The latencies of the most recent successful requests.
+    """
+
+    def __init__(self, size: int = 256, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Get a latency quantile.
+
+        :param q: The quantile, between 0 and 1.
+        :return: The latency, or None until enough requests were seen.
+        """
+        if len(self._samples) < self.min_samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Transport applying a resilience policy to the requests of an upstream.
+
+    Requests to an upstream whose circuit is open fail immediately with
+    CircuitOpenError. Idempotent requests failing with a transport error or
+    a transient status are retried with jittered exponential backoff while
+    the retry budget allows. If hedging is enabled, an idempotent request
+    still waiting for its response after the configured latency quantile is
+    sent a second time, and the first response wins.
+
+    Only the response headers are awaited, so bodies are still streamed.
+    """
+
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, name: str, policy: ResiliencePolicy
+    ) -> None:
+        """
+        :param transport: The wrapped transport, sending the requests.
+        :param name: The name of the upstream, used in errors.
+        :param policy: The resilience policy of the upstream.
+        """
+        self.transport = transport
+        self.name = name
+        self.policy = policy
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.recovery_time)
+        self.budget = RetryBudget(policy.budget_ratio, policy.budget_min_per_second)
+        self.latencies = LatencyWindow()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in IDEMPOTENT_METHODS
+        self.budget.deposit()
+
+        for attempt in count():
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"Circuit of the {self.name} service is open.",
+                    retry_after=self.breaker.retry_after(),
+                    request=request,
+                )
+
+            retry = idempotent and attempt < self.policy.retries
+            try:
+                if idempotent and self.policy.hedge_quantile:
+                    response = await self._send_hedged(request)
+                else:
+                    response = await self._send(request)
+            except httpx.TransportError:
+                if not (retry and self.budget.withdraw()):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or not (
+                    retry and self.budget.withdraw()
+                ):
+                    return response
+                await response.aclose()
+
+            self.retries += 1
+            backoff = min(self.policy.backoff * 2**attempt, self.policy.backoff_max)
+            await asyncio.sleep(random.uniform(0, backoff))
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        started = monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.PoolTimeout:
+            # The local pool is exhausted, the upstream is not to blame
+            self.breaker.record(None)
+            raise
+        except httpx.TransportError:
+            self.breaker.record(False)
+            raise
+        except BaseException:
+            self.breaker.record(None)
+            raise
+
+        success = response.status_code < 500
+        self.breaker.record(success)
+        if success:
+            self.latencies.add(monotonic() - started)
+        return response
+
+    async def _send_hedged(self, request: httpx.Request) -> httpx.Response:
+        first = asyncio.ensure_future(self._send(request))
+        tasks = {first}
+        try:
+            delay = self.latencies.quantile(self.policy.hedge_quantile)
+            if delay is not None:
+                delay = max(delay, self.policy.hedge_min_delay)
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.budget.withdraw():
+                    self.hedges += 1
+                    tasks.add(asyncio.ensure_future(self._send(request)))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+
+                    # Keep the first response, close one completing with it
+                    for other in done - {task}:
+                        if other.exception() is None:
+                            await other.result().aclose()
+                    if task is not first:
+                        self.hedge_wins += 1
+                    return task.result()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def stats(self) -> dict[str, str | int | float | None]:
+        """
+        Get the state and counters of the policy.
+
+        :return: The circuit state, trips, rejections, retries and hedges.
+        """
+        p95 = self.latencies.quantile(0.95)
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "trips": self.breaker.trips,
+            "rejected": self.breaker.rejected,
+            "retries": self.retries,
+            "retry_budget": round(self.budget.tokens, 2),
+            "retry_budget_exhausted": self.budget.exhausted,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p95_latency": None if p95 is None else round(p95, 4),
+        }
@@ -1,6 +1,6 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Response, UploadFile
+from fastapi import APIRouter, Body, Depends, Header, Query, Response, UploadFile
 from fastapi.responses import FileResponse
 
 from gateway.dependencies import RouterServiceDep
@@ -9,27 +9,108 @@ from gateway.dependencies import RouterServiceDep
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 
+@router.post("/batch")
+async def analyze_files(
+    router_service: RouterServiceDep,
+    ids: Annotated[list[int], Body(embed=True, min_length=1, max_length=1000)],
+    accept_encoding: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Analyze many files in one request.
+
+    :param ids: The IDs of the files to analyze, at most 1000 per request.
+    :param accept_encoding: The content codings the client accepts, if any.
+    :return: The results or the error of each file, in the order of the IDs.
+    """
+    return await router_service.analyze_files(ids, accept_encoding)
+
+
+@router.post("/aggregate")
+async def aggregate_files(
+    router_service: RouterServiceDep,
+    ids: Annotated[list[int], Body(embed=True, min_length=1, max_length=10000)],
+    limit: Annotated[int | None, Body(embed=True, ge=1)] = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Aggregate the analytics of many files, from their stored word counts.
+
+    :param ids: The IDs of the files, at most 10000 per request.
+    :param limit: The number of most frequent words returned, all by default.
+    :param accept_encoding: The content codings the client accepts, if any.
+    :return: The analytics of the analyzed files as a whole.
+    """
+    return await router_service.aggregate_files(ids, limit, accept_encoding)
+
+
+@router.get("/aggregate")
+async def get_corpus(
+    router_service: RouterServiceDep,
+    limit: Annotated[int, Query(ge=1)] = 1000,
+    accept_encoding: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Get the analytics of all the analyzed files.
+
+    :param limit: The number of most frequent words returned.
+    :param accept_encoding: The content codings the client accepts, if any.
+    :return: The analytics of all the files as a whole.
+    """
+    return await router_service.get_corpus(limit, accept_encoding)
+
+
 @router.post("/{file_id}")
-async def analyze_file(file_id: int, router_service: RouterServiceDep) -> Response:
+async def analyze_file(
+    file_id: int,
+    router_service: RouterServiceDep,
+    accept_encoding: Annotated[str | None, Header()] = None,
+) -> Response:
     """
     Analyze a file by its ID and return analytics results.
 
+    Until the results are available, a 202 response describes the analytics
+    job to poll.
+
     :param file_id: The ID of the file to analyze.
     :param analytics_service: The AnalyticsService instance.
+    :param accept_encoding: The content codings the client accepts, if any.
     :return: An Analytics object containing the results.
     """
-    return await router_service.analyze_file(file_id)
+    return await router_service.analyze_file(file_id, accept_encoding)
+
+
+@router.get("/jobs/{job_id}")
+async def get_analytics_job(
+    job_id: int,
+    router_service: RouterServiceDep,
+    accept_encoding: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Get the status of an analytics job.
+
+    :param job_id: The ID of the job.
+    :param accept_encoding: The content codings the client accepts, if any.
+    :return: The job, with the analytics results once completed.
+    """
+    return await router_service.get_analytics_job(job_id, accept_encoding)
 
 
 @router.get("/{file_path:path}", response_class=FileResponse)
 async def download_wordcloud(
-    file_path: str, router_service: RouterServiceDep,
+    file_path: str,
+    router_service: RouterServiceDep,
+    if_none_match: Annotated[str | None, Header()] = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
 ) -> Response:
     """
     Download the word cloud image for a specific file.
 
     :param path: The path to the word cloud image.
     :param analytics_service: The AnalyticsService instance.
+    :param if_none_match: The ETags the client already has, if any.
+    :param accept_encoding: The content codings the client accepts, if any.
     :return: A Response object containing the word cloud image.
     """
-    return await router_service.download_wordcloud(file_path)
+    return await router_service.download_wordcloud(
+        file_path, if_none_match, accept_encoding
+    )
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends
+
+from gateway.dependencies import ResponseCacheDep, verify_admin_token
+
+
+router = APIRouter(
+    prefix="/cache", tags=["cache"], dependencies=[Depends(verify_admin_token)]
+)
+
+
+@router.delete("")
+async def clear_cache(response_cache: ResponseCacheDep) -> dict[str, int]:
+    """
+    Remove all responses from the response cache.
+
+    :param response_cache: The cache of analytics responses.
+    :return: The number of removed responses.
+    """
+    return {"invalidated": await response_cache.invalidate_prefix("")}
+
+
+@router.delete("/analytics/{file_id}")
+async def invalidate_file(
+    file_id: int, response_cache: ResponseCacheDep
+) -> dict[str, int]:
+    """
+    Remove the cached analytics results and word cloud images of a file.
+
+    :param file_id: The ID of the analyzed file.
+    :param response_cache: The cache of analytics responses.
+    :return: The number of removed responses.
+    """
+    return {"invalidated": await response_cache.invalidate_file(file_id)}
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Response, UploadFile
+from typing import Annotated
+
+from fastapi import APIRouter, Body, Header, Path, Query, Request, Response, UploadFile
 from fastapi.responses import FileResponse
 
 from gateway.dependencies import RouterServiceDep
@@ -6,22 +8,148 @@ from gateway.dependencies import RouterServiceDep
 
 router = APIRouter(prefix="/files", tags=["files"])
 
+SHA256_PATTERN = "^[0-9a-f]{64}$"
+
+UPLOAD_FILE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+@router.get(
+    "",
+    responses={
+        200: {"description": "Files listed successfully"},
+        400: {"description": "Invalid cursor"},
+    },
+)
+async def list_files(
+    router_service: RouterServiceDep,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+    mime_type: str | None = None,
+    min_size: Annotated[int | None, Query(ge=0)] = None,
+    max_size: Annotated[int | None, Query(ge=0)] = None,
+) -> Response:
+    """
+    List stored files from the newest to the oldest.
+
+    :param limit: The maximum number of files in the page.
+    :param cursor: The `next_cursor` of the previous page, if any.
+    :param mime_type: Only list files of this MIME type.
+    :param min_size: Only list files of at least this size, in bytes.
+    :param max_size: Only list files of at most this size, in bytes.
+    """
+    params = {
+        "limit": limit,
+        "cursor": cursor,
+        "mime_type": mime_type,
+        "min_size": min_size,
+        "max_size": max_size,
+    }
+    return await router_service.list_files(
+        {key: value for key, value in params.items() if value is not None}
+    )
+
+
+ARCHIVE_RESPONSES = {
+    200: {
+        "description": "Tar archive of the files, missing IDs are listed in the "
+        "X-Missing-File-Ids header",
+        "content": {"application/x-tar": {}},
+    },
+    404: {"description": "None of the files exists"},
+}
+
+
+@router.get("/archive", responses=ARCHIVE_RESPONSES)
+async def get_archive(
+    router_service: RouterServiceDep,
+    ids: Annotated[list[int], Query(min_length=1, max_length=1000)],
+) -> Response:
+    """
+    Download many files as one tar archive, streamed as it is read.
+
+    :param ids: The IDs of the files, repeated, e.g. `?ids=1&ids=2`. At most
+        1000 per request.
+    """
+    return await router_service.download_archive(ids)
+
+
+@router.post("/archive", responses=ARCHIVE_RESPONSES)
+async def post_archive(
+    router_service: RouterServiceDep,
+    ids: Annotated[list[int], Body(embed=True, min_length=1, max_length=1000)],
+) -> Response:
+    """
+    Download many files as one tar archive, for lists of IDs too long for a URL.
+
+    :param ids: The IDs of the files, at most 1000 per request.
+    """
+    return await router_service.download_archive(ids, in_body=True)
+
 
 @router.get(
     "/{file_id}",
     responses={
         200: {"description": "File retrieved successfully"},
+        206: {"description": "Part of the file retrieved successfully"},
+        304: {"description": "File not modified"},
         404: {"description": "File not found"},
+        416: {"description": "Requested range not satisfiable"},
     },
     response_class=FileResponse,
 )
-async def get_file(file_id: int, router_service: RouterServiceDep) -> Response:
+async def get_file(
+    file_id: int,
+    router_service: RouterServiceDep,
+    if_none_match: Annotated[str | None, Header()] = None,
+    range_header: Annotated[str | None, Header(alias="Range")] = None,
+    if_range: Annotated[str | None, Header()] = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
+) -> Response:
     """
     Retrieve a file by its ID.
 
     :param file_id: The ID of the file to retrieve.
+    :param if_none_match: The ETags the client already has, if any.
+    :param range_header: The byte range to retrieve, if any.
+    :param if_range: The ETag the range is conditional on, if any.
+    :param accept_encoding: The content codings the client accepts, if any.
+    """
+    return await router_service.download_file_by_file_id(
+        file_id, if_none_match, range_header, if_range, accept_encoding
+    )
+
+
+@router.head(
+    "/by-hash/{file_hash}",
+    responses={
+        200: {"description": "File exists, its ID is in the X-File-Id header"},
+        404: {"description": "File not found"},
+    },
+)
+async def head_file_by_hash(
+    file_hash: Annotated[str, Path(pattern=SHA256_PATTERN)],
+    router_service: RouterServiceDep,
+) -> Response:
+    """
+    Check whether a file with the given content hash exists.
+
+    :param file_hash: The SHA-256 hash of the file content.
+    :param router_service: The router service dependency.
     """
-    return await router_service.download_file_by_file_id(file_id)
+    return await router_service.head_file_by_hash(file_hash)
 
 
 @router.post(
@@ -32,12 +160,42 @@ async def get_file(file_id: int, router_service: RouterServiceDep) -> Response:
         400: {"description": "Invalid file format or size"},
     },
     response_model=int,
+    openapi_extra=UPLOAD_FILE_REQUEST_BODY,
 )
-async def upload_file(file: UploadFile, router_service: RouterServiceDep) -> Response:
+async def upload_file(
+    request: Request,
+    router_service: RouterServiceDep,
+    content_sha256: Annotated[
+        str | None, Header(alias="X-Content-SHA256", pattern=SHA256_PATTERN)
+    ] = None,
+) -> Response:
     """
     Upload a file to the storage service.
 
-    :param file: The file to be uploaded.
-    :param storage_service: The storage service dependency.
+    With an X-Content-SHA256 header the upload is conditional: if a file with
+    this content already exists its ID is returned before the body is read.
+
+    :param request: The request carrying the file in the "file" form field.
+    :param router_service: The router service dependency.
+    :param content_sha256: The SHA-256 hash of the file content, if known.
+    """
+    return await router_service.upload_file(request, content_sha256)
+
+
+@router.post(
+    "/batch",
+    responses={
+        200: {"description": "Files uploaded successfully"},
+        400: {"description": "Invalid file format or too many files"},
+    },
+)
+async def upload_files(
+    files: list[UploadFile], router_service: RouterServiceDep
+) -> Response:
+    """
+    Upload many files to the storage service in one request.
+
+    :param files: The files to be uploaded (at most 1000 per request).
+    :param router_service: The router service dependency.
     """
-    return await router_service.upload_file(file)
+    return await router_service.upload_files(files)
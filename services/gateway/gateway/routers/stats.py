@@ -0,0 +1,66 @@
+from fastapi import APIRouter
+
+from gateway.dependencies import (
+    AdmissionControllerDep,
+    ResponseCacheDep,
+    SingleFlightDep,
+    UpstreamClientsDep,
+)
+
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+
+@router.get("/pools")
+async def get_pool_stats(clients: UpstreamClientsDep) -> dict[str, dict[str, int]]:
+    """
+    Get the connection pool usage of the upstream clients.
+
+    :param clients: The pooled clients of the upstream services.
+    """
+    return clients.stats()
+
+
+@router.get("/cache")
+async def get_cache_stats(response_cache: ResponseCacheDep) -> dict[str, int | float]:
+    """
+    Get the size and hit ratio of the response cache.
+
+    :param response_cache: The cache of analytics responses.
+    """
+    return response_cache.stats()
+
+
+@router.get("/singleflight")
+async def get_single_flight_stats(single_flight: SingleFlightDep) -> dict[str, int]:
+    """
+    Get the number of upstream calls started and of requests coalesced into
+    them.
+
+    :param single_flight: The group of coalesced upstream calls.
+    """
+    return single_flight.stats()
+
+
+@router.get("/upstreams")
+async def get_upstream_stats(
+    clients: UpstreamClientsDep,
+) -> dict[str, dict[str, str | int | float | None]]:
+    """
+    Get the circuit breaker, retry and hedging state of the upstream clients.
+
+    :param clients: The pooled clients of the upstream services.
+    """
+    return clients.resilience_stats()
+
+
+@router.get("/admission")
+async def get_admission_stats(
+    admission: AdmissionControllerDep,
+) -> dict[str, int | dict[str, dict[str, int]]]:
+    """
+    Get the number of admitted, rate limited and shed requests.
+
+    :param admission: The admission controller, None if disabled.
+    """
+    return {} if admission is None else admission.stats()
@@ -1,6 +1,121 @@
-from fastapi import Response, UploadFile
-from fastapi.responses import Response
+from collections.abc import AsyncIterator
+
+import httpx
+from fastapi import HTTPException, Request, Response, UploadFile, status
+from fastapi.responses import Response, StreamingResponse
 from httpx import AsyncClient
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile as FormFile
+
+from gateway.cache import (
+    CachedResponse,
+    ResponseCache,
+    analytics_cache_key,
+    wordcloud_cache_key,
+)
+from gateway.compression import accepts, decompressor
+from gateway.singleflight import SingleFlight
+
+
+# Headers describing a single connection, never forwarded by proxies (RFC 9110)
+HOP_BY_HOP_HEADERS = frozenset(
+    {
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "proxy-connection",
+        "te",
+        "trailer",
+        "transfer-encoding",
+        "upgrade",
+    }
+)
+# Headers set by the gateway's own server
+SERVER_HEADERS = frozenset({"date", "server"})
+
+
+def _request_headers(**headers: str | None) -> dict[str, str]:
+    # Forwarded request headers, e.g. if_none_match becomes If-None-Match
+    return {
+        name.replace("_", "-").title(): value
+        for name, value in headers.items()
+        if value is not None
+    }
+
+
+def _response_headers(response: httpx.Response) -> list[tuple[str, str]]:
+    """
+    Select the upstream response headers to send to the client.
+
+    The body is forwarded as raw bytes, so Content-Encoding and Content-Length
+    still describe it and are kept.
+
+    :param response: The upstream response.
+    :return: The headers to forward, repeated headers included.
+    """
+    excluded = HOP_BY_HOP_HEADERS | SERVER_HEADERS
+    # Connection may name further hop-by-hop headers
+    for value in response.headers.get_list("connection"):
+        excluded |= {name.strip().lower() for name in value.split(",")}
+
+    return [
+        (key, value)
+        for key, value in response.headers.multi_items()
+        if key.lower() not in excluded
+    ]
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as required by RFC 9110 for If-None-Match
+    if if_none_match.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def _decoded(cached: CachedResponse, encoding: str) -> CachedResponse:
+    # For clients not accepting the coding a response was cached with
+    return CachedResponse(
+        status_code=cached.status_code,
+        headers=tuple(
+            (key, value)
+            for key, value in cached.headers
+            if key.lower() != "content-encoding"
+        ),
+        body=decompressor(encoding).decompress(cached.body),
+    )
+
+
+def _replay(
+    cached: CachedResponse,
+    if_none_match: str | None = None,
+    accept_encoding: str | None = None,
+) -> Response:
+    """
+    Build a response from a complete upstream response.
+
+    :param cached: The upstream response.
+    :param if_none_match: The value of the If-None-Match header, if any.
+    :param accept_encoding: The value of the Accept-Encoding header, if any.
+        An encoded body is decoded if the client does not accept its coding.
+    :return: The response, or a 304 if its ETag matches If-None-Match.
+    """
+    etag = cached.header("ETag")
+    if (
+        cached.status_code == status.HTTP_200_OK
+        and if_none_match is not None
+        and etag
+        and _etag_matches(if_none_match, etag)
+    ):
+        headers = {"ETag": etag}
+        if cache_control := cached.header("Cache-Control"):
+            headers["Cache-Control"] = cache_control
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    encoding = cached.header("Content-Encoding")
+    if encoding and not accepts(accept_encoding, encoding):
+        cached = _decoded(cached, encoding)
+    return cached.to_response()
 
 
 class RouterService:
@@ -10,57 +125,482 @@ class RouterService:
     """
 
     def __init__(
-        self, storage_client: AsyncClient, analytics_client: AsyncClient
+        self,
+        storage_client: AsyncClient,
+        analytics_client: AsyncClient,
+        response_cache: ResponseCache | None = None,
+        single_flight: SingleFlight | None = None,
     ) -> None:
         self.storage_client = storage_client
         self.analytics_client = analytics_client
+        self.response_cache = response_cache
+        self.single_flight = single_flight
+
+    async def _proxy(
+        self,
+        client: AsyncClient,
+        method: str,
+        url: str,
+        accept_encoding: str | None = None,
+        cache_key: str | None = None,
+        **kwargs,
+    ) -> Response:
+        """
+        Send a request upstream and stream its response back to the client.
+
+        The upstream body is relayed chunk by chunk as it arrives and is never
+        buffered, and the next chunk is only read once the previous one was
+        sent, so memory use does not depend on the body size.
+
+        :param client: The client of the upstream service.
+        :param method: The HTTP method.
+        :param url: The URL, relative to the upstream base URL.
+        :param accept_encoding: The client Accept-Encoding header, if any. The
+            body is relayed as is, so upstream may only use codings the client
+            accepts.
+        :param cache_key: The key to store a successful response under in the
+            response cache, if any. The body is then copied while it is relayed
+            and stored once complete, unless it outgrows the cache entry limit.
+            Cached bodies are served to every client, so the body is requested
+            in the coding of the cache instead, and decoded while it is relayed
+            if the client does not accept it.
+        :param kwargs: Further arguments of `httpx.AsyncClient.build_request`.
+        :return: A streaming response relaying the upstream response.
+        """
+        cache = self.response_cache if cache_key is not None else None
+        upstream_encoding = accept_encoding
+        if cache is not None:
+            upstream_encoding = cache.encoding
+        headers = kwargs.pop("headers", None) or {}
+        headers["Accept-Encoding"] = upstream_encoding or "identity"
+        request = client.build_request(method, url, headers=headers, **kwargs)
+        response = await client.send(request, stream=True)
+
+        response_headers = _response_headers(response)
+        decoder = None
+        encoding = response.headers.get("Content-Encoding")
+        if encoding and cache is not None and not accepts(accept_encoding, encoding):
+            decoder = decompressor(encoding)
+            response_headers = [
+                (key, value)
+                for key, value in response_headers
+                if key.lower() not in ("content-encoding", "content-length")
+            ]
+        if response.status_code != status.HTTP_200_OK:
+            cache = None
+
+        async def body() -> AsyncIterator[bytes]:
+            buffer = bytearray() if cache is not None else None
+            try:
+                async for chunk in response.aiter_raw():
+                    if buffer is not None:
+                        buffer += chunk
+                        if len(buffer) > cache.max_entry_bytes:
+                            buffer = None
+                    if decoder is not None:
+                        chunk = decoder.decompress(chunk)
+                    if chunk:
+                        yield chunk
+            finally:
+                await response.aclose()
+
+            if buffer is not None:
+                await cache.put(
+                    cache_key,
+                    CachedResponse(
+                        status_code=response.status_code,
+                        headers=tuple(_response_headers(response)),
+                        body=bytes(buffer),
+                    ),
+                )
+
+        proxied = StreamingResponse(
+            body(),
+            status_code=response.status_code,
+            # Closes the upstream response if the body is never iterated
+            background=BackgroundTask(response.aclose),
+        )
+        proxied.raw_headers = [
+            (key.lower().encode("latin-1"), value.encode("latin-1"))
+            for key, value in response_headers
+        ]
+        return proxied
+
+    async def _cached(
+        self,
+        cache_key: str,
+        if_none_match: str | None = None,
+        accept_encoding: str | None = None,
+    ) -> Response | None:
+        """
+        Answer a request from the response cache.
+
+        :param cache_key: The key of the requested resource.
+        :param if_none_match: The value of the If-None-Match header, if any.
+        :param accept_encoding: The value of the Accept-Encoding header, if any.
+        :return: The cached response, a 304 if it matches If-None-Match, or
+            None if the resource is not cached.
+        """
+        if self.response_cache is None:
+            return None
+
+        cached = await self.response_cache.get(cache_key)
+        if cached is None:
+            return None
+        return _replay(cached, if_none_match, accept_encoding)
+
+    def _coalesces(self, operation: str) -> bool:
+        return self.single_flight is not None and self.single_flight.covers(operation)
+
+    async def _shared(
+        self, client: AsyncClient, method: str, url: str, cache_key: str | None = None
+    ) -> CachedResponse:
+        """
+        Send a request upstream, sharing the call with identical concurrent
+        requests.
+
+        The shared response is read whole, as every waiting request sends its
+        own copy of it, so only small idempotent responses may be shared. It
+        is requested unconditionally and in the coding of the response cache
+        for the same reason, each request decoding it if needed.
+
+        :param client: The client of the upstream service.
+        :param method: The HTTP method.
+        :param url: The URL, relative to the upstream base URL.
+        :param cache_key: The key to store a successful response under in the
+            response cache, if any.
+        :return: The complete upstream response.
+        :raises HTTPException: If the shared call did not complete in time.
+        """
+
+        async def call() -> CachedResponse:
+            encoding = None
+            if self.response_cache is not None:
+                encoding = self.response_cache.encoding
+            request = client.build_request(
+                method, url, headers={"Accept-Encoding": encoding or "identity"}
+            )
+            response = await client.send(request, stream=True)
+            try:
+                # The body is kept as sent, httpx would decode `content`
+                body = b"".join([chunk async for chunk in response.aiter_raw()])
+            finally:
+                await response.aclose()
+            cached = CachedResponse(
+                status_code=response.status_code,
+                headers=tuple(_response_headers(response)),
+                body=body,
+            )
+            if self.response_cache is not None and cache_key is not None:
+                await self.response_cache.put(cache_key, cached)
+            return cached
+
+        try:
+            return await self.single_flight.do((method, url), call)
+        except TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Upstream request timed out.",
+            )
+
+    async def head_file_by_hash(self, file_hash: str) -> Response:
+        """
+        Check whether a file with the given content hash exists.
 
-    async def upload_file(self, file: UploadFile) -> Response:
+        :param file_hash: The SHA-256 hash of the file content.
+        :return: An empty response, with the file ID in the X-File-Id header if
+            the file exists.
+        """
+        return await self._proxy(
+            self.storage_client, "HEAD", f"/files/by-hash/{file_hash}"
+        )
+
+    async def upload_file(
+        self, request: Request, content_sha256: str | None = None
+    ) -> Response:
         """
         Upload a file to the storage service.
 
-        :param file: The file to be uploaded.
+        With a content hash the storage service is asked for an existing file
+        first, and the request body is only read if there is none.
+
+        :param request: The request carrying the file in the "file" form field.
+        :param content_sha256: The SHA-256 hash of the file content, if known.
         :return: A response indicating the result of the upload operation.
         """
-        if file.content_type not in ["text/plain"]:
-            return Response(
-                status_code=400, content="Invalid file format. Supported formats: TXT."
+        headers = {}
+        if content_sha256 is not None:
+            response = await self.storage_client.head(
+                f"/files/by-hash/{content_sha256}"
             )
-        async with self.storage_client as client:
-            response = await client.post(
-                "/files", files={"file": (file.filename, file.file, file.content_type)}
+            if response.status_code == status.HTTP_200_OK:
+                return Response(
+                    status_code=response.status_code,
+                    content=response.headers["X-File-Id"],
+                )
+            headers["X-Content-SHA256"] = content_sha256
+
+        async with request.form() as form:
+            file = form.get("file")
+            if not isinstance(file, FormFile):
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Field 'file' is required.",
+                )
+            if file.content_type not in ["text/plain"]:
+                return Response(
+                    status_code=400,
+                    content="Invalid file format. Supported formats: TXT.",
+                )
+            # The form spools large files to disk and httpx streams them from
+            # there, so the upload is not held in memory either
+            return await self._proxy(
+                self.storage_client,
+                "POST",
+                "/files",
+                files={"file": (file.filename, file.file, file.content_type)},
+                headers=headers,
             )
-            return Response(status_code=response.status_code, content=response.text)
 
-    async def download_file_by_file_id(self, file_id: int) -> Response:
+    async def upload_files(self, files: list[UploadFile]) -> Response:
+        """
+        Upload many files to the storage service in one request.
+
+        :param files: The files to be uploaded.
+        :return: A response with the ID and status of each file.
+        """
+        for file in files:
+            if file.content_type not in ["text/plain"]:
+                return Response(
+                    status_code=400,
+                    content=(
+                        f"Invalid format of {file.filename}. Supported formats: TXT."
+                    ),
+                )
+        return await self._proxy(
+            self.storage_client,
+            "POST",
+            "/files/batch",
+            files=[
+                ("files", (file.filename, file.file, file.content_type))
+                for file in files
+            ],
+        )
+
+    async def list_files(self, params: dict[str, str | int]) -> Response:
+        """
+        List stored files, one page at a time.
+
+        :param params: The listing query parameters (limit, cursor and filters).
+        :return: A response containing the page of files.
+        """
+        return await self._proxy(self.storage_client, "GET", "/files", params=params)
+
+    async def download_file_by_file_id(
+        self,
+        file_id: int,
+        if_none_match: str | None = None,
+        range_header: str | None = None,
+        if_range: str | None = None,
+        accept_encoding: str | None = None,
+    ) -> Response:
         """
         Download a file by its ID.
 
+        Conditional and range headers are forwarded, so a client revalidating
+        its copy gets a 304 from the storage service without a body. The file
+        is streamed through, compressed if the client accepts the codec it is
+        stored with.
+
         :param file_id: The ID of the file to retrieve.
-        :return: A response containing the file data.
+        :param if_none_match: The value of the If-None-Match header, if any.
+        :param range_header: The value of the Range header, if any.
+        :param if_range: The value of the If-Range header, if any.
+        :param accept_encoding: The value of the Accept-Encoding header, if any.
+        :return: A response streaming the file data.
+        """
+        headers = _request_headers(
+            if_none_match=if_none_match, range=range_header, if_range=if_range
+        )
+        return await self._proxy(
+            self.storage_client,
+            "GET",
+            f"/files/{file_id}",
+            accept_encoding=accept_encoding,
+            headers=headers,
+        )
+
+    async def download_archive(
+        self, file_ids: list[int], in_body: bool = False
+    ) -> Response:
         """
-        async with self.storage_client as client:
-            response = await client.get(f"/files/{file_id}")
-            return Response(content=response.content, headers=response.headers)
+        Download many files as one tar archive.
 
-    async def analyze_file(self, file_id: int) -> Response:
+        The storage service reads the files concurrently and the archive is
+        streamed through as it is produced.
+
+        :param file_ids: The IDs of the files.
+        :param in_body: Whether to send the IDs in a POST body instead of the
+            query string, for lists too long for a URL.
+        :return: A response streaming the archive.
+        """
+        if in_body:
+            return await self._proxy(
+                self.storage_client, "POST", "/files/archive", json={"ids": file_ids}
+            )
+        return await self._proxy(
+            self.storage_client, "GET", "/files/archive", params={"ids": file_ids}
+        )
+
+    async def analyze_files(
+        self, file_ids: list[int], accept_encoding: str | None = None
+    ) -> Response:
+        """
+        Analyze many files in one upstream request.
+
+        Batch results are not cached, only those of single files are.
+
+        :param file_ids: The IDs of the files to analyze.
+        :param accept_encoding: The value of the Accept-Encoding header, if any.
+        :return: A response streaming the results of each file.
+        """
+        return await self._proxy(
+            self.analytics_client,
+            "POST",
+            "/analytics/batch",
+            accept_encoding=accept_encoding,
+            json={"ids": file_ids},
+        )
+
+    async def aggregate_files(
+        self,
+        file_ids: list[int],
+        limit: int | None = None,
+        accept_encoding: str | None = None,
+    ) -> Response:
+        """
+        Aggregate the analytics of many files.
+
+        Aggregates change as files are analyzed, so they are not cached.
+
+        :param file_ids: The IDs of the files.
+        :param limit: The number of most frequent words returned, if limited.
+        :param accept_encoding: The value of the Accept-Encoding header, if any.
+        :return: A response streaming the aggregated analytics.
+        """
+        return await self._proxy(
+            self.analytics_client,
+            "POST",
+            "/analytics/aggregate",
+            accept_encoding=accept_encoding,
+            json={"ids": file_ids, "limit": limit},
+        )
+
+    async def get_corpus(
+        self, limit: int, accept_encoding: str | None = None
+    ) -> Response:
+        """
+        Get the analytics of all the analyzed files, not cached either.
+
+        :param limit: The number of most frequent words returned.
+        :param accept_encoding: The value of the Accept-Encoding header, if any.
+        :return: A response streaming the analytics of all the files.
+        """
+        return await self._proxy(
+            self.analytics_client,
+            "GET",
+            "/analytics/aggregate",
+            accept_encoding=accept_encoding,
+            params={"limit": limit},
+        )
+
+    async def analyze_file(
+        self, file_id: int, accept_encoding: str | None = None
+    ) -> Response:
         """
         Analyze a file by its ID and return analytics results.
 
+        Results never change once computed, so they are served from the
+        response cache when present. Only completed results are cached, not
+        the 202 responses of queued analyses. Concurrent requests for the same file
+        share one upstream call. They are cached in the coding of the response
+        cache and decoded for the clients which do not accept it.
+
         :param file_id: The ID of the file to analyze.
+        :param accept_encoding: The value of the Accept-Encoding header, if any.
         :return: A response containing the analytics results.
         """
-        async with self.analytics_client as client:
-            response = await client.post(f"/analytics/{file_id}")
-            return Response(status_code=response.status_code, content=response.text)
+        cache_key = analytics_cache_key(file_id)
+        if (cached := await self._cached(cache_key, None, accept_encoding)) is not None:
+            return cached
+
+        url = f"/analytics/{file_id}"
+        if self._coalesces("analyze"):
+            shared = await self._shared(self.analytics_client, "POST", url, cache_key)
+            return _replay(shared, None, accept_encoding)
+
+        return await self._proxy(
+            self.analytics_client,
+            "POST",
+            url,
+            accept_encoding=accept_encoding,
+            cache_key=cache_key,
+        )
+
+    async def get_analytics_job(
+        self, job_id: int, accept_encoding: str | None = None
+    ) -> Response:
+        """
+        Get the status of an analytics job.
+
+        Jobs change until they complete, so they are never cached. Polling
+        costs one upstream request and one indexed lookup.
 
-    async def download_wordcloud(self, file_path: str) -> Response:
+        :param job_id: The ID of the job.
+        :param accept_encoding: The value of the Accept-Encoding header, if any.
+        :return: A response containing the job.
+        """
+        return await self._proxy(
+            self.analytics_client,
+            "GET",
+            f"/analytics/jobs/{job_id}",
+            accept_encoding=accept_encoding,
+        )
+
+    async def download_wordcloud(
+        self,
+        file_path: str,
+        if_none_match: str | None = None,
+        accept_encoding: str | None = None,
+    ) -> Response:
         """
         Download the word cloud image for a specific file.
 
+        Images never change once generated, so they are served from the
+        response cache when present, with a 304 if they match If-None-Match.
+        Concurrent requests for the same image share one upstream call.
+
         :param file_path: The path to the word cloud image.
-        :return: A response containing the word cloud image.
+        :param if_none_match: The value of the If-None-Match header, if any.
+        :param accept_encoding: The value of the Accept-Encoding header, if any.
+        :return: A response streaming the word cloud image.
         """
-        async with self.analytics_client as client:
-            response = await client.get(f"/analytics/{file_path}")
-            return Response(content=response.content, headers=response.headers)
+        cache_key = wordcloud_cache_key(file_path)
+        cached = await self._cached(cache_key, if_none_match, accept_encoding)
+        if cached is not None:
+            return cached
+
+        url = f"/analytics/{file_path}"
+        if self._coalesces("wordcloud"):
+            shared = await self._shared(self.analytics_client, "GET", url, cache_key)
+            return _replay(shared, if_none_match, accept_encoding)
+
+        headers = _request_headers(if_none_match=if_none_match)
+        return await self._proxy(
+            self.analytics_client,
+            "GET",
+            url,
+            accept_encoding=accept_encoding,
+            cache_key=cache_key,
+            headers=headers,
+        )
@@ -0,0 +1,102 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+from gateway.config import Config
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Deduplication of concurrent identical calls.
+
+    The first caller of a key starts the call in a task of its own, and
+    callers arriving while it is in flight wait for the same task instead of
+    starting another one. The task is shielded from its waiters, so a client
+    disconnecting does not cancel the call the other clients are waiting for.
+    """
+
+    def __init__(self, scope: frozenset[str], timeout: float | None = None) -> None:
+        """
+        Initialize the call group.
+
+        :param scope: The names of the operations whose calls are coalesced.
+        :param timeout: The number of seconds a caller waits for a shared
+            call, or None to wait indefinitely.
+        """
+        self.scope = scope
+        self.timeout = timeout
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self._flights: dict[Hashable, asyncio.Task] = {}
+
+    def covers(self, operation: str) -> bool:
+        """
+        Check whether the calls of an operation are coalesced.
+
+        :param operation: The name of the operation, e.g. "analyze".
+        """
+        return operation in self.scope
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved, all waiters may have timed out
+            task.exception()
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a call, or join the identical call already in flight.
+
+        :param key: The key identifying identical calls.
+        :param call: The function starting the call.
+        :return: The result of the shared call.
+        :raises TimeoutError: If the shared call did not complete in time. It
+            is then forgotten, so later callers start a new one.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            if self._flights.get(key) is task:
+                del self._flights[key]
+            raise
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the coalescing counters.
+
+        :return: The number of started, coalesced, timed out and in-flight
+            calls.
+        """
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "in_flight": len(self._flights),
+        }
+
+
+def create_single_flight(config: type[Config] = Config) -> SingleFlight:
+    """
+    Create the call group from the configuration.
+
+    :param config: The configuration object.
+    :return: The call group.
+    """
+    return SingleFlight(
+        scope=config.SingleFlight.SCOPE, timeout=config.SingleFlight.TIMEOUT or None
+    )
@@ -0,0 +1,269 @@
+"""
+Distributed tracing of the service with OpenTelemetry.
+
+The W3C ``traceparent`` header of incoming requests is continued by a pure
+ASGI middleware and propagated to the upstream services by an httpx
+transport wrapper, so one trace covers every hop of a request. Spans are
+exported to a JSON lines file, readable offline with
+``python -m gateway.tracing traces.jsonl``, or to an OTLP collector.
+
+Without an exporter no span is recorded, but incoming trace contexts are
+still propagated upstream.
+"""
+
+import argparse
+import json
+from collections import defaultdict
+from collections.abc import Sequence
+from pathlib import Path
+from threading import Lock
+
+import httpx
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from gateway.config import Config
+
+
+SERVICE_NAME = "gateway"
+
+tracer = trace.get_tracer(SERVICE_NAME)
+
+
+class JsonFileSpanExporter(SpanExporter):
+    """
+    Exporter appending spans to a file, one JSON object per line.
+
+    Each batch is written with a single call on a file opened for appending,
+    so several processes may share the file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: The path of the file.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+
+    @staticmethod
+    def _to_dict(span: ReadableSpan) -> dict:
+        parent = span.parent
+        return {
+            "service": span.resource.attributes.get("service.name"),
+            "trace_id": f"{span.context.trace_id:032x}",
+            "span_id": f"{span.context.span_id:016x}",
+            "parent_id": f"{parent.span_id:016x}" if parent else None,
+            "name": span.name,
+            "kind": span.kind.name,
+            "start": span.start_time,
+            "end": span.end_time,
+            "status": span.status.status_code.name,
+            "attributes": dict(span.attributes or {}),
+        }
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(
+            json.dumps(self._to_dict(span), default=str) + "\n" for span in spans
+        )
+        try:
+            with self._lock, self.path.open("a", encoding="utf-8") as file:
+                file.write(lines)
+        except OSError:
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+
+def setup_tracing(config: type[Config] = Config) -> TracerProvider | None:
+    """
+    Install the tracer provider of the service from the configuration.
+
+    :param config: The configuration object.
+    :return: The provider, to be shut down on exit, or None if tracing is
+        disabled.
+    :raises ValueError: If the exporter is unknown.
+    """
+    match config.Tracing.EXPORTER:
+        case "none" | "":
+            return None
+        case "jsonl":
+            exporter = JsonFileSpanExporter(config.Tracing.FILE)
+        case "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,  # lazy import, optional dependency
+            )
+
+            exporter = OTLPSpanExporter(endpoint=config.Tracing.OTLP_ENDPOINT or None)
+        case _:
+            raise ValueError(f"Unsupported tracing exporter: {config.Tracing.EXPORTER}")
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(config.Tracing.SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware wrapping each HTTP request in a server span.
+
+    The span continues the trace of the ``traceparent`` request header, if
+    any, and lasts until the response is completely sent.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name in (b"traceparent", b"tracestate")
+        }
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with tracer.start_as_current_span(
+            method,
+            context=propagate.extract(carrier),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"]},
+        ) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path_format", None)
+                if route is not None:
+                    span.update_name(f"{method} {route}")
+                    span.set_attribute("http.route", route)
+                span.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapping each request to an upstream service in a client span,
+    and propagating the trace to it with the ``traceparent`` header.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, upstream: str) -> None:
+        """
+        :param transport: The wrapped transport, sending the requests.
+        :param upstream: The name of the upstream service.
+        """
+        self.transport = transport
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with tracer.start_as_current_span(
+            f"{request.method} {self.upstream}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "http.request.method": request.method,
+                "url.full": str(request.url),
+                "peer.service": self.upstream,
+            },
+        ) as span:
+            propagate.inject(request.headers)
+            response = await self.transport.handle_async_request(request)
+            span.set_attribute("http.response.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.set_status(Status(StatusCode.ERROR))
+            return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _load_spans(paths: Sequence[str]) -> list[dict]:
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            spans.extend(json.loads(line) for line in file if line.strip())
+    return spans
+
+
+def _print_tree(span: dict, children: dict[str, list[dict]], depth: int) -> None:
+    duration = (span["end"] - span["start"]) / 1e6
+    label = f"{'  ' * depth}{span['service']}: {span['name']}"
+    print(f"{label:<72} {duration:>10.2f} ms")
+    for child in sorted(children[span["span_id"]], key=lambda child: child["start"]):
+        _print_tree(child, children, depth + 1)
+
+
+def report(paths: Sequence[str], traces: int = 5) -> None:
+    """
+    Print the latency breakdown of traces exported to JSON lines files.
+
+    The slowest traces are printed as span trees, followed by the time spent
+    in each span name across all traces, excluding the time of its children.
+
+    :param paths: The span files, e.g. one per service.
+    :param traces: The number of slowest traces to print.
+    """
+    spans = _load_spans(paths)
+    children: dict[str, list[dict]] = defaultdict(list)
+    ids = {span["span_id"] for span in spans}
+    roots = []
+    for span in spans:
+        if span["parent_id"] in ids:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+
+    roots.sort(key=lambda span: span["end"] - span["start"], reverse=True)
+    for root in roots[:traces]:
+        print(f"trace {root['trace_id']}")
+        _print_tree(root, children, 1)
+        print()
+
+    self_times: dict[str, float] = defaultdict(float)
+    counts: dict[str, int] = defaultdict(int)
+    for span in spans:
+        duration = span["end"] - span["start"]
+        nested = sum(
+            child["end"] - child["start"] for child in children[span["span_id"]]
+        )
+        key = f"{span['service']}: {span['name']}"
+        # Concurrent children may add up to more than their parent
+        self_times[key] += max(duration - nested, 0) / 1e6
+        counts[key] += 1
+
+    print(f"{'span':<60} {'count':>7} {'self ms':>12} {'avg ms':>10}")
+    for key, total in sorted(self_times.items(), key=lambda item: -item[1]):
+        print(f"{key:<60} {counts[key]:>7} {total:>12.2f} {total / counts[key]:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print the latency breakdown of exported traces."
+    )
+    parser.add_argument("paths", nargs="+", help="JSON lines span files")
+    parser.add_argument(
+        "--traces", type=int, default=5, help="number of slowest traces to print"
+    )
+    args = parser.parse_args()
+    report(args.paths, args.traces)
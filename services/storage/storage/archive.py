@@ -0,0 +1,130 @@
+"""
+Streaming of several files as one tar archive.
+
+The size of every file is known from its metadata, so each tar header can be
+written before the content is read, and the archive is produced entry by
+entry without ever being assembled in memory.
+"""
+
+import asyncio
+import tarfile
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Sequence
+from pathlib import PurePosixPath
+
+from storage.cache import FileMetadata
+
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+# Two zero blocks mark the end of a tar archive
+END_OF_ARCHIVE = b"\0" * (2 * BLOCK_SIZE)
+
+
+def entry_name(file: FileMetadata) -> str:
+    """
+    Name a file in the archive, prefixed with its ID so names never collide.
+
+    :param file: The file metadata.
+    :return: The name of the archive entry.
+    """
+    name = PurePosixPath((file.name or "").replace("\\", "/")).name
+    if name in ("", ".", ".."):
+        return str(file.id)
+    return f"{file.id}_{name}"
+
+
+def tar_header(file: FileMetadata) -> bytes:
+    """
+    Build the tar header of a file.
+
+    :param file: The file metadata.
+    :return: The header blocks, with a PAX extension for long or non ASCII
+        names.
+    """
+    info = tarfile.TarInfo(entry_name(file))
+    info.size = file.size
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT)
+
+
+def tar_size(files: Sequence[FileMetadata]) -> int:
+    """
+    Compute the size of the tar archive of files before streaming it.
+
+    :param files: The files to be archived.
+    :return: The size of the archive, in bytes.
+    """
+    return sum(
+        len(tar_header(file)) + file.size + -file.size % BLOCK_SIZE for file in files
+    ) + len(END_OF_ARCHIVE)
+
+
+async def _fill(chunks: AsyncIterator[bytes], queue: asyncio.Queue) -> None:
+    # None marks the end of the content, an exception its failure
+    try:
+        async for chunk in chunks:
+            await queue.put(chunk)
+    except Exception as error:
+        await queue.put(error)
+    else:
+        await queue.put(None)
+
+
+async def stream_tar(
+    files: Sequence[FileMetadata],
+    open_file: Callable[[FileMetadata], AsyncIterator[bytes]],
+    concurrency: int,
+    buffer_chunks: int = 4,
+) -> AsyncIterator[bytes]:
+    """
+    Stream files as a tar archive, in order.
+
+    Up to `concurrency` files are read at once: while an entry is sent, the
+    next files are already being read into bounded buffers, so slow reads
+    overlap without holding more than `concurrency * buffer_chunks` chunks in
+    memory.
+
+    :param files: The files to be archived.
+    :param open_file: The function streaming the content of a file.
+    :param concurrency: The maximum number of files read at once.
+    :param buffer_chunks: The number of chunks read ahead of each file.
+    :return: An async iterator over the archive data.
+    :raises ValueError: If the content of a file does not match its size, the
+        archive would be corrupted past this point.
+    """
+    remaining = iter(files)
+    reading: deque[tuple[FileMetadata, asyncio.Queue, asyncio.Task]] = deque()
+
+    def read_next() -> None:
+        file = next(remaining, None)
+        if file is not None:
+            queue = asyncio.Queue(buffer_chunks)
+            task = asyncio.create_task(_fill(open_file(file), queue))
+            reading.append((file, queue, task))
+
+    try:
+        for _ in range(max(concurrency, 1)):
+            read_next()
+
+        while reading:
+            file, queue, _ = reading.popleft()
+            yield tar_header(file)
+
+            size = 0
+            while (chunk := await queue.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                size += len(chunk)
+                yield chunk
+            if size != file.size:
+                raise ValueError(
+                    f"File {file.id} has {size} bytes instead of {file.size}."
+                )
+
+            yield b"\0" * (-size % BLOCK_SIZE)
+            read_next()
+
+        yield END_OF_ARCHIVE
+    finally:
+        for _, _, task in reading:
+            task.cancel()
@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+
+from storage.databases.files import File as DBFile
+
+
+@dataclass(frozen=True, slots=True)
+class FileMetadata:
+    """
+    Immutable snapshot of a file row, safe to share between requests.
+    """
+
+    id: int
+    name: str
+    hash: str
+    size: int
+    mime_type: str
+    content_path: str
+    codec: str
+    stored_size: int
+
+    @classmethod
+    def from_db(cls, db_file: DBFile) -> 'FileMetadata':
+        return cls(
+            id=db_file.id,
+            name=db_file.name,
+            hash=db_file.hash,
+            size=db_file.size,
+            mime_type=db_file.mime_type,
+            content_path=db_file.content_path,
+            codec=db_file.codec,
+            stored_size=(
+                db_file.size if db_file.stored_size is None else db_file.stored_size
+            ),
+        )
+
+
+class MetadataCache:
+    """
+    Bounded LRU cache of file metadata with a time-to-live.
+
+    File rows never change after they are inserted, so entries can be looked up
+    by id, content path or hash without going to the database. Only existing
+    files are cached: a miss always falls through to the database.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        """
+        Initialize the cache.
+
+        :param max_size: The maximum number of cached files, 0 disables caching.
+        :param ttl: The number of seconds an entry stays valid.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[float, FileMetadata]] = OrderedDict()
+        self._ids_by_hash: dict[str, int] = {}
+        self._ids_by_path: dict[str, int] = {}
+
+    def _remove(self, file_id: int) -> None:
+        _, metadata = self._entries.pop(file_id)
+        self._ids_by_hash.pop(metadata.hash, None)
+        self._ids_by_path.pop(metadata.content_path, None)
+
+    def get_by_id(self, file_id: int | None) -> FileMetadata | None:
+        """
+        Get the metadata of a file by its ID.
+
+        :param file_id: The ID of the file.
+        :return: The cached metadata, or None on a miss.
+        """
+        entry = self._entries.get(file_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, metadata = entry
+        if expires_at < monotonic():
+            self._remove(file_id)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(file_id)
+        self.hits += 1
+        return metadata
+
+    def get_by_hash(self, file_hash: str) -> FileMetadata | None:
+        """
+        Get the metadata of a file by its content hash.
+
+        :param file_hash: The SHA-256 hash of the file.
+        :return: The cached metadata, or None on a miss.
+        """
+        return self.get_by_id(self._ids_by_hash.get(file_hash))
+
+    def get_by_path(self, content_path: str) -> FileMetadata | None:
+        """
+        Get the metadata of a file by its content path.
+
+        :param content_path: The path of the file content in the storage.
+        :return: The cached metadata, or None on a miss.
+        """
+        return self.get_by_id(self._ids_by_path.get(content_path))
+
+    def put(self, metadata: FileMetadata) -> None:
+        """
+        Add the metadata of a file to the cache, evicting the least recently
+        used entries if it is full.
+
+        :param metadata: The metadata to cache.
+        """
+        if self.max_size <= 0:
+            return
+
+        if metadata.id in self._entries:
+            self._remove(metadata.id)
+        self._entries[metadata.id] = (monotonic() + self.ttl, metadata)
+        self._ids_by_hash[metadata.hash] = metadata.id
+        self._ids_by_path[metadata.content_path] = metadata.id
+
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def stats(self) -> dict[str, int | float]:
+        """
+        Get the cache usage counters.
+
+        :return: The size, hits, misses and hit ratio of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -19,6 +19,17 @@ class Config:
     class FilesStorage:
         BACKEND: str = getenv("FILES_STORAGE_BACKEND", "LOCAL")
         FILES_DIR: str = getenv("FILES_STORAGE_FILES_DIR", "files")
+        UPLOAD_CHUNK_SIZE: int = int(
+            getenv("FILES_STORAGE_UPLOAD_CHUNK_SIZE", 1024 * 1024)
+        )
+        BATCH_CONCURRENCY: int = int(getenv("FILES_STORAGE_BATCH_CONCURRENCY", 8))
+        CODEC: str = getenv("FILES_STORAGE_CODEC", "identity")
+        # 0 selects the default level of the codec
+        CODEC_LEVEL: int = int(getenv("FILES_STORAGE_CODEC_LEVEL", 0))
+
+    class Cache:
+        METADATA_MAX_SIZE = int(getenv("CACHE_METADATA_MAX_SIZE", 10000))
+        METADATA_TTL = float(getenv("CACHE_METADATA_TTL", 3600))
 
     class S3:
         ENDPOINT_URL = getenv("S3_ENDPOINT_URL", "https://s3.amazonaws.com")
@@ -26,6 +37,23 @@ class Config:
         SECRET_KEY = getenv("S3_SECRET_KEY", "your_secret_key")
         BUCKET_NAME = getenv("S3_BUCKET_NAME", "your_bucket_name")
         REGION = getenv("S3_REGION", "us-east-1")
+        MULTIPART_THRESHOLD = int(getenv("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+        MULTIPART_PART_SIZE = int(getenv("S3_MULTIPART_PART_SIZE", 8 * 1024 * 1024))
+        MULTIPART_CONCURRENCY = int(getenv("S3_MULTIPART_CONCURRENCY", 4))
+        MAX_POOL_CONNECTIONS = int(getenv("S3_MAX_POOL_CONNECTIONS", 32))
 
     class Local:
         BASE_DIR = getenv("LOCAL_STORAGE_BASE_DIR", "./.cache")
+        SHARD_DEPTH = int(getenv("LOCAL_STORAGE_SHARD_DEPTH", 2))
+        SHARD_WIDTH = int(getenv("LOCAL_STORAGE_SHARD_WIDTH", 2))
+        FSYNC = getenv("LOCAL_STORAGE_FSYNC", "false").lower() == "true"
+
+    class Tracing:
+        # Span exporter, "none", "jsonl" (spans appended to FILE) or "otlp"
+        # (requires the otlp extra). Trace contexts are propagated in any case
+        EXPORTER = getenv("TRACING_EXPORTER", "none").lower()
+        FILE = getenv("TRACING_FILE", "traces/storage.jsonl")
+        # OTLP/HTTP traces endpoint, empty uses OTEL_EXPORTER_OTLP_ENDPOINT
+        OTLP_ENDPOINT = getenv("TRACING_OTLP_ENDPOINT", "")
+        # Fraction of the new traces recorded, sampled requests keep their decision
+        SAMPLE_RATIO = float(getenv("TRACING_SAMPLE_RATIO", 1))
@@ -1,10 +1,13 @@
 from datetime import datetime
 
-from sqlalchemy import func
+from sqlalchemy import Connection, func, inspect, text
 from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.schema import CreateColumn
 
 from storage.config import Config
+from storage.metrics import MeteredPool, instrument_engine
+from storage.tracing import trace_engine
 
 
 engine = create_async_engine(
@@ -13,7 +16,10 @@ engine = create_async_engine(
     pool_pre_ping=Config.Database.POOL_PRE_PING,
     pool_size=Config.Database.POOL_SIZE,
     max_overflow=Config.Database.MAX_OVERFLOW,
+    poolclass=MeteredPool,
 )
+instrument_engine(engine)
+trace_engine(engine)
 Session = async_sessionmaker(engine, expire_on_commit=False)
 TABLE_ARGS = {"extend_existing": True, "schema": Config.Database.SCHEMA}
 
@@ -34,8 +40,40 @@ class Base(DeclarativeBase, AsyncAttrs):
     )
 
 
+def _add_missing_columns(connection: Connection) -> None:
+    # create_all skips existing tables, so columns added later are added here.
+    # Such columns must be nullable or have a server default.
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name, schema=table.schema):
+            continue
+
+        existing = {
+            column["name"]
+            for column in inspector.get_columns(table.name, schema=table.schema)
+        }
+        for column in table.columns:
+            if column.name not in existing:
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                        f"{CreateColumn(column).compile(dialect=connection.dialect)}"
+                    )
+                )
+
+
+def _create_missing_indexes(connection: Connection) -> None:
+    # create_all skips existing tables, so indexes added later are created here
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
 async def create_tables() -> None:
     async with engine.begin() as conn:
         # await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
         await conn.commit()
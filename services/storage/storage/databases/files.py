@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import TABLE_ARGS, Base
@@ -9,7 +10,17 @@ class File(Base):
     """
 
     __tablename__ = "files"
-    __table_args__ = (TABLE_ARGS,)
+    __table_args__ = (
+        # Keyset pagination of the file listing, covering its projection
+        Index(
+            "ix_files_created_at_id",
+            "created_at",
+            "id",
+            postgresql_include=["name", "size", "mime_type"],
+        ),
+        Index("ix_files_mime_type_created_at_id", "mime_type", "created_at", "id"),
+        TABLE_ARGS,
+    )
 
     name: Mapped[str]
     hash: Mapped[str] = mapped_column(nullable=False, unique=True)
@@ -19,3 +30,7 @@ class File(Base):
     content_path: Mapped[str] = mapped_column(
         nullable=False, unique=True
     )  # Path to the file content
+    codec: Mapped[str] = mapped_column(
+        nullable=False, server_default="identity"
+    )  # Compression of the file content, see storage.fs.codecs
+    stored_size: Mapped[int | None]  # Size of the stored content, if compressed
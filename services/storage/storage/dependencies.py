@@ -1,8 +1,11 @@
+from functools import cache
 from typing import Annotated
 
 from fastapi import Depends
 
+from storage.cache import MetadataCache
 from storage.config import Config
+from storage.fs.codecs import get_codec
 from storage.fs.drivers.base import BaseFileStorageDriver
 from storage.fs.storage import FilesStorage
 from storage.services.storage import StorageService
@@ -25,7 +28,12 @@ def get_files_storage_driver(config: ConfigDep) -> BaseFileStorageDriver:
                 FilesystemStorageDriver,  # lazy import
             )
 
-            return FilesystemStorageDriver(base_path=config.Local.BASE_DIR)
+            return FilesystemStorageDriver(
+                base_path=config.Local.BASE_DIR,
+                shard_depth=config.Local.SHARD_DEPTH,
+                shard_width=config.Local.SHARD_WIDTH,
+                fsync=config.Local.FSYNC,
+            )
         case 's3':
             from storage.fs.drivers.s3 import S3StorageDriver  # lazy import
 
@@ -35,6 +43,10 @@ def get_files_storage_driver(config: ConfigDep) -> BaseFileStorageDriver:
                 secret_key=config.S3.SECRET_KEY,
                 bucket_name=config.S3.BUCKET_NAME,
                 region=config.S3.REGION,
+                multipart_threshold=config.S3.MULTIPART_THRESHOLD,
+                multipart_part_size=config.S3.MULTIPART_PART_SIZE,
+                multipart_concurrency=config.S3.MULTIPART_CONCURRENCY,
+                max_pool_connections=config.S3.MAX_POOL_CONNECTIONS,
             )
         case _:
             raise ValueError(
@@ -51,22 +63,49 @@ def get_files_storage(
     :return: An instance of FilesStorage.
     """
 
-    return FilesStorage(driver=driver)
+    return FilesStorage(
+        driver=driver,
+        codec=get_codec(
+            Config.FilesStorage.CODEC, Config.FilesStorage.CODEC_LEVEL or None
+        ),
+    )
 
 
 FilesStorageDep = Annotated[FilesStorage, Depends(get_files_storage)]
 
 
+@cache
+def get_metadata_cache() -> MetadataCache:
+    """
+    Dependency to get the process-wide MetadataCache instance.
+
+    :return: The shared instance of MetadataCache.
+    """
+    return MetadataCache(
+        max_size=Config.Cache.METADATA_MAX_SIZE, ttl=Config.Cache.METADATA_TTL
+    )
+
+
+MetadataCacheDep = Annotated[MetadataCache, Depends(get_metadata_cache)]
+
+
 def get_storage_service(
-    config: ConfigDep, file_storage: FilesStorageDep
+    config: ConfigDep, file_storage: FilesStorageDep, metadata_cache: MetadataCacheDep
 ) -> 'StorageService':
     """
     Dependency to get the StorageService instance.
 
     :param file_storage: The FilesStorage instance.
+    :param metadata_cache: The MetadataCache instance.
     :return: An instance of StorageService.
     """
-    return StorageService(file_storage, files_dir=config.FilesStorage.FILES_DIR)
+    return StorageService(
+        file_storage,
+        metadata_cache=metadata_cache,
+        files_dir=config.FilesStorage.FILES_DIR,
+        chunk_size=config.FilesStorage.UPLOAD_CHUNK_SIZE,
+        batch_concurrency=config.FilesStorage.BATCH_CONCURRENCY,
+    )
 
 
 StorageServiceDep = Annotated[StorageService, Depends(get_storage_service)]
@@ -0,0 +1,218 @@
+"""
+Codecs compressing file contents at rest.
+
+The codec of each file is recorded with its metadata, so files written with
+different codecs, including uncompressed files written before compression was
+enabled, can be read side by side.
+"""
+
+import asyncio
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterable, AsyncIterator
+from functools import cache
+from typing import Protocol
+
+
+# Compressed chunks at least this large are decompressed in a worker thread,
+# they expand to several times their size
+THREAD_THRESHOLD = 64 * 1024
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class Decompressor(Protocol):
+    def decompress(self, data: bytes) -> bytes: ...
+
+
+class Codec(ABC):
+    """
+    A compression format for stored files.
+    """
+
+    #: The name recorded in the file metadata
+    name: str
+    #: The HTTP content coding of the compressed bytes
+    content_encoding: str | None
+    #: The suffix of the stored file path
+    suffix: str
+
+    @abstractmethod
+    def compressor(self) -> Compressor:
+        """
+        Create a streaming compressor.
+        """
+
+    @abstractmethod
+    def decompressor(self) -> Decompressor:
+        """
+        Create a streaming decompressor.
+        """
+
+    async def encode(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        """
+        Compress a stream of chunks.
+
+        Chunks are compressed in a worker thread, both zlib and zstd release
+        the GIL while doing so.
+
+        :param chunks: The raw data chunks.
+        :return: An async iterator over the compressed chunks.
+        """
+        compressor = self.compressor()
+        async for chunk in chunks:
+            if compressed := await asyncio.to_thread(compressor.compress, chunk):
+                yield compressed
+        if compressed := compressor.flush():
+            yield compressed
+
+    async def decompress(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        """
+        Decompress a stream of chunks.
+
+        Large chunks are decompressed in a worker thread, like they are
+        compressed, the smaller ones on the event loop, where they take less
+        time than a thread switch.
+
+        :param chunks: The compressed data chunks.
+        :return: An async iterator over the decompressed chunks.
+        """
+        decompressor = self.decompressor()
+        async for chunk in chunks:
+            if len(chunk) >= THREAD_THRESHOLD:
+                data = await asyncio.to_thread(decompressor.decompress, chunk)
+            else:
+                data = decompressor.decompress(chunk)
+            if data:
+                yield data
+
+    def decode(
+        self, chunks: AsyncIterable[bytes], start: int = 0, end: int | None = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Decompress a stream of chunks, optionally keeping a byte range only.
+
+        Compressed streams cannot be seeked, so the bytes before `start` are
+        decompressed and dropped.
+
+        :param chunks: The compressed data chunks.
+        :param start: The offset of the first decompressed byte to yield.
+        :param end: The offset of the last decompressed byte to yield
+            (inclusive).
+        :return: An async iterator over the decompressed chunks.
+        """
+        return slice_stream(self.decompress(chunks), start, end)
+
+
+async def slice_stream(
+    chunks: AsyncIterable[bytes], start: int = 0, end: int | None = None
+) -> AsyncIterator[bytes]:
+    """
+    Keep a byte range of a stream of chunks.
+
+    :param chunks: The data chunks.
+    :param start: The offset of the first byte to yield.
+    :param end: The offset of the last byte to yield (inclusive).
+    :return: An async iterator over the chunks of the range.
+    """
+    position = 0
+    async for chunk in chunks:
+        chunk_start, position = position, position + len(chunk)
+        if position <= start:
+            continue
+        if end is not None and chunk_start > end:
+            break
+
+        chunk = chunk[max(start - chunk_start, 0) :]
+        if end is not None and position > end + 1:
+            chunk = chunk[: len(chunk) - (position - end - 1)]
+        if chunk:
+            yield chunk
+
+
+class IdentityCodec(Codec):
+    name = "identity"
+    content_encoding = None
+    suffix = ""
+
+    def compressor(self) -> Compressor:
+        raise NotImplementedError("The identity codec does not compress.")
+
+    def decompressor(self) -> Decompressor:
+        raise NotImplementedError("The identity codec does not compress.")
+
+    async def encode(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in chunks:
+            yield chunk
+
+    async def decompress(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in chunks:
+            yield chunk
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    content_encoding = "gzip"
+    suffix = ".gz"
+
+    def __init__(self, level: int | None = None) -> None:
+        """
+        :param level: The compression level, from 1 to 9.
+        """
+        self.level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+
+    def compressor(self) -> Compressor:
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def decompressor(self) -> Decompressor:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    content_encoding = "zstd"
+    suffix = ".zst"
+
+    def __init__(self, level: int | None = None) -> None:
+        """
+        :param level: The compression level, from 1 to 22.
+        """
+        import zstandard  # lazy import, optional dependency
+
+        self._zstandard = zstandard
+        self.level = 3 if level is None else level
+
+    def compressor(self) -> Compressor:
+        return self._zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self) -> Decompressor:
+        return self._zstandard.ZstdDecompressor().decompressobj()
+
+
+CODECS: dict[str, type[Codec]] = {
+    IdentityCodec.name: IdentityCodec,
+    GzipCodec.name: GzipCodec,
+    ZstdCodec.name: ZstdCodec,
+}
+
+
+@cache
+def get_codec(name: str, level: int | None = None) -> Codec:
+    """
+    Get a codec by the name recorded in the file metadata.
+
+    :param name: The name of the codec.
+    :param level: The compression level, or None for the codec default.
+    :return: The codec instance.
+    :raises ValueError: If the codec is unknown.
+    """
+    codec = CODECS.get(name.lower())
+    if codec is None:
+        raise ValueError(f"Unsupported codec: {name}")
+    if codec is IdentityCodec:
+        return IdentityCodec()
+    return codec(level)
@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from pathlib import Path
 
 
 class BaseFileStorageDriver(ABC):
@@ -15,6 +17,38 @@ class BaseFileStorageDriver(ABC):
         :param data: The data to be stored in the file.
         """
 
+    @abstractmethod
+    async def upload_stream(self, chunks: AsyncIterable[bytes]) -> str:
+        """
+        Write a stream of chunks to a temporary object in the storage.
+
+        The object is not visible under any content path until it is committed
+        with :meth:`commit` or dropped with :meth:`discard`.
+
+        :param chunks: The data chunks to be written, in order.
+        :return: The path of the temporary object.
+        """
+
+    @abstractmethod
+    async def commit(self, temp_path: str, file_path: str) -> None:
+        """
+        Move a temporary object to its final path.
+
+        Paths are content-addressed, so if the final path already exists the
+        temporary object is dropped and the existing one is kept.
+
+        :param temp_path: The path returned by :meth:`upload_stream`.
+        :param file_path: The path where the file will be stored.
+        """
+
+    @abstractmethod
+    async def discard(self, temp_path: str) -> None:
+        """
+        Remove a temporary object that will not be committed.
+
+        :param temp_path: The path returned by :meth:`upload_stream`.
+        """
+
     @abstractmethod
     async def download(self, file_path: str) -> bytes:
         """
@@ -24,6 +58,32 @@ class BaseFileStorageDriver(ABC):
         :return: The data of the downloaded file.
         """
 
+    @abstractmethod
+    def stream(
+        self, file_path: str, start: int = 0, end: int | None = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream a file from the storage in chunks.
+
+        :param file_path: The path of the file to be streamed.
+        :param start: The offset of the first byte to be read.
+        :param end: The offset of the last byte to be read (inclusive), or None
+            to read until the end of the file.
+        :return: An async iterator over the data chunks.
+        """
+
+    def local_path(self, file_path: str) -> Path | None:
+        """
+        Get the path of a file on the local filesystem, if the driver has one.
+
+        Files with a local path can be served with sendfile instead of being
+        streamed through Python.
+
+        :param file_path: The path of the file in the storage.
+        :return: The local path of the file, or None if it is not stored locally.
+        """
+        return None
+
     @abstractmethod
     async def delete(self, file_path: str) -> None:
         """
@@ -31,3 +91,14 @@ class BaseFileStorageDriver(ABC):
 
         :param file_path: The path of the file to be deleted.
         """
+
+    async def delete_many(self, file_paths: Iterable[str]) -> None:
+        """
+        Delete several files from the storage.
+
+        Drivers with a batch delete operation should override this method.
+
+        :param file_paths: The paths of the files to be deleted.
+        """
+        for file_path in file_paths:
+            await self.delete(file_path)
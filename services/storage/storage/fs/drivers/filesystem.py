@@ -1,7 +1,12 @@
-from pathlib import Path
+import asyncio
+import os
+from collections.abc import AsyncIterable, AsyncIterator
+from pathlib import Path, PurePosixPath
 from typing import override
+from uuid import uuid4
 
 import aiofiles
+import aiofiles.os
 from loguru import logger
 
 from storage.config import Config
@@ -13,38 +18,201 @@ logger.debug("Loading filesystem storage driver module")
 
 
 class FilesystemStorageDriver(BaseFileStorageDriver):
-    def __init__(self, base_path: str = Config.Local.BASE_DIR) -> None:
+    """
+    Driver storing files on the local filesystem.
+
+    Files are sharded by the leading characters of their name, so
+    ``files/<hash>`` is stored as ``files/ab/cd/<hash>`` and no directory grows
+    beyond a bounded number of entries. Files still stored in the flat layout
+    are found as well, see `storage.fs.migrate`.
+
+    Every write goes to a temporary file first and is published with an
+    atomic link, so readers never see a partially written file.
+    """
+
+    TEMP_DIR = ".tmp"
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        base_path: str = Config.Local.BASE_DIR,
+        shard_depth: int = Config.Local.SHARD_DEPTH,
+        shard_width: int = Config.Local.SHARD_WIDTH,
+        fsync: bool = Config.Local.FSYNC,
+    ) -> None:
         """
         Initialize the filesystem storage driver.
 
         :param base_path: The base path for the storage.
+        :param shard_depth: The number of shard directories above each file.
+        :param shard_width: The number of name characters per shard directory.
+        :param fsync: Whether to flush files to disk before publishing them.
         """
         self.base_path = Path(base_path)
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+        self.fsync = fsync
         self.base_path.mkdir(parents=True, exist_ok=True)
+        (self.base_path / self.TEMP_DIR).mkdir(exist_ok=True)
+
+    def _full_path(self, file_path: str) -> Path:
+        full_path = self.base_path / file_path
+        if ".." in PurePosixPath(file_path).parts:
+            raise ValueError("File path must be within the base path.")
+        if not full_path.is_relative_to(self.base_path):
+            raise ValueError("File path must be within the base path.")
+        return full_path
+
+    def sharded_path(self, file_path: str) -> Path:
+        """
+        Get the location of a file in the sharded layout.
+
+        Names too short to be sharded are stored as is.
+
+        :param file_path: The path of the file in the storage.
+        :return: The local path of the file.
+        """
+        full_path = self._full_path(file_path)
+        name = full_path.name
+        if len(name) <= self.shard_depth * self.shard_width:
+            return full_path
+
+        shards = [
+            name[i * self.shard_width : (i + 1) * self.shard_width]
+            for i in range(self.shard_depth)
+        ]
+        return full_path.parent.joinpath(*shards, name)
+
+    def _resolve(self, file_path: str) -> Path:
+        sharded_path = self.sharded_path(file_path)
+        if sharded_path.exists():
+            return sharded_path
+
+        flat_path = self._full_path(file_path)
+        if flat_path.exists():
+            return flat_path
+
+        # The file may have been migrated between the two checks, which links
+        # the sharded path before removing the flat one
+        return sharded_path
+
+    async def _write_temp(self, chunks: AsyncIterable[bytes]) -> str:
+        temp_path = f"{self.TEMP_DIR}/{uuid4().hex}"
+
+        try:
+            async with aiofiles.open(self.base_path / temp_path, "wb") as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+                if self.fsync:
+                    await f.flush()
+                    await asyncio.to_thread(os.fsync, f.fileno())
+        except BaseException:
+            await self.discard(temp_path)
+            raise
+
+        return temp_path
+
+    async def _publish(self, temp_path: str, full_path: Path) -> bool:
+        """
+        Atomically move a temporary file to its final path, unless it exists.
+
+        :return: True if the file was published, False if the path was taken.
+        """
+        await aiofiles.os.makedirs(full_path.parent, exist_ok=True)
+        try:
+            # Unlike rename, link never replaces an existing file
+            await aiofiles.os.link(self.base_path / temp_path, full_path)
+        except FileExistsError:
+            return False
+        except OSError:
+            # Filesystems without hard links
+            if full_path.exists():
+                return False
+            await aiofiles.os.replace(self.base_path / temp_path, full_path)
+        finally:
+            await self.discard(temp_path)
+
+        if self.fsync:
+            fd = await asyncio.to_thread(os.open, full_path.parent, os.O_RDONLY)
+            try:
+                await asyncio.to_thread(os.fsync, fd)
+            finally:
+                os.close(fd)
+        return True
 
     @override
     async def upload(self, file_path: str, data: bytes) -> None:
-        full_path = self.base_path / file_path
+        full_path = self.sharded_path(file_path)
+        if self._resolve(file_path).exists():
+            raise FileExistsError(f"File {file_path} already exists in storage.")
+
+        async def chunks() -> AsyncIterator[bytes]:
+            yield data
 
-        if full_path.exists():
+        temp_path = await self._write_temp(chunks())
+        if not await self._publish(temp_path, full_path):
             raise FileExistsError(f"File {file_path} already exists in storage.")
 
-        if not full_path.is_relative_to(self.base_path):
-            raise ValueError("File path must be within the base path.")
+    @override
+    async def upload_stream(self, chunks: AsyncIterable[bytes]) -> str:
+        return await self._write_temp(chunks)
+
+    @override
+    async def commit(self, temp_path: str, file_path: str) -> None:
+        full_path = self.sharded_path(file_path)
+
+        if self._resolve(file_path).exists():
+            await self.discard(temp_path)
+            return
 
-        full_path.parent.mkdir(parents=True, exist_ok=True)
+        await self._publish(temp_path, full_path)
 
-        async with aiofiles.open(str(full_path), "wb") as f:
-            await f.write(data)
+    @override
+    async def discard(self, temp_path: str) -> None:
+        try:
+            await aiofiles.os.remove(self.base_path / temp_path)
+        except FileNotFoundError:
+            pass
 
     @override
     async def download(self, file_path: str) -> bytes:
-        full_path = self.base_path / file_path
+        full_path = self._resolve(file_path)
         if not full_path.exists():
             raise FileNotFoundError(f"File {file_path} not found in storage.")
 
-        async with aiofiles.open(self.base_path / file_path, "rb") as f:
+        async with aiofiles.open(full_path, "rb") as f:
             return await f.read()
 
     @override
-    async def delete(self, file_path: str) -> None: ...
+    async def stream(
+        self, file_path: str, start: int = 0, end: int | None = None
+    ) -> AsyncIterator[bytes]:
+        full_path = self._resolve(file_path)
+        if not full_path.exists():
+            raise FileNotFoundError(f"File {file_path} not found in storage.")
+
+        remaining = None if end is None else end - start + 1
+        async with aiofiles.open(full_path, "rb") as f:
+            await f.seek(start)
+            while remaining is None or remaining > 0:
+                size = self.CHUNK_SIZE
+                if remaining is not None:
+                    size = min(size, remaining)
+                chunk = await f.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    @override
+    def local_path(self, file_path: str) -> Path | None:
+        return self._resolve(file_path)
+
+    @override
+    async def delete(self, file_path: str) -> None:
+        full_path = self._resolve(file_path)
+        try:
+            await aiofiles.os.remove(full_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File {file_path} not found in storage.")
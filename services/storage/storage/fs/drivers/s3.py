@@ -1,12 +1,52 @@
+import asyncio
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from contextlib import AsyncExitStack
+from typing import TYPE_CHECKING, override
+from uuid import uuid4
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError
 from loguru import logger
 
+from storage.config import Config
+
 from .base import BaseFileStorageDriver
 
 
+if TYPE_CHECKING:
+    from types_aiobotocore_s3 import S3Client
+
+
 logger.debug("Loading S3 storage driver module")
 
+# S3 clients own a connection pool, so they are shared by all driver instances
+# of the process and closed once on shutdown with `close_clients`.
+_clients: dict[tuple[str, str, str], 'S3Client'] = {}
+_clients_stack = AsyncExitStack()
+_clients_lock = asyncio.Lock()
+
+MAX_COPY_SIZE = 5 * 1024**3  # CopyObject and UploadPartCopy limit
+MAX_PARTS = 10_000
+MAX_DELETE_BATCH = 1000  # DeleteObjects limit
+
+
+async def close_clients() -> None:
+    """
+    Close all pooled S3 clients of the process.
+    """
+    await _clients_stack.aclose()
+    _clients.clear()
+
+
+def _is_not_found(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey")
+
 
 class S3StorageDriver(BaseFileStorageDriver):
+    TEMP_PREFIX = ".tmp"
+    CHUNK_SIZE = 64 * 1024
+
     def __init__(
         self,
         endpoint_url: str,
@@ -14,6 +54,10 @@ class S3StorageDriver(BaseFileStorageDriver):
         secret_key: str,
         bucket_name: str,
         region: str,
+        multipart_threshold: int = Config.S3.MULTIPART_THRESHOLD,
+        multipart_part_size: int = Config.S3.MULTIPART_PART_SIZE,
+        multipart_concurrency: int = Config.S3.MULTIPART_CONCURRENCY,
+        max_pool_connections: int = Config.S3.MAX_POOL_CONNECTIONS,
     ) -> None:
         """
         Initialize the S3 storage driver.
@@ -23,15 +67,271 @@ class S3StorageDriver(BaseFileStorageDriver):
         :param secret_key: The secret key for S3.
         :param bucket_name: The name of the S3 bucket.
         :param region: The AWS region where the bucket is located.
+        :param multipart_threshold: The size from which uploads are multipart.
+        :param multipart_part_size: The size of each part of a multipart upload.
+        :param multipart_concurrency: The number of parts uploaded concurrently.
+        :param max_pool_connections: The size of the shared connection pool.
         """
         self.endpoint_url = endpoint_url
         self.access_key = access_key
         self.secret_key = secret_key
         self.bucket_name = bucket_name
         self.region = region
+        self.multipart_threshold = multipart_threshold
+        self.multipart_part_size = multipart_part_size
+        self.multipart_concurrency = multipart_concurrency
+        self.max_pool_connections = max_pool_connections
+
+    async def _client(self) -> 'S3Client':
+        key = (self.endpoint_url, self.access_key, self.region)
+        if (client := _clients.get(key)) is not None:
+            return client
+
+        async with _clients_lock:
+            if (client := _clients.get(key)) is None:
+                logger.info(f"Creating S3 client for {self.endpoint_url}")
+                client = await _clients_stack.enter_async_context(
+                    get_session().create_client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        region_name=self.region,
+                        aws_access_key_id=self.access_key,
+                        aws_secret_access_key=self.secret_key,
+                        config=AioConfig(
+                            max_pool_connections=self.max_pool_connections
+                        ),
+                    )
+                )
+                _clients[key] = client
+        return client
+
+    async def _exists(self, file_path: str) -> bool:
+        client = await self._client()
+        try:
+            await client.head_object(Bucket=self.bucket_name, Key=file_path)
+        except ClientError as e:
+            if _is_not_found(e):
+                return False
+            raise
+        return True
+
+    async def _split_parts(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        part = bytearray()
+        async for chunk in chunks:
+            part += chunk
+            while len(part) >= self.multipart_part_size:
+                yield bytes(part[: self.multipart_part_size])
+                del part[: self.multipart_part_size]
+        if part:
+            yield bytes(part)
+
+    async def _multipart_upload(
+        self, file_path: str, parts: AsyncIterable[bytes]
+    ) -> None:
+        """
+        Upload parts concurrently as a single multipart object.
+
+        The next part is only read once one of the `multipart_concurrency`
+        upload slots is free, so memory use is bounded by the part size times
+        the concurrency rather than by the object size.
+        """
+        client = await self._client()
+        upload = await client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=file_path
+        )
+        upload_id = upload["UploadId"]
+        semaphore = asyncio.Semaphore(self.multipart_concurrency)
+        tasks: list[asyncio.Task] = []
+
+        async def upload_part(number: int, body: bytes) -> dict:
+            try:
+                response = await client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=file_path,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )
+                return {"ETag": response["ETag"], "PartNumber": number}
+            finally:
+                semaphore.release()
+
+        try:
+            parts = aiter(parts)
+            while True:
+                await semaphore.acquire()
+                if (part := await anext(parts, None)) is None:
+                    semaphore.release()
+                    break
+                tasks.append(asyncio.create_task(upload_part(len(tasks) + 1, part)))
+            completed = await asyncio.gather(*tasks)
+            await client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=file_path,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": completed},
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=file_path, UploadId=upload_id
+            )
+            raise
+
+    async def _copy(self, source_path: str, file_path: str) -> None:
+        client = await self._client()
+        source = {"Bucket": self.bucket_name, "Key": source_path}
+        head = await client.head_object(Bucket=self.bucket_name, Key=source_path)
+        size = head["ContentLength"]
+
+        if size <= MAX_COPY_SIZE:
+            await client.copy_object(
+                Bucket=self.bucket_name, Key=file_path, CopySource=source
+            )
+            return
+
+        part_size = min(
+            max(self.multipart_part_size, -(-size // MAX_PARTS)), MAX_COPY_SIZE
+        )
+        upload = await client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=file_path
+        )
+        upload_id = upload["UploadId"]
+        semaphore = asyncio.Semaphore(self.multipart_concurrency)
+
+        async def copy_part(number: int, start: int) -> dict:
+            end = min(start + part_size, size) - 1
+            async with semaphore:
+                response = await client.upload_part_copy(
+                    Bucket=self.bucket_name,
+                    Key=file_path,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    CopySource=source,
+                    CopySourceRange=f"bytes={start}-{end}",
+                )
+            return {"ETag": response["CopyPartResult"]["ETag"], "PartNumber": number}
+
+        try:
+            completed = await asyncio.gather(
+                *(
+                    copy_part(number, start)
+                    for number, start in enumerate(range(0, size, part_size), 1)
+                )
+            )
+            await client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=file_path,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": completed},
+            )
+        except BaseException:
+            await client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=file_path, UploadId=upload_id
+            )
+            raise
+
+    @override
+    async def upload(self, file_path: str, data: bytes) -> None:
+        if len(data) < self.multipart_threshold:
+            client = await self._client()
+            await client.put_object(Bucket=self.bucket_name, Key=file_path, Body=data)
+            return
+
+        async def parts() -> AsyncIterator[bytes]:
+            for start in range(0, len(data), self.multipart_part_size):
+                yield data[start : start + self.multipart_part_size]
+
+        await self._multipart_upload(file_path, parts())
+
+    @override
+    async def upload_stream(self, chunks: AsyncIterable[bytes]) -> str:
+        temp_path = f"{self.TEMP_PREFIX}/{uuid4().hex}"
+        parts = aiter(self._split_parts(chunks))
+        first = await anext(parts, b"")
+
+        if len(first) < self.multipart_part_size:
+            # The whole stream fits in a single part
+            client = await self._client()
+            await client.put_object(Bucket=self.bucket_name, Key=temp_path, Body=first)
+            return temp_path
+
+        async def all_parts() -> AsyncIterator[bytes]:
+            yield first
+            async for part in parts:
+                yield part
+
+        await self._multipart_upload(temp_path, all_parts())
+        return temp_path
+
+    @override
+    async def commit(self, temp_path: str, file_path: str) -> None:
+        if not await self._exists(file_path):
+            await self._copy(temp_path, file_path)
+        await self.discard(temp_path)
+
+    @override
+    async def discard(self, temp_path: str) -> None:
+        await self.delete(temp_path)
+
+    @override
+    async def download(self, file_path: str) -> bytes:
+        client = await self._client()
+        try:
+            response = await client.get_object(Bucket=self.bucket_name, Key=file_path)
+        except ClientError as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(f"File {file_path} not found in storage.")
+            raise
+
+        async with response["Body"] as body:
+            return await body.read()
+
+    @override
+    async def stream(
+        self, file_path: str, start: int = 0, end: int | None = None
+    ) -> AsyncIterator[bytes]:
+        client = await self._client()
+        kwargs = {}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+
+        try:
+            response = await client.get_object(
+                Bucket=self.bucket_name, Key=file_path, **kwargs
+            )
+        except ClientError as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(f"File {file_path} not found in storage.")
+            raise
+
+        async with response["Body"] as body:
+            async for chunk in body.iter_chunks(self.CHUNK_SIZE):
+                yield chunk
+
+    @override
+    async def delete(self, file_path: str) -> None:
+        client = await self._client()
+        await client.delete_object(Bucket=self.bucket_name, Key=file_path)
 
-    async def upload(self, file_path: str, data: bytes) -> None: ...
+    @override
+    async def delete_many(self, file_paths: Iterable[str]) -> None:
+        client = await self._client()
+        keys = list(file_paths)
 
-    async def download(self, file_path: str) -> bytes: ...
+        async def delete_batch(batch: list[str]) -> None:
+            response = await client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+            if errors := response.get("Errors"):
+                raise RuntimeError(f"Failed to delete {len(errors)} files: {errors}")
 
-    async def delete(self, file_path: str) -> None: ...
+        await asyncio.gather(
+            *(
+                delete_batch(keys[i : i + MAX_DELETE_BATCH])
+                for i in range(0, len(keys), MAX_DELETE_BATCH)
+            )
+        )
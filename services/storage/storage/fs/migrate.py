@@ -0,0 +1,77 @@
+"""
+Move files from the flat ``files/<hash>`` layout to the sharded one.
+
+The migration is safe to run while the storage service is serving requests:
+each file is hard-linked to its sharded path before the flat one is removed,
+and FilesystemStorageDriver looks files up in both layouts.
+
+Usage::
+
+    python -m storage.fs.migrate [--base-dir DIR] [--files-dir DIR] [--dry-run]
+"""
+
+import argparse
+import os
+
+from loguru import logger
+
+from storage.config import Config
+from storage.fs.drivers.filesystem import FilesystemStorageDriver
+
+
+def migrate(
+    driver: FilesystemStorageDriver, files_dir: str, dry_run: bool = False
+) -> int:
+    """
+    Move every flat file of a directory to its sharded path.
+
+    :param driver: The driver whose layout the files are moved to.
+    :param files_dir: The directory holding the flat files, relative to the
+        driver base path.
+    :param dry_run: Only count the files that would be moved.
+    :return: The number of migrated files.
+    """
+    flat_dir = driver.base_path / files_dir
+    if not flat_dir.is_dir():
+        logger.info(f"Nothing to migrate in {flat_dir}")
+        return 0
+
+    migrated = 0
+    with os.scandir(flat_dir) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+
+            sharded_path = driver.sharded_path(f"{files_dir}/{entry.name}")
+            if sharded_path == driver.base_path / files_dir / entry.name:
+                continue
+
+            if not dry_run:
+                sharded_path.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(entry.path, sharded_path)
+                except FileExistsError:
+                    pass  # content-addressed, so the sharded copy is identical
+                os.unlink(entry.path)
+
+            migrated += 1
+            if migrated % 10_000 == 0:
+                logger.info(f"Migrated {migrated} files")
+
+    logger.info(f"Migrated {migrated} files from {flat_dir}")
+    return migrated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--base-dir", default=Config.Local.BASE_DIR)
+    parser.add_argument("--files-dir", default=Config.FilesStorage.FILES_DIR)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    driver = FilesystemStorageDriver(base_path=args.base_dir)
+    migrate(driver, args.files_dir, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from pathlib import Path
+
+from storage.metrics import observe_driver, observe_stream
+from storage.tracing import trace_driver, trace_stream
+
+from .codecs import Codec, IdentityCodec, get_codec
 from .drivers.base import BaseFileStorageDriver
 
 
 class FilesStorage:
-    def __init__(self, driver: BaseFileStorageDriver) -> None:
+    def __init__(
+        self, driver: BaseFileStorageDriver, codec: Codec | None = None
+    ) -> None:
         """
         Initialize the FilesStorage with a specific driver.
 
         :param driver: The storage driver to be used.
+        :param codec: The codec new files are compressed with, none by default.
         """
         self.driver = driver
+        self.codec = IdentityCodec() if codec is None else codec
 
     async def upload(self, file_path: str, data: bytes) -> None:
         """
@@ -17,7 +28,49 @@ class FilesStorage:
         :param file_path: The path where the file will be stored.
         :param data: The data to be stored in the file.
         """
-        await self.driver.upload(file_path, data)
+        with (
+            observe_driver(self.driver, "upload") as call,
+            trace_driver(self.driver, "upload"),
+        ):
+            call.size = len(data)
+            await self.driver.upload(file_path, data)
+
+    async def upload_stream(self, chunks: AsyncIterable[bytes]) -> str:
+        """
+        Write a stream of chunks to a temporary object in the storage.
+
+        :param chunks: The data chunks to be written, in order.
+        :return: The path of the temporary object.
+        """
+        return await self.driver.upload_stream(
+            observe_stream(
+                self.driver,
+                "upload_stream",
+                trace_stream(self.driver, "upload_stream", chunks),
+            )
+        )
+
+    async def commit(self, temp_path: str, file_path: str) -> None:
+        """
+        Move a temporary object to its final path.
+
+        :param temp_path: The path of the temporary object.
+        :param file_path: The path where the file will be stored.
+        """
+        with observe_driver(self.driver, "commit"), trace_driver(self.driver, "commit"):
+            await self.driver.commit(temp_path, file_path)
+
+    async def discard(self, temp_path: str) -> None:
+        """
+        Remove a temporary object that will not be committed.
+
+        :param temp_path: The path of the temporary object.
+        """
+        with (
+            observe_driver(self.driver, "discard"),
+            trace_driver(self.driver, "discard"),
+        ):
+            await self.driver.discard(temp_path)
 
     async def download(self, file_path: str) -> bytes:
         """
@@ -26,4 +79,77 @@ class FilesStorage:
         :param file_path: The path of the file to be downloaded.
         :return: The data of the downloaded file.
         """
-        return await self.driver.download(file_path)
+        with (
+            observe_driver(self.driver, "download") as call,
+            trace_driver(self.driver, "download"),
+        ):
+            data = await self.driver.download(file_path)
+            call.size = len(data)
+        return data
+
+    def stream(
+        self, file_path: str, start: int = 0, end: int | None = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream a file from the storage in chunks.
+
+        :param file_path: The path of the file to be streamed.
+        :param start: The offset of the first byte to be read.
+        :param end: The offset of the last byte to be read (inclusive).
+        :return: An async iterator over the data chunks.
+        """
+        return observe_stream(
+            self.driver,
+            "stream",
+            trace_stream(
+                self.driver, "stream", self.driver.stream(file_path, start, end)
+            ),
+        )
+
+    def stream_decoded(
+        self, file_path: str, codec: str, start: int = 0, end: int | None = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream the decompressed content of a file from the storage in chunks.
+
+        :param file_path: The path of the file to be streamed.
+        :param codec: The name of the codec the file was stored with.
+        :param start: The offset of the first decompressed byte to be read.
+        :param end: The offset of the last decompressed byte to be read
+            (inclusive).
+        :return: An async iterator over the decompressed data chunks.
+        """
+        file_codec = get_codec(codec)
+        if isinstance(file_codec, IdentityCodec):
+            return self.stream(file_path, start, end)
+        return file_codec.decode(self.stream(file_path), start, end)
+
+    def local_path(self, file_path: str) -> Path | None:
+        """
+        Get the path of a file on the local filesystem, if the driver has one.
+
+        :param file_path: The path of the file in the storage.
+        :return: The local path of the file, or None if it is not stored locally.
+        """
+        return self.driver.local_path(file_path)
+
+    async def delete(self, file_path: str) -> None:
+        """
+        Delete a file from the storage.
+
+        :param file_path: The path of the file to be deleted.
+        """
+        with observe_driver(self.driver, "delete"), trace_driver(self.driver, "delete"):
+            await self.driver.delete(file_path)
+
+    async def delete_many(self, file_paths: Iterable[str]) -> None:
+        """
+        Delete several files from the storage.
+
+        :param file_paths: The paths of the files to be deleted.
+        """
+        with (
+            observe_driver(self.driver, "delete_many"),
+            trace_driver(self.driver, "delete_many"),
+        ):
+            await self.driver.delete_many(file_paths)
@@ -4,8 +4,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 
+from storage.config import Config
 from storage.databases.base import create_tables
+from storage.metrics import MetricsMiddleware
+from storage.metrics import router as metrics_router
 from storage.routers.files import router as files_router
+from storage.routers.stats import router as stats_router
+from storage.tracing import TracingMiddleware, setup_tracing
 
 
 @asynccontextmanager
@@ -16,10 +21,18 @@ async def lifespan(app: FastAPI):
     """
 
     logger.info("Starting application lifespan setup.")
+    tracer_provider = setup_tracing()
     await create_tables()
     logger.info("Database tables created successfully.")
     yield
 
+    if Config.FilesStorage.BACKEND.lower() == 's3':
+        from storage.fs.drivers.s3 import close_clients  # lazy import
+
+        await close_clients()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()
+
 
 app = FastAPI(
     title="Storage Service",
@@ -35,8 +48,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(files_router)
+app.include_router(stats_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
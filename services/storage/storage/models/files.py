@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+
+class UploadedFile(BaseModel):
+    name: str | None = Field(..., description="Name of the uploaded file")
+    id: int = Field(..., description="ID of the stored file")
+    status: Literal["created", "existing"] = Field(
+        ..., description="Whether the file was stored or already existed"
+    )
+
+
+class FileInfo(BaseModel):
+    id: int = Field(..., description="ID of the stored file")
+    name: str | None = Field(..., description="Name of the file")
+    size: int = Field(..., description="Size of the file in bytes")
+    mime_type: str | None = Field(..., description="MIME type of the file")
+    created_at: datetime = Field(..., description="Time the file was stored")
+
+
+class FilesPage(BaseModel):
+    items: list[FileInfo] = Field(..., description="Files of the page")
+    next_cursor: str | None = Field(
+        None, description="Cursor of the next page, or null on the last page"
+    )
+
+
+class ArchiveRequest(BaseModel):
+    ids: list[int] = Field(
+        ..., min_length=1, max_length=1000, description="IDs of the files to archive"
+    )
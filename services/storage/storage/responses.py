@@ -0,0 +1,269 @@
+from collections.abc import Iterable
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import quote
+
+from fastapi import HTTPException, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from storage.cache import FileMetadata
+from storage.fs.codecs import get_codec
+
+
+if TYPE_CHECKING:
+    from storage.fs.storage import FilesStorage
+
+
+# File content never changes once stored, so caches may keep it indefinitely
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class RangeNotSatisfiable(Exception):
+    """
+    Raised when a requested byte range lies outside of the file.
+    """
+
+
+class SendfileResponse(FileResponse):
+    """
+    FileResponse that hands whole-file bodies over to the server.
+
+    When the ASGI server supports the ``http.response.pathsend`` extension the
+    file contents are sent by the server itself (e.g. with sendfile), without
+    being read into Python. Otherwise it behaves exactly like FileResponse,
+    including Range and If-Range handling.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if not self.pathsend or send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        await send(
+            {"type": "http.response.pathsend", "path": str(Path(self.path).resolve())}
+        )
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single-range ``Range`` header.
+
+    Malformed and multi-range headers are ignored, as allowed by RFC 9110, so
+    the caller falls back to sending the whole file.
+
+    :param range_header: The value of the Range header.
+    :param size: The size of the file.
+    :return: The first and the last byte offsets (inclusive), or None.
+    :raises RangeNotSatisfiable: If the range lies outside of the file.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    first, sep, last = ranges.strip().partition("-")
+    if not sep:
+        return None
+
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix, 0), size - 1
+
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if end < start:
+        return None
+
+    return start, min(end, size - 1)
+
+
+def accepts_encoding(accept_encoding: str | None, content_encoding: str) -> bool:
+    """
+    Check whether an ``Accept-Encoding`` header allows a content coding.
+
+    :param accept_encoding: The value of the Accept-Encoding header, if any.
+    :param content_encoding: The content coding, e.g. "gzip".
+    :return: True if the coding is accepted with a non-zero quality.
+    """
+    if not accept_encoding:
+        return False
+
+    accepted = False
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        coding = coding.strip().lower()
+        if coding == content_encoding:
+            return quality > 0
+        if coding == "*":
+            accepted = quality > 0
+    return accepted
+
+
+def etag_matches(if_none_match: str, etags: Iterable[str]) -> bool:
+    """
+    Check an ``If-None-Match`` header against the ETags of a resource.
+
+    Uses the weak comparison required by RFC 9110 for If-None-Match.
+
+    :param if_none_match: The value of the If-None-Match header.
+    :param etags: The strong ETags of the resource.
+    :return: True if the client already has the resource.
+    """
+    if if_none_match.strip() == "*":
+        return True
+
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return not candidates.isdisjoint(etags)
+
+
+def local_file(file_storage: 'FilesStorage', file_path: str) -> Path | None:
+    """
+    Get the local path of a stored file, checking that the file exists.
+
+    The response would otherwise only fail once sent, after its headers.
+
+    :param file_storage: The storage holding the file content.
+    :param file_path: The path of the file in the storage.
+    :return: The local path of the file, or None if it is not stored locally.
+    :raises HTTPException: 404 if the file is missing from the storage.
+    """
+    local_path = file_storage.local_path(file_path)
+    if local_path is not None and not local_path.is_file():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"File {file_path} not found in storage.",
+        )
+    return local_path
+
+
+def file_response(
+    file_storage: 'FilesStorage',
+    file: FileMetadata,
+    range_header: str | None = None,
+    if_range: str | None = None,
+    accept_encoding: str | None = None,
+    if_none_match: str | None = None,
+) -> Response:
+    """
+    Build a response serving the content of a stored file.
+
+    Uncompressed local files are served with a SendfileResponse, everything
+    else is streamed from the driver in chunks. Both honor Range and If-Range.
+
+    Compressed files are sent as stored, with a Content-Encoding header, to
+    clients accepting their codec. Other clients and range requests get the
+    decompressed content.
+
+    A request whose If-None-Match matches any ETag of the file, whichever
+    codec it was sent with, is answered with a 304 without reading the file.
+
+    :param file_storage: The storage holding the file content.
+    :param file: The file metadata.
+    :param range_header: The value of the Range request header, if any.
+    :param if_range: The value of the If-Range request header, if any.
+    :param accept_encoding: The value of the Accept-Encoding request header, if
+        any.
+    :param if_none_match: The value of the If-None-Match request header, if any.
+    :return: A 200, 206, 304 or 416 response.
+    :raises HTTPException: 404 if the file is missing from the local storage.
+    """
+    etag = f'"{file.hash}"'
+    headers = {
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(file.name)}",
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+    }
+
+    codec = get_codec(file.codec)
+    # The encoded bytes differ from the identity ones, hence a distinct ETag
+    encoded_etag = f'"{file.hash}-{codec.name}"'
+    send_encoded = False
+    if codec.content_encoding is not None:
+        headers["Vary"] = "Accept-Encoding"
+        send_encoded = range_header is None and accepts_encoding(
+            accept_encoding, codec.content_encoding
+        )
+        if send_encoded:
+            headers["ETag"] = encoded_etag
+
+    if if_none_match is not None and etag_matches(if_none_match, (etag, encoded_etag)):
+        del headers["Content-Disposition"], headers["Accept-Ranges"]
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if send_encoded:
+        headers["Content-Encoding"] = codec.content_encoding
+        local_path = local_file(file_storage, file.content_path)
+        if local_path is not None:
+            return SendfileResponse(
+                local_path, media_type=file.mime_type, headers=headers
+            )
+
+        headers["Content-Length"] = str(file.stored_size)
+        return StreamingResponse(
+            file_storage.stream(file.content_path),
+            media_type=file.mime_type,
+            headers=headers,
+        )
+
+    if codec.content_encoding is None:
+        local_path = local_file(file_storage, file.content_path)
+        if local_path is not None:
+            return SendfileResponse(
+                local_path, media_type=file.mime_type, headers=headers
+            )
+
+    byte_range = None
+    if range_header is not None and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, file.size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={"Content-Range": f"bytes */{file.size}"},
+            )
+
+    if byte_range is None:
+        headers["Content-Length"] = str(file.size)
+        return StreamingResponse(
+            file_storage.stream_decoded(file.content_path, file.codec),
+            media_type=file.mime_type,
+            headers=headers,
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{file.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        file_storage.stream_decoded(file.content_path, file.codec, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=file.mime_type,
+        headers=headers,
+    )
@@ -1,31 +1,160 @@
-from fastapi import APIRouter, Response, UploadFile
+from typing import Annotated
+
+from fastapi import (
+    APIRouter,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from fastapi.responses import FileResponse
+from starlette.datastructures import UploadFile as FormFile
 
 from storage.dependencies import StorageServiceDep
+from storage.models.files import ArchiveRequest, FilesPage, UploadedFile
 
 
 router = APIRouter(prefix="/files", tags=["files"])
 
+SHA256_PATTERN = "^[0-9a-f]{64}$"
 
-# @router.get("/")
-async def list_files(storage_service: StorageServiceDep): ...
+# The upload form is parsed by hand so a conditional upload can be answered
+# before its body is read, hence the explicit schema
+UPLOAD_FILE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+@router.get(
+    "",
+    responses={
+        200: {"description": "Files listed successfully"},
+        400: {"description": "Invalid cursor"},
+    },
+)
+async def list_files(
+    storage_service: StorageServiceDep,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+    mime_type: str | None = None,
+    min_size: Annotated[int | None, Query(ge=0)] = None,
+    max_size: Annotated[int | None, Query(ge=0)] = None,
+) -> FilesPage:
+    """
+    List stored files from the newest to the oldest.
+
+    :param limit: The maximum number of files in the page.
+    :param cursor: The `next_cursor` of the previous page, if any.
+    :param mime_type: Only list files of this MIME type.
+    :param min_size: Only list files of at least this size, in bytes.
+    :param max_size: Only list files of at most this size, in bytes.
+    """
+    return await storage_service.list_files(
+        limit, cursor, mime_type=mime_type, min_size=min_size, max_size=max_size
+    )
+
+
+ARCHIVE_RESPONSES = {
+    200: {
+        "description": "Tar archive of the files, missing IDs are listed in the "
+        "X-Missing-File-Ids header",
+        "content": {"application/x-tar": {}},
+    },
+    404: {"description": "None of the files exists"},
+}
+
+
+@router.get("/archive", responses=ARCHIVE_RESPONSES)
+async def get_archive(
+    storage_service: StorageServiceDep,
+    ids: Annotated[list[int], Query(min_length=1, max_length=1000)],
+) -> Response:
+    """
+    Download many files as one tar archive, streamed as it is read.
+
+    :param ids: The IDs of the files, repeated, e.g. `?ids=1&ids=2`. At most
+        1000 per request.
+    """
+    return await storage_service.archive_files(ids)
+
+
+@router.post("/archive", responses=ARCHIVE_RESPONSES)
+async def post_archive(
+    archive: ArchiveRequest, storage_service: StorageServiceDep
+) -> Response:
+    """
+    Download many files as one tar archive, for lists of IDs too long for a URL.
+
+    :param archive: The IDs of the files, at most 1000 per request.
+    """
+    return await storage_service.archive_files(archive.ids)
 
 
 @router.get(
     "/{file_id}",
     responses={
         200: {"description": "File retrieved successfully"},
+        206: {"description": "Part of the file retrieved successfully"},
+        304: {"description": "File not modified"},
         404: {"description": "File not found"},
+        416: {"description": "Requested range not satisfiable"},
     },
     response_class=FileResponse,
 )
-async def get_file(file_id: int, storage_service: StorageServiceDep) -> Response:
+async def get_file(
+    file_id: int,
+    storage_service: StorageServiceDep,
+    range_header: Annotated[str | None, Header(alias="Range")] = None,
+    if_range: Annotated[str | None, Header()] = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
     """
     Retrieve a file by its ID.
 
     :param file_id: The ID of the file to retrieve.
+    :param range_header: The byte range to retrieve, if any.
+    :param if_range: The ETag the range is conditional on, if any.
+    :param accept_encoding: The content codings the client accepts, if any.
+    :param if_none_match: The ETags the client already has, if any.
+    """
+    return await storage_service.download_file_by_file_id(
+        file_id, range_header, if_range, accept_encoding, if_none_match
+    )
+
+
+@router.head(
+    "/by-hash/{file_hash}",
+    responses={
+        200: {"description": "File exists, its ID is in the X-File-Id header"},
+        404: {"description": "File not found"},
+    },
+)
+async def head_file_by_hash(
+    file_hash: Annotated[str, Path(pattern=SHA256_PATTERN)],
+    storage_service: StorageServiceDep,
+) -> Response:
+    """
+    Check whether a file with the given content is already stored.
+
+    :param file_hash: The hexadecimal SHA-256 hash of the file content.
     """
-    return await storage_service.download_file_by_file_id(file_id)
+    return await storage_service.head_file_by_hash(file_hash)
 
 
 @router.post(
@@ -36,12 +165,58 @@ async def get_file(file_id: int, storage_service: StorageServiceDep) -> Response
         400: {"description": "Invalid file format or size"},
     },
     response_model=int,
+    openapi_extra=UPLOAD_FILE_REQUEST_BODY,
 )
-async def upload_file(file: UploadFile, storage_service: StorageServiceDep) -> Response:
+async def upload_file(
+    request: Request,
+    storage_service: StorageServiceDep,
+    content_sha256: Annotated[
+        str | None, Header(alias="X-Content-SHA256", pattern=SHA256_PATTERN)
+    ] = None,
+) -> Response:
     """
     Upload a file to the storage service.
 
-    :param file: The file to be uploaded.
+    With an X-Content-SHA256 header the upload is conditional: if a file with
+    this content already exists its ID is returned before the body is read, so
+    clients sending `Expect: 100-continue` never transfer the content.
+
+    :param request: The request carrying the file in the "file" form field.
+    :param storage_service: The storage service dependency.
+    :param content_sha256: The SHA-256 hash of the file content, if known.
+    """
+    if content_sha256 is not None:
+        response = await storage_service.upload_existing_file(content_sha256)
+        if response is not None:
+            return response
+
+    async with request.form() as form:
+        file = form.get("file")
+        if not isinstance(file, FormFile):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Field 'file' is required.",
+            )
+        return await storage_service.upload_file(file, content_sha256)
+
+
+@router.post(
+    "/batch",
+    responses={
+        200: {"description": "Files uploaded successfully"},
+        400: {"description": "Invalid files or too many files in one request"},
+    },
+)
+async def upload_files(
+    files: list[UploadFile], storage_service: StorageServiceDep
+) -> list[UploadedFile]:
+    """
+    Upload many files to the storage service in one request.
+
+    At most 1000 files can be sent per request.
+
+    :param files: The files to be uploaded.
     :param storage_service: The storage service dependency.
+    :return: The ID of each file and whether it was created or already existed.
     """
-    return await storage_service.upload_file(file)
+    return await storage_service.upload_files(files)
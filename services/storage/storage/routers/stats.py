@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+
+from storage.dependencies import MetadataCacheDep
+
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+
+@router.get("/cache")
+async def get_cache_stats(metadata_cache: MetadataCacheDep) -> dict[str, int | float]:
+    """
+    Retrieve the usage counters of the file metadata cache.
+
+    :param metadata_cache: The metadata cache dependency.
+    """
+    return metadata_cache.stats()
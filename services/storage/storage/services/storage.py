@@ -1,13 +1,22 @@
+import asyncio
+import base64
 import hashlib
-from typing import TYPE_CHECKING
-from urllib.parse import quote
+import json
+from collections.abc import AsyncIterator, Awaitable
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
 
-from fastapi import Response, UploadFile, status
-from fastapi.responses import Response
-from sqlalchemy import select
+from fastapi import HTTPException, Response, UploadFile, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import ColumnElement, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from storage.archive import stream_tar, tar_size
+from storage.cache import FileMetadata, MetadataCache
 from storage.databases.base import Session
 from storage.databases.files import File as DBFile
+from storage.models.files import FileInfo, FilesPage, UploadedFile
+from storage.responses import file_response
 
 
 if TYPE_CHECKING:
@@ -23,6 +32,31 @@ def sha256(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
 
+def encode_cursor(created_at: datetime, file_id: int) -> str:
+    """
+    Encode the position of a file in the listing as an opaque cursor.
+    :param created_at: The creation time of the file.
+    :param file_id: The ID of the file.
+    :return: The cursor string.
+    """
+    payload = json.dumps([created_at.isoformat(), file_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decode a cursor produced by `encode_cursor`.
+    :param cursor: The cursor string.
+    :return: The creation time and the ID of the file.
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        created_at, file_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(created_at), int(file_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
 class StorageService:
     """
     A class to handle file storage operations.
@@ -31,77 +65,439 @@ class StorageService:
 
     file_storage: 'FilesStorage'
 
-    def __init__(self, file_storage: 'FilesStorage', files_dir: str) -> None:
+    def __init__(
+        self,
+        file_storage: 'FilesStorage',
+        metadata_cache: MetadataCache,
+        files_dir: str,
+        chunk_size: int,
+        batch_concurrency: int,
+    ) -> None:
         self.file_storage = file_storage
+        self.metadata_cache = metadata_cache
         self.files_dir = files_dir
+        self.chunk_size = chunk_size
+        self.batch_concurrency = batch_concurrency
+
+    def _content_path(self, file_hash: str) -> str:
+        return f"{self.files_dir}/{file_hash}{self.file_storage.codec.suffix}"
+
+    async def _stream_to_temp(self, file: UploadFile) -> tuple[str, str, int, int]:
+        """
+        Stream an uploaded file to a temporary object, hashing and compressing
+        it on the way.
+
+        :param file: The uploaded file.
+        :return: The temporary object path, the SHA-256 hash and the size of
+            the content, and the size of the stored object.
+        """
+        file_hash = hashlib.sha256()
+        size = 0
+        stored_size = 0
+
+        async def chunks() -> AsyncIterator[bytes]:
+            nonlocal size
+            while chunk := await file.read(self.chunk_size):
+                file_hash.update(chunk)
+                size += len(chunk)
+                yield chunk
+
+        async def stored_chunks() -> AsyncIterator[bytes]:
+            nonlocal stored_size
+            async for chunk in self.file_storage.codec.encode(chunks()):
+                stored_size += len(chunk)
+                yield chunk
+
+        temp_path = await self.file_storage.upload_stream(stored_chunks())
+        return temp_path, file_hash.hexdigest(), size, stored_size
+
+    async def _query_file(self, condition: ColumnElement[bool]) -> FileMetadata | None:
+        """
+        Look a file up in the database and add it to the metadata cache.
+
+        :param condition: The condition selecting the file.
+        :return: The file metadata, or None if the file does not exist.
+        """
+        async with Session() as session:
+            query = await session.execute(select(DBFile).where(condition))
+            db_file = query.scalars().first()
+            if db_file is None:
+                return None
+
+            metadata = FileMetadata.from_db(db_file)
+            self.metadata_cache.put(metadata)
+            return metadata
 
-    async def upload_file(self, file: UploadFile) -> Response:
-        data = await file.read()
-        file_hash = sha256(data)
-        content_path = f"{self.files_dir}/{file_hash}"
+    async def find_file_by_hash(self, file_hash: str) -> FileMetadata | None:
+        """
+        Look a file up by the SHA-256 hash of its content.
 
-        async with Session.begin() as session:
-            query = await session.execute(
-                select(DBFile).where(DBFile.hash == file_hash)
+        :param file_hash: The hexadecimal SHA-256 hash of the file content.
+        :return: The file metadata, or None if no file has this content.
+        """
+        file = self.metadata_cache.get_by_hash(file_hash)
+        if file is None:
+            file = await self._query_file(DBFile.hash == file_hash)
+        return file
+
+    async def head_file_by_hash(self, file_hash: str) -> Response:
+        """
+        Check whether a file with the given content hash is stored.
+
+        :param file_hash: The hexadecimal SHA-256 hash of the file content.
+        :return: An empty response with the file ID in X-File-Id, or a 404.
+        """
+        file = await self.find_file_by_hash(file_hash)
+        if file is None:
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        return Response(
+            status_code=status.HTTP_200_OK, headers={"X-File-Id": str(file.id)}
+        )
+
+    async def upload_existing_file(self, file_hash: str) -> Response | None:
+        """
+        Answer a hash-first upload without reading its content.
+
+        :param file_hash: The hash the client declared for the content.
+        :return: The ID of the existing file, or None if the content is needed.
+        """
+        file = await self.find_file_by_hash(file_hash)
+        if file is None:
+            return None
+        return Response(
+            content=str(file.id),
+            status_code=status.HTTP_200_OK,
+            media_type="text/plain",
+        )
+
+    async def upload_file(
+        self, file: UploadFile, expected_hash: str | None = None
+    ) -> Response:
+        temp_path, file_hash, size, stored_size = await self._stream_to_temp(file)
+        content_path = self._content_path(file_hash)
+
+        try:
+            if expected_hash is not None and expected_hash != file_hash:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="File content does not match X-Content-SHA256.",
+                )
+
+            existing_file = await self.find_file_by_hash(file_hash)
+            if existing_file is None:
+                await self.file_storage.commit(temp_path, content_path)
+
+                async with Session.begin() as session:
+                    db_file = await session.scalar(
+                        pg_insert(DBFile)
+                        .values(
+                            name=file.filename,
+                            hash=file_hash,
+                            size=size,
+                            mime_type=file.content_type,
+                            content_path=content_path,
+                            codec=self.file_storage.codec.name,
+                            stored_size=stored_size,
+                        )
+                        .on_conflict_do_nothing(index_elements=[DBFile.hash])
+                        .returning(DBFile)
+                    )
+
+                if db_file is not None:
+                    self.metadata_cache.put(FileMetadata.from_db(db_file))
+                    return Response(
+                        content=str(db_file.id),
+                        status_code=status.HTTP_201_CREATED,
+                        media_type="text/plain",
+                    )
+
+                # A concurrent upload of the same content inserted it first
+                existing_file = await self._query_file(DBFile.hash == file_hash)
+
+            await self.file_storage.discard(temp_path)
+            return Response(
+                content=str(existing_file.id),
+                status_code=status.HTTP_200_OK,
+                media_type="text/plain",
             )
-            existing_file = query.scalars().first()
-            if existing_file:
-                return Response(
-                    content=str(existing_file.id),
-                    status_code=status.HTTP_200_OK,
-                    media_type="text/plain",
+        except BaseException:
+            await self.file_storage.discard(temp_path)
+            raise
+
+    async def upload_files(self, files: list[UploadFile]) -> list[UploadedFile]:
+        """
+        Upload many files at once.
+
+        Files are hashed and written concurrently, existing hashes are looked
+        up with a single query and new rows are inserted in one transaction.
+
+        :param files: The files to be uploaded.
+        :return: The ID and status of each file, in the order of `files`.
+        """
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def limited(awaitable: Awaitable) -> Any:
+            async with semaphore:
+                return await awaitable
+
+        results = await asyncio.gather(
+            *(limited(self._stream_to_temp(file)) for file in files),
+            return_exceptions=True,
+        )
+        temps = [result for result in results if not isinstance(result, BaseException)]
+        temp_paths = {temp_path for temp_path, _, _, _ in temps}
+
+        try:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+            file_ids: dict[str, int] = {}
+            missing_hashes = set()
+            for _, file_hash, _, _ in temps:
+                if cached := self.metadata_cache.get_by_hash(file_hash):
+                    file_ids[file_hash] = cached.id
+                else:
+                    missing_hashes.add(file_hash)
+
+            if missing_hashes:
+                async with Session() as session:
+                    query = await session.execute(
+                        select(DBFile).where(DBFile.hash.in_(missing_hashes))
+                    )
+                    for db_file in query.scalars():
+                        self.metadata_cache.put(FileMetadata.from_db(db_file))
+                        file_ids[db_file.hash] = db_file.id
+
+            new_files: dict[str, tuple[UploadFile, str, int, int]] = {}
+            for file, (temp_path, file_hash, size, stored_size) in zip(files, temps):
+                if file_hash not in file_ids and file_hash not in new_files:
+                    new_files[file_hash] = (file, temp_path, size, stored_size)
+
+            await asyncio.gather(
+                *(
+                    limited(
+                        self.file_storage.commit(
+                            temp_path, self._content_path(file_hash)
+                        )
+                    )
+                    for file_hash, (_, temp_path, _, _) in new_files.items()
                 )
-            else:
-                await self.file_storage.upload(content_path, data)
+            )
+            temp_paths -= {temp_path for _, temp_path, _, _ in new_files.values()}
+
+            if new_files:
+                rows = [
+                    {
+                        "name": file.filename,
+                        "hash": file_hash,
+                        "size": size,
+                        "mime_type": file.content_type,
+                        "content_path": self._content_path(file_hash),
+                        "codec": self.file_storage.codec.name,
+                        "stored_size": stored_size,
+                    }
+                    for file_hash, (file, _, size, stored_size) in new_files.items()
+                ]
+                async with Session.begin() as session:
+                    db_files = await session.scalars(
+                        pg_insert(DBFile)
+                        .on_conflict_do_nothing(index_elements=[DBFile.hash])
+                        .returning(DBFile),
+                        rows,
+                    )
+                    for db_file in db_files:
+                        self.metadata_cache.put(FileMetadata.from_db(db_file))
+                        file_ids[db_file.hash] = db_file.id
+
+                # Concurrent uploads of the same content inserted these first
+                raced_hashes = new_files.keys() - file_ids.keys()
+                if raced_hashes:
+                    async with Session() as session:
+                        query = await session.execute(
+                            select(DBFile).where(DBFile.hash.in_(raced_hashes))
+                        )
+                        for db_file in query.scalars():
+                            self.metadata_cache.put(FileMetadata.from_db(db_file))
+                            file_ids[db_file.hash] = db_file.id
+                            del new_files[db_file.hash]
+        finally:
+            await asyncio.gather(
+                *(limited(self.file_storage.discard(path)) for path in temp_paths)
+            )
 
-                db_file = DBFile(
+        uploaded = []
+        for file, (_, file_hash, _, _) in zip(files, temps):
+            created = file_hash in new_files
+            uploaded.append(
+                UploadedFile(
                     name=file.filename,
-                    hash=file_hash,
-                    size=len(data),
-                    mime_type=file.content_type,
-                    content_path=content_path,
+                    id=file_ids[file_hash],
+                    status="created" if created else "existing",
                 )
-                session.add(db_file)
-                await session.commit()
+            )
+            new_files.pop(file_hash, None)  # later copies of the file exist
+        return uploaded
 
-                return Response(
-                    content=str(db_file.id),
-                    status_code=status.HTTP_201_CREATED,
-                    media_type="text/plain",
-                )
+    async def find_files(self, file_ids: list[int]) -> dict[int, FileMetadata]:
+        """
+        Look many files up by ID, with a single query for the uncached ones.
 
-    async def download_file_by_file_id(self, file_id: int) -> Response:
-        async with Session() as session:
-            query = await session.execute(select(DBFile).where(DBFile.id == file_id))
-            db_file = query.scalars().first()
-            if db_file:
-                content = await self.file_storage.download(db_file.content_path)
-                return Response(
-                    content=content,
-                    media_type=db_file.mime_type,
-                    headers={
-                        "Content-Disposition": f"attachment; filename*=utf-8''{quote(db_file.name)}"
-                    },
+        :param file_ids: The IDs of the files.
+        :return: The metadata of the existing files, by ID.
+        """
+        files = {}
+        missing_ids = set()
+        for file_id in file_ids:
+            if cached := self.metadata_cache.get_by_id(file_id):
+                files[file_id] = cached
+            else:
+                missing_ids.add(file_id)
+
+        if missing_ids:
+            async with Session() as session:
+                query = await session.execute(
+                    select(DBFile).where(DBFile.id.in_(missing_ids))
                 )
+                for db_file in query.scalars():
+                    metadata = FileMetadata.from_db(db_file)
+                    self.metadata_cache.put(metadata)
+                    files[metadata.id] = metadata
+        return files
+
+    async def archive_files(self, file_ids: list[int]) -> Response:
+        """
+        Stream many files as one tar archive.
+
+        The files are resolved before the response starts, then read with
+        bounded concurrency and streamed in the order of `file_ids` as their
+        content arrives. Unknown IDs are skipped and listed in the
+        X-Missing-File-Ids header.
+
+        :param file_ids: The IDs of the files, duplicates are archived once.
+        :return: A response streaming the archive, or a 404 if no file exists.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        found = await self.find_files(file_ids)
+        if not found:
             return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    async def download_file_by_path(self, file_path: str) -> Response:
+        files = [found[file_id] for file_id in file_ids if file_id in found]
+        headers = {
+            "Content-Length": str(tar_size(files)),
+            "Content-Disposition": 'attachment; filename="files.tar"',
+        }
+        missing_ids = [file_id for file_id in file_ids if file_id not in found]
+        if missing_ids:
+            headers["X-Missing-File-Ids"] = ",".join(map(str, missing_ids))
+
+        return StreamingResponse(
+            stream_tar(
+                files,
+                lambda file: self.file_storage.stream_decoded(
+                    file.content_path, file.codec
+                ),
+                self.batch_concurrency,
+            ),
+            media_type="application/x-tar",
+            headers=headers,
+        )
+
+    async def list_files(
+        self,
+        limit: int,
+        cursor: str | None = None,
+        mime_type: str | None = None,
+        min_size: int | None = None,
+        max_size: int | None = None,
+    ) -> FilesPage:
+        """
+        List files from the newest to the oldest, one page at a time.
+
+        Pages are selected by keyset on (created_at, id) instead of OFFSET, so
+        fetching a deep page costs the same as fetching the first one.
+
+        :param limit: The maximum number of files in the page.
+        :param cursor: The cursor returned with the previous page, if any.
+        :param mime_type: Only list files of this MIME type.
+        :param min_size: Only list files of at least this size.
+        :param max_size: Only list files of at most this size.
+        :return: The page of files and the cursor of the next page.
+        """
+        query = select(
+            DBFile.id, DBFile.name, DBFile.size, DBFile.mime_type, DBFile.created_at
+        )
+        if cursor is not None:
+            try:
+                position = decode_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+                )
+            query = query.where(tuple_(DBFile.created_at, DBFile.id) < position)
+        if mime_type is not None:
+            query = query.where(DBFile.mime_type == mime_type)
+        if min_size is not None:
+            query = query.where(DBFile.size >= min_size)
+        if max_size is not None:
+            query = query.where(DBFile.size <= max_size)
+        query = query.order_by(DBFile.created_at.desc(), DBFile.id.desc()).limit(limit)
+
+        async with Session() as session:
+            rows = (await session.execute(query)).all()
+
+        items = [FileInfo.model_validate(row, from_attributes=True) for row in rows]
+        next_cursor = None
+        if len(items) == limit:
+            next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+        return FilesPage(items=items, next_cursor=next_cursor)
+
+    async def download_file_by_file_id(
+        self,
+        file_id: int,
+        range_header: str | None = None,
+        if_range: str | None = None,
+        accept_encoding: str | None = None,
+        if_none_match: str | None = None,
+    ) -> Response:
+        file = self.metadata_cache.get_by_id(file_id)
+        if file is None:
+            file = await self._query_file(DBFile.id == file_id)
+
+        if file:
+            return file_response(
+                self.file_storage,
+                file,
+                range_header,
+                if_range,
+                accept_encoding,
+                if_none_match,
+            )
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+    async def download_file_by_path(
+        self,
+        file_path: str,
+        range_header: str | None = None,
+        if_range: str | None = None,
+        accept_encoding: str | None = None,
+        if_none_match: str | None = None,
+    ) -> Response:
         file_path = file_path.lstrip("/")
         if not file_path:
             return Response(status_code=status.HTTP_400_BAD_REQUEST)
 
-        async with Session() as session:
-            query = await session.execute(
-                select(DBFile).where(DBFile.content_path == file_path)
+        file = self.metadata_cache.get_by_path(file_path)
+        if file is None:
+            file = await self._query_file(DBFile.content_path == file_path)
+
+        if file:
+            return file_response(
+                self.file_storage,
+                file,
+                range_header,
+                if_range,
+                accept_encoding,
+                if_none_match,
             )
-            db_file = query.scalars().first()
-            if db_file:
-                content = await self.file_storage.download(db_file.content_path)
-                return Response(
-                    content=content,
-                    media_type=db_file.mime_type,
-                    headers={
-                        "Content-Disposition": f"attachment; filename*=utf-8''{quote(db_file.name)}"
-                    },
-                )
-            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
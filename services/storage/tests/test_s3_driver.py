@@ -0,0 +1,164 @@
+"""
+Tests of the S3 storage driver against a local moto server.
+"""
+
+import asyncio
+import os
+from collections.abc import AsyncIterator, Awaitable, Iterator
+from typing import TypeVar
+
+import botocore.session
+import pytest
+from moto.server import ThreadedMotoServer
+
+from storage.fs.drivers.s3 import S3StorageDriver, close_clients
+
+
+BUCKET = "storage-test"
+REGION = "us-east-1"
+# The smallest part size S3 accepts, but for the last part
+PART_SIZE = 5 * 1024 * 1024
+
+T = TypeVar("T")
+
+
+def run(awaitable: Awaitable[T]) -> T:
+    # Each test runs in its own event loop, which the pooled clients are bound to
+    async def main() -> T:
+        try:
+            return await awaitable
+        finally:
+            await close_clients()
+
+    return asyncio.run(main())
+
+
+async def chunked(data: bytes, size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+async def collect(chunks: AsyncIterator[bytes]) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+@pytest.fixture(scope="module")
+def endpoint_url() -> Iterator[str]:
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def s3(endpoint_url: str):
+    client = botocore.session.get_session().create_client(
+        "s3",
+        endpoint_url=endpoint_url,
+        region_name=REGION,
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+    )
+    client.create_bucket(Bucket=BUCKET)
+    yield client
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=BUCKET):
+        for item in page.get("Contents", []):
+            client.delete_object(Bucket=BUCKET, Key=item["Key"])
+    client.delete_bucket(Bucket=BUCKET)
+
+
+@pytest.fixture
+def driver(endpoint_url: str, s3) -> S3StorageDriver:
+    return S3StorageDriver(
+        endpoint_url=endpoint_url,
+        access_key="test",
+        secret_key="test",
+        bucket_name=BUCKET,
+        region=REGION,
+        multipart_threshold=PART_SIZE,
+        multipart_part_size=PART_SIZE,
+        multipart_concurrency=2,
+    )
+
+
+def keys(s3, prefix: str = "") -> list[str]:
+    response = s3.list_objects_v2(Bucket=BUCKET, Prefix=prefix)
+    return [item["Key"] for item in response.get("Contents", [])]
+
+
+@pytest.mark.parametrize("size", [0, 1000, 2 * PART_SIZE + 1000])
+def test_upload_round_trip(driver: S3StorageDriver, size: int) -> None:
+    data = os.urandom(size)
+    run(driver.upload("ab/file", data))
+
+    assert run(driver.download("ab/file")) == data
+    assert run(collect(driver.stream("ab/file"))) == data
+
+
+@pytest.mark.parametrize("size", [1000, 2 * PART_SIZE + 1000])
+def test_upload_stream_and_commit(driver: S3StorageDriver, s3, size: int) -> None:
+    data = os.urandom(size)
+
+    async def upload() -> None:
+        temp_path = await driver.upload_stream(chunked(data))
+        await driver.commit(temp_path, "ab/file")
+
+    run(upload())
+
+    assert run(driver.download("ab/file")) == data
+    assert keys(s3, driver.TEMP_PREFIX) == []
+
+
+def test_commit_keeps_existing_file(driver: S3StorageDriver, s3) -> None:
+    run(driver.upload("ab/file", b"existing"))
+
+    async def upload() -> None:
+        temp_path = await driver.upload_stream(chunked(b"duplicate"))
+        await driver.commit(temp_path, "ab/file")
+
+    run(upload())
+
+    assert run(driver.download("ab/file")) == b"existing"
+    assert keys(s3, driver.TEMP_PREFIX) == []
+
+
+@pytest.mark.parametrize(
+    ("start", "end"), [(0, 0), (10, 99), (1000, None), (0, 10**6), (4999, 4999)]
+)
+def test_stream_range(driver: S3StorageDriver, start: int, end: int | None) -> None:
+    data = os.urandom(5000)
+    run(driver.upload("ab/file", data))
+
+    expected = data[start:] if end is None else data[start : end + 1]
+    assert run(collect(driver.stream("ab/file", start, end))) == expected
+
+
+def test_missing_file(driver: S3StorageDriver) -> None:
+    with pytest.raises(FileNotFoundError):
+        run(driver.download("ab/missing"))
+    with pytest.raises(FileNotFoundError):
+        run(collect(driver.stream("ab/missing")))
+
+
+def test_delete_many(driver: S3StorageDriver, s3) -> None:
+    # More keys than a single DeleteObjects request takes
+    paths = [f"batch/{i:04}" for i in range(1500)]
+
+    async def upload() -> None:
+        semaphore = asyncio.Semaphore(32)
+
+        async def put(path: str) -> None:
+            async with semaphore:
+                await driver.upload(path, path.encode())
+
+        await asyncio.gather(*(put(path) for path in paths))
+
+    run(upload())
+    run(driver.upload("kept", b"kept"))
+
+    run(driver.delete_many(paths))
+
+    assert keys(s3) == ["kept"]